@@ -4,13 +4,29 @@ from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 import json
 import asyncio
+import time
 
 from ..core.database import get_db
+from ..core.config import settings
 from ..schemas.chat_schemas import ChatSessionResponse, ChatMessageResponse, CreateSessionRequest, SendMessageRequest
 from ..models.user import User
 from ..models.chat import ChatSession, ChatMessage
-from ..services.chat_service import ChatService
-from ..services.ollama_service import OllamaService
+from ..services.chat_service import ChatService, OFF_TOPIC_REPLY, chat_stage_metrics, speculation_stats
+from ..services.ollama_service import OllamaErrorMessage
+from ..services.ollama_health import ollama_health_monitor
+from ..services.ollama_router import ollama_router, OllamaUnavailableError
+from ..services.llm_scheduler import llm_scheduler
+from ..services.llm_singleflight import llm_singleflight
+from ..services.relevance_gate import relevance_gate
+from ..services.token_budget import token_budget
+from ..services.retrieval_policy import get_retrieval_stats
+from ..services.context_assembly import context_assembly_stats
+from ..services.chroma_client import chroma_manager
+from ..services.chroma_async import chroma_async
+from ..services.embeddings import embedding_engine
+from ..services.hybrid_retrieval import get_hybrid_stats
+from ..services.diversity import diversity_stats
+from ..services.answer_cache import answer_cache
 from .auth import get_current_active_user
 
 router = APIRouter()
@@ -162,6 +178,11 @@ async def send_message(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=str(e)
         )
+    except OllamaUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error in send_message API handler: {str(e)}")
         logger.error(f"Error traceback: {traceback.format_exc()}")
@@ -190,6 +211,8 @@ async def send_message_stream(
     async def generate_stream():
         try:
             logger.info(f"Streaming message request: session_id={session_id}, user_id={current_user.id}")
+            started = time.perf_counter()
+            timings: Dict[str, float] = {}
 
             chat_service = ChatService(db)
 
@@ -203,6 +226,8 @@ async def send_message_stream(
                 yield f"data: {json.dumps({'error': 'Session non trouvée'})}\n\n"
                 return
 
+            existing_count = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).count()
+
             # Sauvegarder le message utilisateur
             user_message = ChatMessage(
                 session_id=session_id,
@@ -216,53 +241,107 @@ async def send_message_stream(
             # Envoyer le message utilisateur
             yield f"data: {json.dumps({'type': 'user_message', 'content': request.content, 'id': user_message.id})}\n\n"
 
-            # Récupérer le contexte RAG
-            retrieved_context_texts = []
             section = None
-            if chat_service.chroma_client and session.section_id:
+            if session.section_id:
                 section = db.query(Section).filter(Section.id == session.section_id).first()
-                if section and section.chroma_collection_name:
-                    try:
-                        collection = chat_service.chroma_client.get_collection(name=section.chroma_collection_name)
-                        results = collection.query(query_texts=[request.content], n_results=3)
-                        if results and results.get('documents') and results['documents'][0]:
-                            retrieved_context_texts = results['documents'][0]
-                    except Exception as e:
-                        logger.error(f"Error querying ChromaDB: {e}")
-
-            # Vérifier la pertinence
-            if section:
-                relevance_context = f"Nom de la section: {section.name}. Description: {section.description or ''}"
-                is_relevant = await chat_service.ollama_service.check_relevance(request.content, relevance_context)
-                
-                if not is_relevant:
-                    # Réponse non pertinente
-                    response_content = "Désolé, cette question ne semble pas liée au sujet de cette section."
-                    
-                    # Sauvegarder la réponse
+
+            # Question déjà posée dans la section: la réponse en cache est envoyée immédiatement
+            if existing_count == 0 and section is not None:
+                cache_version = answer_cache.version(section.id)
+                cached_answer = await chat_service.lookup_cached_answer(section, request.content, timings)
+                if cached_answer is not None:
+                    yield f"data: {json.dumps({'type': 'assistant_start'})}\n\n"
+                    yield f"data: {json.dumps({'type': 'assistant_chunk', 'content': cached_answer})}\n\n"
                     assistant_message = ChatMessage(
                         session_id=session_id,
-                        content=response_content,
+                        content=cached_answer,
                         is_assistant=True,
                         created_at=datetime.utcnow()
                     )
                     db.add(assistant_message)
                     session.last_message_at = datetime.utcnow()
                     db.commit()
-                    
-                    yield f"data: {json.dumps({'type': 'assistant_message', 'content': response_content, 'id': assistant_message.id, 'done': True})}\n\n"
+                    timings["first_token"] = round((time.perf_counter() - started) * 1000, 1)
+                    yield f"data: {json.dumps({'type': 'assistant_message', 'content': cached_answer, 'id': assistant_message.id, 'done': True, 'cached': True, 'timings': timings})}\n\n"
+                    chat_service.schedule_title_generation(
+                        session_id, request.content, current_user.id, session.section_id
+                    )
                     return
 
+            # Récupérer le contexte RAG et vérifier la pertinence en parallèle
+            retrieval, relevance = await chat_service.retrieve_with_relevance(
+                section,
+                request.content,
+                current_user.id,
+                check_relevance=section is not None,
+                timings=timings
+            )
+            retrieved_context_texts = retrieval["texts"]
+
+            def answer_stream():
+                return chat_service.stream_answer(
+                    session_id=session_id,
+                    user_message_id=user_message.id,
+                    content=request.content,
+                    context=retrieved_context_texts if retrieved_context_texts else None,
+                    user_id=current_user.id,
+                    section_id=session.section_id
+                )
+
+            # Génération spéculative: la réponse démarre pendant le contrôle de pertinence
+            speculative = None
+            if settings.CHAT_SPECULATIVE_GENERATION and not relevance.done():
+                speculative = chat_service.start_speculative_answer(answer_stream())
+            try:
+                is_relevant = await relevance
+            except BaseException:
+                if speculative is not None:
+                    await speculative.cancel()
+                raise
+
+            if not is_relevant:
+                if speculative is not None:
+                    await speculative.cancel()
+
+                # Réponse non pertinente
+                response_content = OFF_TOPIC_REPLY
+
+                # Sauvegarder la réponse
+                assistant_message = ChatMessage(
+                    session_id=session_id,
+                    content=response_content,
+                    is_assistant=True,
+                    created_at=datetime.utcnow()
+                )
+                db.add(assistant_message)
+                session.last_message_at = datetime.utcnow()
+                db.commit()
+
+                yield f"data: {json.dumps({'type': 'assistant_message', 'content': response_content, 'id': assistant_message.id, 'done': True, 'timings': timings})}\n\n"
+                return
+
             # Générer la réponse en streaming
             yield f"data: {json.dumps({'type': 'assistant_start'})}\n\n"
-            
+
             response_content = ""
-            async for chunk in chat_service.ollama_service.generate_streaming_response(
-                prompt=request.content,
-                context=retrieved_context_texts if retrieved_context_texts else None
-            ):
-                response_content += chunk
-                yield f"data: {json.dumps({'type': 'assistant_chunk', 'content': chunk})}\n\n"
+            generation_failed = False
+            chunks = speculative.keep() if speculative is not None else answer_stream()
+            async with chat_stage_metrics.measure("answer", timings):
+                async for chunk in chunks:
+                    if not response_content:
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                        chat_stage_metrics.record("first_token", first_token_ms)
+                        timings["first_token"] = round(first_token_ms, 1)
+                    generation_failed = generation_failed or isinstance(chunk, OllamaErrorMessage)
+                    response_content += chunk
+                    yield f"data: {json.dumps({'type': 'assistant_chunk', 'content': chunk})}\n\n"
+
+            # Réponse réutilisable: premier message, appuyée sur le contenu de la section, flux sans erreur
+            if not generation_failed and existing_count == 0 and section is not None and retrieved_context_texts:
+                answer_cache.store(
+                    section.id, request.content, response_content, retrieval["query_embedding"],
+                    timings["answer"], cache_version
+                )
 
             # Sauvegarder la réponse complète
             assistant_message = ChatMessage(
@@ -275,19 +354,16 @@ async def send_message_stream(
             
             # Mettre à jour la session
             session.last_message_at = datetime.utcnow()
-            
-            # Générer un titre si c'est le premier message
-            existing_count = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).count()
-            if existing_count <= 2:  # user_message + assistant_message
-                try:
-                    new_title = await chat_service.ollama_service.generate_title(request.content)
-                    session.title = new_title
-                except Exception:
-                    pass
-            
             db.commit()
-            
-            yield f"data: {json.dumps({'type': 'assistant_message', 'content': response_content, 'id': assistant_message.id, 'done': True})}\n\n"
+
+            yield f"data: {json.dumps({'type': 'assistant_message', 'content': response_content, 'id': assistant_message.id, 'done': True, 'timings': timings})}\n\n"
+
+            # Générer un titre si c'est le premier message, sans retarder la réponse
+            if existing_count == 0:
+                chat_service.schedule_title_generation(
+                    session_id, request.content, current_user.id, session.section_id
+                )
+            logger.info(f"Chat pipeline timings for session {session_id}: {timings}")
 
         except Exception as e:
             logger.error(f"Error in streaming: {e}")
@@ -338,16 +414,45 @@ async def delete_chat_session(
 
 @router.get("/ollama-health")
 async def check_ollama_health():
-    """Vérifier si Ollama est disponible"""
+    """Vérifier si Ollama est disponible (état mis en cache par le moniteur)"""
     try:
-        ollama_service = OllamaService()
-        is_healthy = await ollama_service.health_check()
+        if ollama_health_monitor.state.checked_at is None:
+            await ollama_health_monitor.refresh()
+        state = ollama_health_monitor.state
         return {
-            "status": "healthy" if is_healthy else "unhealthy",
-            "model": ollama_service.model
+            "status": "healthy" if state.healthy else "unhealthy",
+            "model": ollama_health_monitor.model,
+            "details": state.to_dict(),
+            "backends": {backend: backend_state.to_dict() for backend, backend_state in ollama_health_monitor.states.items()},
+            "breakers": ollama_router.get_breakers(),
+            "accepting_requests": ollama_router.accepting(),
+            "routing": ollama_router.get_stats(),
+            "scheduler": llm_scheduler.get_stats(),
+            "singleflight": llm_singleflight.get_stats()
         }
     except Exception as e:
         return {
             "status": "error",
             "message": str(e)
         }
+
+
+@router.get("/metrics")
+async def get_chat_metrics(current_user: User = Depends(get_current_active_user)):
+    """Métriques du pipeline de chat (latences par étape, ordonnanceur LLM, coalescence, filtre de pertinence, top-k, assemblage du contexte, Chroma, tokens, embeddings, recherche hybride, diversité des exercices, cache de réponses)"""
+    return {
+        "stages": chat_stage_metrics.to_dict(),
+        "speculation": speculation_stats,
+        "scheduler": llm_scheduler.get_stats(),
+        "routing": ollama_router.get_stats(),
+        "singleflight": llm_singleflight.get_stats(),
+        "relevance_gate": relevance_gate.get_stats(),
+        "retrieval": get_retrieval_stats(),
+        "context_assembly": context_assembly_stats,
+        "chroma": {**chroma_manager.get_stats(), "executor": chroma_async.get_stats()},
+        "tokens": token_budget.get_stats(),
+        "embeddings": embedding_engine.get_stats(),
+        "hybrid": get_hybrid_stats(),
+        "diversity": diversity_stats,
+        "answer_cache": answer_cache.get_stats()
+    }
@@ -128,7 +128,7 @@ async def delete_document(
     document_service = DocumentService(db)
     
     try:
-        success = document_service.delete_document(
+        success = await document_service.delete_document(
             document_id=document_id,
             user_id=current_user.id
         )
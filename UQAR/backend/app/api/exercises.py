@@ -1,5 +1,7 @@
+import json
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from datetime import datetime
@@ -14,7 +16,10 @@ from ..schemas.exercise_schemas import (
     ExerciseSubmission as ExerciseSubmissionSchema, ExerciseResult,
     QuestionType, DifficultyLevel, AnswerFeedback, QuestionUpdate
 )
-from ..services.exercise_service import ExerciseGenerationService, ExerciseFeedbackService
+from ..services.ollama_router import OllamaUnavailableError
+from ..services.exercise_service import (
+    ExerciseGenerationService, ExerciseFeedbackService, get_structured_output_stats
+)
 from .auth import get_current_active_user
 
 router = APIRouter()
@@ -22,14 +27,8 @@ router = APIRouter()
 
 # Teacher endpoints
 
-@router.post("/sections/{section_id}/exercises/generate", response_model=ExerciseResponse)
-async def generate_exercises(
-    section_id: int,
-    request: ExerciseGenerateRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Générer des exercices automatiquement pour une section (Enseignant seulement)"""
+def _get_section_for_generation(section_id: int, current_user: User, db: Session) -> Section:
+    """Vérifier qu'un enseignant peut générer des exercices pour cette section"""
     
     # Check permissions
     if current_user.role != UserRole.TEACHER:
@@ -59,6 +58,20 @@ async def generate_exercises(
             detail="Cette section n'a pas de documents. Veuillez d'abord télécharger du contenu."
         )
     
+    return section
+
+
+@router.post("/sections/{section_id}/exercises/generate", response_model=ExerciseResponse)
+async def generate_exercises(
+    section_id: int,
+    request: ExerciseGenerateRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Générer des exercices automatiquement pour une section (Enseignant seulement)"""
+    
+    _get_section_for_generation(section_id, current_user, db)
+    
     # Generate exercises
     try:
         service = ExerciseGenerationService()
@@ -110,6 +123,11 @@ async def generate_exercises(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    except OllamaUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -117,6 +135,55 @@ async def generate_exercises(
         )
 
 
+@router.post("/sections/{section_id}/exercises/generate/stream")
+async def generate_exercises_stream(
+    section_id: int,
+    request: ExerciseGenerateRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Générer des exercices en streaming SSE: chaque question est envoyée dès qu'elle est générée et enregistrée"""
+    
+    _get_section_for_generation(section_id, current_user, db)
+    logger = logging.getLogger(__name__)
+    service = ExerciseGenerationService()
+    
+    async def event_stream():
+        try:
+            async for event in service.generate_exercises_stream(
+                db=db,
+                section_id=section_id,
+                num_questions=request.num_questions or 5,
+                difficulty=request.difficulty or DifficultyLevel.MEDIUM,
+                exercise_type=request.exercise_type or QuestionType.MCQ,
+                use_specific_documents=request.use_specific_documents,
+                custom_prompt=request.custom_prompt,
+                temp_content=request.temp_content
+            ):
+                if event["type"] == "done":
+                    exercise = db.query(Exercise).options(
+                        joinedload(Exercise.questions)
+                    ).filter(Exercise.id == event["exercise_id"]).first()
+                    event["exercise"] = ExerciseResponse.from_orm(exercise).model_dump(mode="json")
+                yield f"data: {json.dumps(event)}\n\n"
+        except OllamaUnavailableError as e:
+            # Réponse déjà commencée (200): l'indisponibilité passe par l'événement d'erreur
+            logger.warning(f"Streamed exercise generation rejected: {e}")
+            yield f"data: {json.dumps({'type': 'error', 'status': status.HTTP_503_SERVICE_UNAVAILABLE, 'error': str(e)})}\n\n"
+        except Exception as e:
+            logger.error(f"Error in streamed exercise generation: {e}", exc_info=True)
+            yield f"data: {json.dumps({'type': 'error', 'error': f'Erreur lors de la génération des exercices: {str(e)}'})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
 @router.get("/sections/{section_id}/exercises", response_model=List[ExerciseResponse])
 async def get_section_exercises(
     section_id: int,
@@ -155,6 +222,21 @@ async def get_section_exercises(
     return [ExerciseResponse.from_orm(ex) for ex in exercises]
 
 
+@router.get("/exercises/generation-metrics")
+async def get_generation_metrics(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Taux d'échec de parsing et de relance de la génération d'exercices (Enseignant seulement)"""
+    
+    if current_user.role != UserRole.TEACHER:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Accès réservé aux enseignants"
+        )
+    
+    return get_structured_output_stats()
+
+
 @router.get("/exercises/{exercise_id}", response_model=ExerciseResponse)
 async def get_exercise(
     exercise_id: int,
@@ -547,7 +629,9 @@ async def submit_exercise(
         feedback_text = await feedback_service.generate_feedback(
             question=question,
             student_answer=student_answer,
-            is_correct=is_correct
+            is_correct=is_correct,
+            user_id=current_user.id,
+            section_id=exercise.section_id
         )
         
         question_points = question.points if is_correct else 0
@@ -7,7 +7,9 @@ from datetime import datetime
 from ..core.database import get_db
 from ..models.user import User, UserRole
 from ..models import Section, ExerciseSubmission, Exercise, ChatSession, ChatMessage, StudentFeedback
-from ..services.ollama_service import OllamaService
+from ..services.ollama_service import OllamaService, PROMPT_TEMPLATE_TOKENS
+from ..services.ollama_router import OllamaUnavailableError
+from ..services.token_budget import token_budget
 from .auth import get_current_active_user
 
 router = APIRouter()
@@ -86,14 +88,14 @@ async def analyze_student(section_id: int, student_id: int, current_user: User =
         for sub in submissions:
             # Calculer le total des points des questions associées à cet exercice
             total_points = sum(question.points for question in sub.exercise.questions) if sub.exercise.questions else 0
-            content.append(f"Exercice {sub.exercise_id} score {sub.score}/{total_points}\n")
+            lines = [f"Exercice {sub.exercise_id} score {sub.score}/{total_points}\n"]
             for qid, ans in sub.answers.items():
-                content.append(f"Q{qid}: {ans}\n")
+                lines.append(f"Q{qid}: {ans}\n")
+            content.append("\n".join(lines))
         for msg in chats:
             role = "ETUDIANT" if not msg.is_assistant else "BOT"
             content.append(f"[{role}] {msg.content}\n")
 
-        prompt = "\n".join(content)
         system_prompt = """Vous êtes un tuteur bienveillant et expert pédagogique. Analysez les réponses et interactions de l'étudiant pour identifier ses forces et ses lacunes principales.
 
 Utilisez le format Markdown pour structurer votre analyse :
@@ -110,8 +112,27 @@ Structurez votre analyse avec :
 4. Des recommandations concrètes pour l'amélioration
 
 Soyez constructif et encourageant dans vos commentaires."""
+
+        # Dans le budget de tokens: toutes les soumissions d'abord, puis les messages les plus récents
+        priority = list(range(len(submissions))) + list(range(len(content) - 1, len(submissions) - 1, -1))
+        packed = token_budget.pack(
+            content,
+            token_budget.available("analysis", system_prompt) - PROMPT_TEMPLATE_TOKENS,
+            priority=priority,
+            item_overhead=1,
+            model=token_budget.model_for("analysis")
+        )
+        token_budget.record_packing("analysis", packed)
+        prompt = "\n".join(packed.texts)
+
         ollama = OllamaService()
-        analysis = await ollama.generate_response(prompt=prompt, system_prompt=system_prompt)
+        analysis = await ollama.generate_response(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            task="analysis",
+            user_id=current_user.id,
+            section_id=section_id
+        )
 
         # Save or update feedback in database
         existing_feedback = db.query(StudentFeedback).filter(
@@ -136,6 +157,11 @@ Soyez constructif et encourageant dans vos commentaires."""
         db.commit()
 
         return {"analysis": analysis.strip()}
+    except OllamaUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error in analyze_student: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
@@ -8,6 +8,12 @@ from ..core.database import get_db
 from ..models.user import User, UserRole
 from ..models.section import Section
 from ..services.document_service import DocumentService
+from ..services.chroma_async import chroma_async
+from ..services.chroma_client import chroma_manager
+from ..services.numpy_store import numpy_store
+from ..services.relevance_gate import relevance_gate
+from ..services.lexical_index import lexical_index
+from ..services.answer_cache import answer_cache
 from .auth import get_current_active_user, require_role
 
 router = APIRouter()
@@ -205,18 +211,24 @@ async def delete_section(
             # so pass section.teacher_id to satisfy DocumentService's ownership check.
             # The actual authorization for SUPER_ADMIN is already done above.
             user_id_for_doc_deletion = section.teacher_id if is_super_admin else current_user.id
-            document_service.delete_document(document_id=doc.id, user_id=user_id_for_doc_deletion)
+            await document_service.delete_document(document_id=doc.id, user_id=user_id_for_doc_deletion)
         logger.info(f"Successfully deleted documents for section {section_id}")
     except Exception as e:
         logger.error(f"Error deleting documents for section {section_id}: {str(e)}", exc_info=True)
         # Not raising HTTPException here to allow section deletion attempt anyway,
         # but a more robust error handling might be needed depending on requirements.
 
+    answer_cache.invalidate(section.id)
+
     # Delete ChromaDB collection
-    if section.chroma_collection_name and document_service.chroma_client:
+    if section.chroma_collection_name:
+        relevance_gate.invalidate(section.chroma_collection_name)
+        lexical_index.delete_collection(section.chroma_collection_name)
+        if chroma_manager.mirror_enabled:
+            numpy_store.delete_collection(section.chroma_collection_name)
         try:
             logger.info(f"Attempting to delete ChromaDB collection: {section.chroma_collection_name} for section {section_id}")
-            document_service.chroma_client.delete_collection(name=section.chroma_collection_name)
+            await chroma_async.delete_collection(section.chroma_collection_name)
             logger.info(f"Successfully deleted ChromaDB collection: {section.chroma_collection_name}")
         except Exception as e:
             logger.error(
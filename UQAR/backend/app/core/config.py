@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 import os
 import logging
 
@@ -16,6 +16,21 @@ class Settings(BaseSettings):
     CHROMA_HOST: str = os.environ.get("CHROMA_HOST", "localhost")
     CHROMA_PORT: int = int(os.environ.get("CHROMA_PORT", 8001))
     CHROMA_PERSIST_DIRECTORY: str = "./chroma_data"
+    # Client partagé: repli sur le stockage local si le serveur est injoignable au démarrage
+    CHROMA_PERSISTENT_FALLBACK: bool = True
+    # Après un échec de connexion, échec immédiat pendant ce délai (s) avant de retenter
+    CHROMA_RETRY_INTERVAL: float = 30.0
+    # Appels Chroma (synchrones) sur un pool de threads dédié: opérations simultanées et délais (s)
+    CHROMA_MAX_CONCURRENCY: int = 8
+    CHROMA_QUERY_TIMEOUT: float = 10.0
+    CHROMA_WRITE_TIMEOUT: float = 120.0
+    # Magasin de vecteurs NumPy dans le processus (.npy en mmap + métadonnées JSON): backend principal
+    # ("numpy", sans serveur Chroma) ou copie des écritures servant les requêtes quand Chroma est injoignable
+    VECTOR_STORE_BACKEND: str = os.environ.get("VECTOR_STORE_BACKEND", "chroma")
+    NUMPY_STORE_DIRECTORY: str = os.environ.get("NUMPY_STORE_DIRECTORY", "./vector_store")
+    NUMPY_STORE_FALLBACK: bool = True
+    # Embeddings quantifiés en int8 (échelle par ligne): mémoire divisée par 4, similarités approchées
+    NUMPY_STORE_QUANTIZE: bool = False
     
     # Ollama (remplace vLLM pour Apple Silicon)
     OLLAMA_HOST: str = os.environ.get("OLLAMA_HOST", "127.0.0.1")
@@ -24,7 +39,64 @@ class Settings(BaseSettings):
     OLLAMA_MAX_TOKENS: int = 2048
     OLLAMA_TEMPERATURE: float = 0.7
     OLLAMA_TIMEOUT: float = float(os.environ.get("OLLAMA_TIMEOUT", 300))
-    
+    OLLAMA_CONNECT_TIMEOUT: float = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", 5))
+    OLLAMA_HEALTH_TIMEOUT: float = 10.0
+    OLLAMA_RELEVANCE_TIMEOUT: float = 30.0
+    # Plusieurs nœuds Ollama: "http://gpu1:11434,http://gpu2:11434" (sinon OLLAMA_HOST:OLLAMA_PORT)
+    OLLAMA_BACKENDS: str = os.environ.get("OLLAMA_BACKENDS", "")
+    # Affinité de session: une conversation reste sur le nœud qui détient son cache KV
+    OLLAMA_AFFINITY_TTL: float = 3600.0
+    OLLAMA_AFFINITY_MAX_SESSIONS: int = 10000
+
+    # Disjoncteur par nœud: échec rapide quand Ollama est saturé ou en panne
+    OLLAMA_BREAKER_FAILURE_THRESHOLD: int = 5
+    OLLAMA_BREAKER_RESET_TIMEOUT: float = 30.0
+    # SLO de latence (s): appels auxiliaires complets, et premier octet des réponses en streaming
+    OLLAMA_BREAKER_AUX_SLO: float = 15.0
+    OLLAMA_BREAKER_FIRST_TOKEN_SLO: float = 60.0
+    # Requêtes couvertes (hedging) vers un second nœud pour les appels courts (titre, pertinence)
+    OLLAMA_HEDGE_ENABLED: bool = os.environ.get("OLLAMA_HEDGE_ENABLED", "false").lower() == "true"
+    OLLAMA_HEDGE_TASKS: List[str] = ["title", "relevance"]
+    OLLAMA_HEDGE_DEFAULT_DELAY: float = 2.0  # avant d'avoir assez de mesures pour le p95
+    OLLAMA_HEDGE_MIN_DELAY: float = 0.3
+
+    # Chat multi-tour via /api/chat (réutilisation du cache KV entre les tours)
+    OLLAMA_CHAT_MODE: bool = os.environ.get("OLLAMA_CHAT_MODE", "true").lower() == "true"
+    OLLAMA_KEEP_ALIVE: str = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+    CHAT_HISTORY_MAX_MESSAGES: int = 10
+    # Démarrer la réponse en streaming pendant le contrôle de pertinence (annulée si hors sujet)
+    CHAT_SPECULATIVE_GENERATION: bool = os.environ.get("CHAT_SPECULATIVE_GENERATION", "true").lower() == "true"
+
+    # Routage par tâche: petit modèle pour les appels auxiliaires (pertinence, titre, extraction)
+    OLLAMA_AUX_MODEL: str = os.environ.get("OLLAMA_AUX_MODEL", "llama3.1:8b")
+    # Surcharges par tâche, ex: {"title": {"model": "qwen2.5:3b", "num_predict": 16}}
+    OLLAMA_TASK_OVERRIDES: Dict[str, Dict[str, Any]] = {}
+
+    # Sorties structurées (option `format` d'Ollama >= 0.5) pour les exercices et l'extraction de paramètres
+    OLLAMA_STRUCTURED_OUTPUT: bool = os.environ.get("OLLAMA_STRUCTURED_OUTPUT", "true").lower() == "true"
+    # Nouvelles tentatives si la réponse reste inexploitable (avant les questions de secours)
+    EXERCISE_GENERATION_RETRIES: int = 1
+
+    # Budget de tokens du prompt par tâche: num_ctx - num_predict, moins une marge d'erreur d'estimation
+    TOKEN_BUDGET_MARGIN: float = 0.1
+    # Surcharges du budget (tokens) par tâche, ex: {"analysis": 8000}
+    TOKEN_BUDGET_OVERRIDES: Dict[str, int] = {}
+    # Ratio initial caractères/token (texte français), recalibré sur le prompt_eval_count d'Ollama
+    TOKEN_ESTIMATOR_CHARS_PER_TOKEN: float = 3.5
+
+    # Surveillance de l'état d'Ollama en arrière-plan
+    OLLAMA_HEALTH_INTERVAL: float = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", 30))
+    OLLAMA_HEALTH_UNHEALTHY_INTERVAL: float = 5.0
+    OLLAMA_HEALTH_MAX_AGE: float = 120.0
+
+    # Pool de connexions HTTP vers Ollama (partagé par tout le processus)
+    OLLAMA_POOL_MAX_CONNECTIONS: int = int(os.environ.get("OLLAMA_POOL_MAX_CONNECTIONS", 20))
+    OLLAMA_POOL_MAX_KEEPALIVE: int = int(os.environ.get("OLLAMA_POOL_MAX_KEEPALIVE", 10))
+    OLLAMA_POOL_KEEPALIVE_EXPIRY: float = 60.0
+
+    # Ordonnanceur des requêtes LLM (générations simultanées envoyées à chaque nœud Ollama)
+    OLLAMA_MAX_CONCURRENCY: int = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", 4))
+
     # JWT et sécurité
     JWT_SECRET_KEY: str = os.environ.get("JWT_SECRET_KEY", "af477b8d25c0527311f097b7098bf98c60b34a6030294231574358ee4ecf4822")
     JWT_ALGORITHM: str = "HS256"
@@ -34,6 +106,64 @@ class Settings(BaseSettings):
     # Embeddings (modèle plus léger pour M1)
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     EMBEDDING_DIMENSION: int = 384
+    # Moteur d'embeddings dans le processus: "auto" (sentence-transformers si installé, sinon la
+    # fonction par défaut de Chroma, même modèle en ONNX), "sentence_transformers", "chroma_default"
+    # ou "hash" (déterministe, sans modèle: tests et développement)
+    EMBEDDING_BACKEND: str = os.environ.get("EMBEDDING_BACKEND", "auto")
+    EMBEDDING_BATCH_SIZE: int = 64
+    # Cache disque des vecteurs des extraits de documents (empreinte du texte + modèle); vide pour le
+    # désactiver. Les questions n'y sont jamais écrites (cache en mémoire ci-dessous)
+    EMBEDDING_CACHE_PATH: str = os.environ.get("EMBEDDING_CACHE_PATH", "./embedding_cache/embeddings.sqlite3")
+    # Embeddings des questions en mémoire (LRU + durée de vie en s), par texte normalisé et modèle
+    QUERY_EMBEDDING_CACHE_SIZE: int = 2048
+    QUERY_EMBEDDING_CACHE_TTL: float = 3600.0
+
+    # Recherche hybride: BM25 (index SQLite FTS5 des chunks) fusionné aux résultats vectoriels (RRF)
+    HYBRID_RETRIEVAL_ENABLED: bool = True
+    LEXICAL_INDEX_PATH: str = os.environ.get("LEXICAL_INDEX_PATH", "./search_index/chunks.sqlite3")
+    HYBRID_RRF_K: int = 60
+    # Extraits lexicaux gardés: score BM25 d'au moins cette part du meilleur
+    HYBRID_LEXICAL_MIN_SCORE_RATIO: float = 0.5
+
+    # Reranking optionnel (cross-encoder sur CPU, sentence-transformers): candidats sur-échantillonnés,
+    # extraits gardés, budget de latence (s) au-delà duquel l'ordre de la fusion est conservé
+    RERANK_ENABLED: bool = os.environ.get("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    RERANK_CANDIDATES: int = 30
+    RERANK_TOP_K: int = 3
+    RERANK_TIMEOUT: float = 0.8
+    RERANK_WORKERS: int = 2
+    RERANK_CACHE_SIZE: int = 20000
+
+    # Exercices: sélection MMR (pertinence vs redondance) parmi POOL_FACTOR × le nombre d'extraits voulus,
+    # au plus DOCUMENT_SHARE des extraits d'un même document
+    EXERCISE_MMR_ENABLED: bool = True
+    EXERCISE_MMR_LAMBDA: float = 0.5
+    EXERCISE_MMR_POOL_FACTOR: int = 3
+    EXERCISE_MMR_DOCUMENT_SHARE: float = 0.5
+
+    # Cache des réponses par section (premier message d'une conversation): question normalisée
+    # identique, sinon similarité cosinus des questions au-delà du seuil; vidé quand les documents changent
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SEMANTIC_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL: float = 86400.0
+    ANSWER_CACHE_MAX_ENTRIES: int = 500
+
+    # Filtre de pertinence par embeddings (distances cosinus Chroma), LLM seulement pour les cas limites
+    RELEVANCE_GATE_ENABLED: bool = True
+    RELEVANCE_ACCEPT_DISTANCE: float = 0.35
+    RELEVANCE_REJECT_DISTANCE: float = 0.75
+    RELEVANCE_DESCRIPTION_ACCEPT: float = 0.5
+    RELEVANCE_PROFILE_TTL: float = 3600.0
+    RELEVANCE_PROFILE_MAX_CHUNKS: int = 2000
+
+    # Top-k adaptatif par point d'appel (voir get_retrieval_policies), ex: {"chat": {"max_k": 4}}
+    RETRIEVAL_POLICY_OVERRIDES: Dict[str, Dict[str, Any]] = {}
+    # Assemblage du contexte: fusion des extraits consécutifs (chevauchement du découpage) et dédoublonnage
+    CONTEXT_ASSEMBLY_ENABLED: bool = True
+    CONTEXT_MAX_OVERLAP: int = 400
+    # Part des n-grammes d'un passage retrouvés dans un autre au-delà de laquelle il est un doublon
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.85
     
     # Upload de fichiers
     UPLOAD_DIR: str = "./uploads"
@@ -62,6 +192,11 @@ class Settings(BaseSettings):
         """Retourne la liste des extensions autorisées"""
         return [ext.strip() for ext in self.ALLOWED_EXTENSIONS.split(",")]
     
+    def get_ollama_backends(self) -> List[str]:
+        """Retourne les URL des nœuds Ollama (au moins OLLAMA_HOST:OLLAMA_PORT)"""
+        backends = [backend.strip().rstrip("/") for backend in self.OLLAMA_BACKENDS.split(",") if backend.strip()]
+        return backends or [f"http://{self.OLLAMA_HOST}:{self.OLLAMA_PORT}"]
+
     def get_allowed_origins(self) -> List[str]:
         """Retourne la liste des origines autorisées"""
         origins = [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
@@ -89,10 +224,80 @@ def get_chroma_config() -> dict:
 
 # Configuration Ollama
 def get_ollama_config() -> dict:
+    backends = settings.get_ollama_backends()
     return {
-        "base_url": f"http://{settings.OLLAMA_HOST}:{settings.OLLAMA_PORT}",
+        "base_url": backends[0],
+        "backends": backends,
         "model": settings.OLLAMA_MODEL,
         "max_tokens": settings.OLLAMA_MAX_TOKENS,
         "temperature": settings.OLLAMA_TEMPERATURE,
         "timeout": settings.OLLAMA_TIMEOUT,
-    }
\ No newline at end of file
+        "connect_timeout": settings.OLLAMA_CONNECT_TIMEOUT,
+        "health_timeout": settings.OLLAMA_HEALTH_TIMEOUT,
+        "relevance_timeout": settings.OLLAMA_RELEVANCE_TIMEOUT,
+        "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+        "health_interval": settings.OLLAMA_HEALTH_INTERVAL,
+        "health_unhealthy_interval": settings.OLLAMA_HEALTH_UNHEALTHY_INTERVAL,
+        "health_max_age": settings.OLLAMA_HEALTH_MAX_AGE,
+        "pool_max_connections": settings.OLLAMA_POOL_MAX_CONNECTIONS,
+        "pool_max_keepalive": settings.OLLAMA_POOL_MAX_KEEPALIVE,
+        "pool_keepalive_expiry": settings.OLLAMA_POOL_KEEPALIVE_EXPIRY,
+        "affinity_ttl": settings.OLLAMA_AFFINITY_TTL,
+        "affinity_max_sessions": settings.OLLAMA_AFFINITY_MAX_SESSIONS,
+        "breaker_failure_threshold": settings.OLLAMA_BREAKER_FAILURE_THRESHOLD,
+        "breaker_reset_timeout": settings.OLLAMA_BREAKER_RESET_TIMEOUT,
+        "breaker_aux_slo": settings.OLLAMA_BREAKER_AUX_SLO,
+        "breaker_first_token_slo": settings.OLLAMA_BREAKER_FIRST_TOKEN_SLO,
+        "hedge_enabled": settings.OLLAMA_HEDGE_ENABLED,
+        "hedge_tasks": settings.OLLAMA_HEDGE_TASKS,
+        "hedge_default_delay": settings.OLLAMA_HEDGE_DEFAULT_DELAY,
+        "hedge_min_delay": settings.OLLAMA_HEDGE_MIN_DELAY,
+    }
+
+
+# Profils de génération par tâche (modèle, num_predict, num_ctx, température)
+OLLAMA_TASKS = ("relevance", "title", "param_extraction", "answer", "exercise", "feedback", "analysis")
+
+
+def get_ollama_task_profiles() -> Dict[str, Dict[str, Any]]:
+    main_model = settings.OLLAMA_MODEL
+    aux_model = settings.OLLAMA_AUX_MODEL or main_model
+    profiles = {
+        "relevance": {"model": aux_model, "num_predict": 5, "num_ctx": 2048, "temperature": 0.1},
+        "title": {"model": aux_model, "num_predict": 24, "num_ctx": 2048, "temperature": 0.3},
+        "param_extraction": {"model": aux_model, "num_predict": 128, "num_ctx": 4096, "temperature": 0.1},
+        "answer": {
+            "model": main_model,
+            "num_predict": settings.OLLAMA_MAX_TOKENS,
+            "num_ctx": 8192,
+            "temperature": settings.OLLAMA_TEMPERATURE,
+        },
+        "exercise": {"model": main_model, "num_predict": 4096, "num_ctx": 16384, "temperature": 0.7},
+        "feedback": {"model": main_model, "num_predict": 300, "num_ctx": 4096, "temperature": 0.5},
+        "analysis": {"model": main_model, "num_predict": 2048, "num_ctx": 16384, "temperature": 0.5},
+    }
+    for task, override in settings.OLLAMA_TASK_OVERRIDES.items():
+        if task in profiles:
+            profiles[task] = {**profiles[task], **override}
+        else:
+            logging.warning(f"Ignoring override for unknown Ollama task '{task}'")
+    return profiles
+
+
+# Top-k adaptatif de la recherche vectorielle par point d'appel: `fetch_k` candidats demandés à
+# Chroma, puis entre `min_k` et `max_k` gardés selon la distance cosinus maximale et l'écart
+# relatif de similarité avec le meilleur résultat
+def get_retrieval_policies() -> Dict[str, Dict[str, Any]]:
+    policies = {
+        "chat": {"min_k": 1, "max_k": 6, "fetch_k": 8, "max_distance": 0.6, "relative_gap": 0.3},
+        # Requête générique (nom + description de la section): seuils plus larges
+        "exercise": {"min_k": 5, "max_k": 20, "fetch_k": 20, "max_distance": 0.85, "relative_gap": 0.5},
+        # Recherche directe (ChromaService.query_similar_chunks): exactement n_results extraits, sans coupure
+        "search": {"min_k": 5, "max_k": 5, "fetch_k": 5, "max_distance": 2.0, "relative_gap": 1.0},
+    }
+    for site, override in settings.RETRIEVAL_POLICY_OVERRIDES.items():
+        if site in policies:
+            policies[site] = {**policies[site], **override}
+        else:
+            logging.warning(f"Ignoring override for unknown retrieval site '{site}'")
+    return policies
@@ -6,6 +6,10 @@ import uvicorn
 import time
 from .core.config import settings
 from .core.database import Base, engine
+from .services.ollama_client import ollama_client_pool
+from .services.ollama_health import ollama_health_monitor
+from .services.chroma_async import chroma_async
+from .services.reranker import reranker
 
 
 # Import API routers
@@ -38,6 +42,20 @@ app.add_middleware(
     expose_headers=["Content-Length", "Content-Range"]
 )
 
+# Cycle de vie des ressources partagées
+@app.on_event("startup")
+async def startup_shared_clients():
+    await ollama_client_pool.start()
+    ollama_health_monitor.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_shared_clients():
+    await ollama_health_monitor.stop()
+    await ollama_client_pool.close()
+    chroma_async.shutdown()
+    reranker.shutdown()
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth")
 app.include_router(users.router, prefix="/api/users")
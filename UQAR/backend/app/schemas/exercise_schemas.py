@@ -31,6 +31,78 @@ class QuestionCreate(QuestionBase):
     pass
 
 
+class PromptParameters(BaseModel):
+    """Paramètres extraits d'un prompt enseignant (mode avancé)"""
+    nombre: int = Field(5, ge=1, le=20, description="Nombre de questions demandées")
+    type: QuestionType
+    sujet: str = Field(..., description="Sujet spécifique demandé")
+    difficulte: DifficultyLevel
+
+
+# Champs propres à chaque type de question, en plus de text/question_type/explanation/points
+QUESTION_TYPE_FIELDS = {
+    QuestionType.MCQ: ["options", "correct_answer"],
+    QuestionType.OPEN_ENDED: ["expected_keywords"],
+    QuestionType.TRUE_FALSE: ["correct_answer"],
+    QuestionType.FILL_BLANK: ["correct_answer"],
+}
+
+
+def _to_ollama_schema(schema: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    """Schéma pydantic -> schéma autonome pour le `format` d'Ollama (références résolues, Optional retirés)"""
+    if "$ref" in schema:
+        return _to_ollama_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        variants = [variant for variant in schema["anyOf"] if variant.get("type") != "null"]
+        if len(variants) == 1:
+            rest = {key: value for key, value in schema.items() if key != "anyOf"}
+            return _to_ollama_schema({**rest, **variants[0]}, defs)
+
+    result: Dict[str, Any] = {}
+    for key, value in schema.items():
+        if key in ("title", "default", "description", "$defs"):
+            continue
+        if key == "properties":
+            result[key] = {name: _to_ollama_schema(prop, defs) for name, prop in value.items()}
+        elif key == "items":
+            result[key] = _to_ollama_schema(value, defs)
+        else:
+            result[key] = value
+    return result
+
+
+def question_list_json_schema(question_type: QuestionType, num_questions: Optional[int] = None) -> Dict[str, Any]:
+    """Schéma JSON d'un tableau de questions d'un type donné, dérivé de QuestionBase"""
+    base = QuestionBase.model_json_schema()
+    defs = base.get("$defs", {})
+    fields = ["text", "question_type", *QUESTION_TYPE_FIELDS[question_type], "explanation", "points"]
+
+    properties = {name: _to_ollama_schema(base["properties"][name], defs) for name in fields}
+    properties["question_type"] = {"type": "string", "enum": [question_type.value]}
+    properties["points"]["minimum"] = 1
+    if question_type == QuestionType.MCQ:
+        properties["options"]["minItems"] = 2
+    elif question_type == QuestionType.TRUE_FALSE:
+        properties["correct_answer"]["enum"] = ["true", "false"]
+
+    schema: Dict[str, Any] = {
+        "type": "array",
+        "items": {"type": "object", "properties": properties, "required": fields},
+    }
+    if num_questions:
+        schema["minItems"] = num_questions
+        schema["maxItems"] = num_questions
+    return schema
+
+
+def prompt_parameters_json_schema() -> Dict[str, Any]:
+    """Schéma JSON des paramètres extraits d'un prompt enseignant"""
+    schema = PromptParameters.model_json_schema()
+    result = _to_ollama_schema(schema, schema.get("$defs", {}))
+    result["required"] = list(PromptParameters.model_fields)
+    return result
+
+
 class QuestionUpdate(BaseModel):
     text: Optional[str] = Field(None, description="The question text")
     question_type: Optional[QuestionType] = None
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .embeddings import normalize_query
+from .token_budget import token_budget
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    question: str  # question normalisée
+    answer: str
+    embedding: Optional[np.ndarray]  # embedding normalisé de la question (niveau sémantique)
+    created_at: float
+    generation_ms: float  # durée de la génération évitée à chaque réutilisation
+    hits: int = 0
+
+
+class AnswerCache:
+    """
+    Réponses déjà générées, par section: d'abord la question normalisée exacte, puis la question
+    la plus proche par similarité cosinus des embeddings (au-dessus de `semantic_threshold`).
+    Vidé pour une section dès que ses documents changent; le numéro de version évite de stocker
+    une réponse générée à partir du contenu d'avant la modification.
+    """
+
+    def __init__(self):
+        self.enabled = settings.ANSWER_CACHE_ENABLED
+        self.semantic_threshold = settings.ANSWER_CACHE_SEMANTIC_THRESHOLD
+        self.ttl = settings.ANSWER_CACHE_TTL
+        self.max_entries = settings.ANSWER_CACHE_MAX_ENTRIES
+        self._sections: Dict[int, "OrderedDict[str, CachedAnswer]"] = {}
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0,
+            "stale_stores": 0, "invalidations": 0, "llm_ms_saved": 0.0, "tokens_saved": 0,
+        }
+
+    def version(self, section_id: int) -> int:
+        return self._versions.get(section_id, 0)
+
+    def has_entries(self, section_id: int) -> bool:
+        return bool(self._sections.get(section_id))
+
+    def lookup(
+        self,
+        section_id: int,
+        question: str,
+        query_embedding: Optional[List[float]] = None
+    ) -> Optional[Tuple[CachedAnswer, str]]:
+        """(réponse, niveau "exact" ou "semantic"), ou None"""
+        if not self.enabled:
+            return None
+        self.stats["lookups"] += 1
+        normalized = normalize_query(question)
+        now = time.time()
+        with self._lock:
+            entries = self._sections.get(section_id)
+            if entries:
+                for key in [key for key, entry in entries.items() if now - entry.created_at > self.ttl]:
+                    del entries[key]
+                hit = entries.get(normalized)
+                tier = "exact"
+                if hit is None and query_embedding is not None:
+                    hit = self._nearest(entries, query_embedding)
+                    tier = "semantic"
+                if hit is not None:
+                    entries.move_to_end(hit.question)
+                    hit.hits += 1
+                    self.stats[f"{tier}_hits"] += 1
+                    self.stats["llm_ms_saved"] += hit.generation_ms
+                    self.stats["tokens_saved"] += token_budget.estimate(hit.answer)
+                    return hit, tier
+        self.stats["misses"] += 1
+        return None
+
+    def _nearest(self, entries: "OrderedDict[str, CachedAnswer]", query_embedding: List[float]) -> Optional[CachedAnswer]:
+        candidates = [entry for entry in entries.values() if entry.embedding is not None]
+        if not candidates:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        similarities = np.stack([entry.embedding for entry in candidates]) @ (query / norm)
+        best = int(np.argmax(similarities))
+        return candidates[best] if similarities[best] >= self.semantic_threshold else None
+
+    def store(
+        self,
+        section_id: int,
+        question: str,
+        answer: str,
+        query_embedding: Optional[List[float]],
+        generation_ms: float,
+        version: int
+    ) -> None:
+        if not self.enabled or not answer.strip():
+            return
+        embedding = None
+        if query_embedding is not None:
+            embedding = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(embedding)
+            embedding = embedding / norm if norm else None
+        normalized = normalize_query(question)
+        with self._lock:
+            if self.version(section_id) != version:
+                # Documents modifiés pendant la génération: réponse potentiellement obsolète
+                self.stats["stale_stores"] += 1
+                return
+            entries = self._sections.setdefault(section_id, OrderedDict())
+            entries[normalized] = CachedAnswer(normalized, answer, embedding, time.time(), generation_ms)
+            entries.move_to_end(normalized)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        self.stats["stores"] += 1
+
+    def invalidate(self, section_id: int) -> None:
+        """Documents de la section modifiés (upload, suppression)"""
+        with self._lock:
+            self._versions[section_id] = self.version(section_id) + 1
+            if self._sections.pop(section_id, None):
+                self.stats["invalidations"] += 1
+                logger.info(f"Answer cache invalidated for section {section_id}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        lookups = self.stats["lookups"]
+        return {
+            "enabled": self.enabled,
+            "sections": len(self._sections),
+            "entries": sum(len(entries) for entries in self._sections.values()),
+            **self.stats,
+            "llm_ms_saved": round(self.stats["llm_ms_saved"], 1),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Instance globale du cache de réponses
+answer_cache = AnswerCache()
@@ -1,65 +1,101 @@
+import asyncio
 import logging
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, AsyncIterator, Set, Tuple
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-# Import chromadb conditionnellement
-try:
-    import chromadb
-    CHROMADB_AVAILABLE = True
-except (ImportError, RuntimeError) as e:
-    logging.warning(f"ChromaDB not available: {e}")
-    CHROMADB_AVAILABLE = False
-
 from ..models.chat import ChatSession, ChatMessage
 from ..models.section import Section
 from ..schemas.chat_schemas import ChatMessageResponse # Updated import
 from ..models.user import User
 from ..core.config import settings
-from .ollama_service import OllamaService
+from ..core.database import SessionLocal
+from .ollama_service import OllamaService, OllamaErrorMessage, is_error_reply
+from .ollama_router import OllamaUnavailableError
+from .chroma_client import chroma_manager, ChromaUnavailableError
+from .chroma_async import chroma_async
+from .hybrid_retrieval import hybrid_search
+from .embeddings import embedding_engine
+from .answer_cache import answer_cache
+from .relevance_gate import relevance_gate, SectionProfile
+from .retrieval_policy import get_retrieval_policy, RetrievalPolicy
+from .context_assembly import assemble_context
+from .metrics import StageMetrics
 
 logger = logging.getLogger(__name__)
 
+# Latences par étape du pipeline de chat (récupération, pertinence, réponse, titre)
+chat_stage_metrics = StageMetrics()
+
+# Références vers les tâches de fond (titres) pour éviter qu'elles soient collectées
+_background_tasks: Set[asyncio.Task] = set()
+
+# Génération spéculative: réponses démarrées, conservées, annulées (hors sujet)
+speculation_stats = {"started": 0, "kept": 0, "cancelled": 0, "discarded_chunks": 0}
+
+_STREAM_END = object()
+
+# Réponse aux questions jugées hors sujet pour la section
+OFF_TOPIC_REPLY = "Désolé, cette question ne semble pas liée au sujet de cette section."
+
+
+class SpeculativeStream:
+    """
+    Flux de réponse lancé avant la fin du contrôle de pertinence.
+    Les tokens sont mis en tampon jusqu'à la décision: `keep()` les libère,
+    `cancel()` interrompt la requête Ollama en amont.
+    """
+
+    def __init__(self, chunks: AsyncIterator[str]):
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        self._error: Optional[BaseException] = None
+        self._task = asyncio.create_task(self._pump(chunks))
+
+    async def _pump(self, chunks: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in chunks:
+                self._queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._error = e
+        finally:
+            self._queue.put_nowait(_STREAM_END)
+
+    def keep(self) -> "SpeculativeStream":
+        speculation_stats["kept"] += 1
+        return self
+
+    async def cancel(self) -> None:
+        if not self._task.done():
+            speculation_stats["cancelled"] += 1
+            speculation_stats["discarded_chunks"] += self._queue.qsize()
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def __aiter__(self):
+        try:
+            while True:
+                chunk = await self._queue.get()
+                if chunk is _STREAM_END:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                yield chunk
+        finally:
+            # Client parti en cours de route: arrêter la génération
+            if not self._task.done():
+                self._task.cancel()
+
 class ChatService:
     """Service pour gérer le chat RAG avec ChromaDB et Ollama"""
 
     def __init__(self, db: Session):
         self.db = db
         self.ollama_service = OllamaService()
-        self.chroma_client = None
-
-        if CHROMADB_AVAILABLE:
-            try:
-                # Premier essai avec tenant/database
-                self.chroma_client = chromadb.HttpClient(
-                    host=settings.CHROMA_HOST,
-                    port=settings.CHROMA_PORT,
-                    tenant="default_tenant",
-                    database="default_database"
-                )
-                logger.info("ChromaDB client initialized successfully with tenant/database")
-            except Exception as e:
-                logger.warning(f"Could not initialize ChromaDB with tenant/database: {e}")
-                try:
-                    # Deuxième essai sans tenant/database
-                    self.chroma_client = chromadb.HttpClient(
-                        host=settings.CHROMA_HOST,
-                        port=settings.CHROMA_PORT
-                    )
-                    logger.info("ChromaDB client initialized without tenant/database")
-                except Exception as e2:
-                    logger.warning(f"Could not initialize ChromaDB without tenant/database: {e2}")
-                    try:
-                        # Troisième essai avec PersistentClient
-                        self.chroma_client = chromadb.PersistentClient(
-                            path=settings.CHROMA_PERSIST_DIRECTORY
-                        )
-                        logger.info("ChromaDB initialized as PersistentClient")
-                    except Exception as e3:
-                        logger.error(f"All ChromaDB initialization attempts failed: {e3}")
-                        self.chroma_client = None
-        else:
-            logger.warning("ChromaDB is not available, RAG features will be disabled")
 
     def get_user_sessions(self, user_id: int) -> List[ChatSession]:
         """
@@ -168,6 +204,254 @@ class ChatService:
             logger.error(f"Error fetching messages for session_id {session_id}: {e}", exc_info=True)
             raise Exception(f"Erreur interne lors de la récupération des messages: {str(e)}")
 
+    async def retrieve_context(
+        self,
+        section: Optional[Section],
+        content: str,
+        policy: Optional[RetrievalPolicy] = None
+    ) -> Dict[str, Any]:
+        """
+        Recherche hybride dans la collection de la section (vectorielle avec le top-k adaptatif de
+        la politique "chat", et BM25), reclassée par le cross-encoder s'il est activé.
+        Retourne les textes assemblés (extraits consécutifs fusionnés, doublons écartés), les
+        distances vectorielles, l'embedding de la question et la collection.
+        """
+        policy = policy or get_retrieval_policy("chat")
+        retrieval = {"texts": [], "distances": [], "query_embedding": None, "collection": None}
+        if not (section and section.chroma_collection_name):
+            logger.info("Section has no collection; proceeding without RAG context.")
+            return retrieval
+
+        logger.info(f"Querying collection {section.chroma_collection_name} for section {section.id}")
+        result = await hybrid_search(section.chroma_collection_name, content, policy, rerank=True)
+        retrieval["collection"] = result.collection
+        retrieval["query_embedding"] = result.query_embedding
+        retrieval["distances"] = result.distances
+        if result.chunks:
+            chunks = assemble_context(result.chunks)
+            retrieval["texts"] = [chunk["text"] for chunk in chunks]
+            logger.info(f"Retrieved {len(result.chunks)} context snippets ({len(result.distances)} from vector search).")
+        else:
+            logger.info("No context found for the query.")
+        return retrieval
+
+    def _get_section_profile(self, section: Section) -> Optional[SectionProfile]:
+        """Profil de pertinence de la section (en cache, sinon construit depuis Chroma)"""
+        profile = relevance_gate.cached_profile(section.chroma_collection_name)
+        if profile is not None:
+            return profile
+        try:
+            collection = chroma_manager.get_collection(section.chroma_collection_name)
+        except Exception as e:
+            logger.error(f"Could not load collection {section.chroma_collection_name} for relevance profile: {e}")
+            return None
+        return relevance_gate.get_profile(section, collection)
+
+    async def _llm_relevance(self, section: Optional[Section], content: str, user_id: int) -> bool:
+        """Classifieur LLM de pertinence (cas limites ou filtre désactivé)"""
+        if section:
+            relevance_context = f"Nom de la section: {section.name}. Description: {section.description or ''}"
+        else:
+            relevance_context = ""
+        return await self.ollama_service.check_relevance(
+            content,
+            relevance_context,
+            user_id=user_id,
+            section_id=section.id if section else None
+        )
+
+    async def retrieve_with_relevance(
+        self,
+        section: Optional[Section],
+        content: str,
+        user_id: int,
+        check_relevance: bool = True,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[Dict[str, Any], "asyncio.Future[bool]"]:
+        """
+        Récupération du contexte et filtre de pertinence en parallèle.
+        Retourne le contexte dès qu'il est prêt et la décision de pertinence sous forme de future:
+        avec le filtre par embeddings, le profil de section est chargé pendant la requête Chroma et
+        le classifieur LLM n'est lancé que pour les cas limites; sans lui, l'appel LLM de pertinence
+        démarre en même temps que la récupération.
+        """
+
+        async def timed_retrieval() -> Dict[str, Any]:
+            async with chat_stage_metrics.measure("retrieval", timings):
+                return await self.retrieve_context(section, content)
+
+        async def timed_llm_relevance() -> bool:
+            async with chat_stage_metrics.measure("relevance_llm", timings):
+                return await self._llm_relevance(section, content, user_id)
+
+        def resolved(relevant: bool) -> "asyncio.Future[bool]":
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(relevant)
+            return future
+
+        if not check_relevance:
+            return await timed_retrieval(), resolved(True)
+
+        gate_enabled = (
+            settings.RELEVANCE_GATE_ENABLED
+            and section is not None
+            and section.chroma_collection_name
+        )
+        if not gate_enabled:
+            relevance = asyncio.ensure_future(timed_llm_relevance())
+            try:
+                retrieval = await timed_retrieval()
+            except BaseException:
+                relevance.cancel()
+                raise
+            return retrieval, relevance
+
+        async def timed_profile() -> Optional[SectionProfile]:
+            async with chat_stage_metrics.measure("section_profile", timings):
+                try:
+                    # Construire le profil lit jusqu'à RELEVANCE_PROFILE_MAX_CHUNKS embeddings
+                    return await chroma_async.run(
+                        "section_profile", self._get_section_profile, section, timeout=chroma_async.write_timeout
+                    )
+                except ChromaUnavailableError as e:
+                    logger.warning(f"{e}; relevance profile unavailable")
+                    return None
+
+        retrieval, profile = await asyncio.gather(timed_retrieval(), timed_profile())
+        if retrieval.get("collection") is not None:
+            async with chat_stage_metrics.measure("relevance_gate", timings):
+                decision = relevance_gate.evaluate(profile, retrieval["distances"], retrieval["query_embedding"])
+            if decision.verdict != "borderline":
+                return retrieval, resolved(decision.relevant)
+
+        return retrieval, asyncio.ensure_future(timed_llm_relevance())
+
+    async def retrieve_and_check(
+        self,
+        section: Optional[Section],
+        content: str,
+        user_id: int,
+        check_relevance: bool = True,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Contexte RAG et décision de pertinence, une fois les deux résolus"""
+        retrieval, relevance = await self.retrieve_with_relevance(
+            section, content, user_id, check_relevance=check_relevance, timings=timings
+        )
+        return retrieval, await relevance
+
+    def start_speculative_answer(self, chunks: AsyncIterator[str]) -> "SpeculativeStream":
+        """Démarrer la génération avant la décision de pertinence (tokens mis en tampon)"""
+        speculation_stats["started"] += 1
+        return SpeculativeStream(chunks)
+
+    def schedule_title_generation(self, session_id: int, content: str, user_id: int, section_id: Optional[int]) -> None:
+        """Générer le titre de la session en tâche de fond, après l'envoi de la réponse"""
+        task = asyncio.create_task(
+            _update_session_title(self.ollama_service, session_id, content, user_id, section_id)
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    def get_history_window(self, session_id: int, exclude_message_id: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Historique borné de la session au format /api/chat.
+        La fenêtre avance par blocs pour garder un préfixe identique d'un tour à l'autre
+        (réutilisation du cache KV d'Ollama). Les tours sans vraie réponse (refus hors sujet,
+        échec de génération) sont écartés avec la question qui les a provoqués.
+        """
+        query = self.db.query(ChatMessage).filter(ChatMessage.session_id == session_id)
+        if exclude_message_id is not None:
+            query = query.filter(ChatMessage.id != exclude_message_id)
+
+        window = settings.CHAT_HISTORY_MAX_MESSAGES
+        total = query.count()
+        start = 0
+        if total > window:
+            step = max(2, (window // 2) // 2 * 2)  # pair pour commencer sur un message utilisateur
+            start = ((total - window - 1) // step + 1) * step
+
+        messages = query.order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc()).offset(start).all()
+        history: List[Dict[str, str]] = []
+        for message in messages:
+            if not message.is_assistant:
+                history.append({"role": "user", "content": message.content})
+            elif message.content == OFF_TOPIC_REPLY or is_error_reply(message.content):
+                if history and history[-1]["role"] == "user":
+                    history.pop()
+            else:
+                history.append({"role": "assistant", "content": message.content})
+        return history
+
+    async def lookup_cached_answer(
+        self,
+        section: Optional[Section],
+        content: str,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Optional[str]:
+        """
+        Réponse déjà générée pour cette question dans la section (question identique, sinon
+        sémantiquement proche). Réservé au premier message d'une conversation: ensuite la
+        réponse dépend de l'historique.
+        """
+        if section is None or not answer_cache.enabled:
+            return None
+        async with chat_stage_metrics.measure("answer_cache", timings):
+            # Embedding seulement s'il y a des réponses à comparer (réutilisé ensuite par la recherche)
+            query_embedding = await embedding_engine.aembed_query(content) if answer_cache.has_entries(section.id) else None
+            hit = answer_cache.lookup(section.id, content, query_embedding)
+        if hit is None:
+            return None
+        entry, tier = hit
+        logger.info(f"Answer cache {tier} hit for section {section.id} (~{entry.generation_ms:.0f} ms of generation saved)")
+        return entry.answer
+
+    async def generate_answer(
+        self,
+        session_id: int,
+        user_message_id: int,
+        content: str,
+        context: Optional[List[str]],
+        user_id: int,
+        section_id: Optional[int]
+    ) -> str:
+        """Réponse complète: /api/chat multi-tour si activé, sinon prompt unique /api/generate"""
+        if settings.OLLAMA_CHAT_MODE:
+            messages = self.ollama_service.build_chat_messages(
+                content,
+                context=context,
+                history=self.get_history_window(session_id, exclude_message_id=user_message_id)
+            )
+            return await self.ollama_service.generate_chat_response(
+                messages, user_id=user_id, section_id=section_id, session_id=session_id
+            )
+        return await self.ollama_service.generate_response(
+            prompt=content, context=context, user_id=user_id, section_id=section_id, session_id=session_id
+        )
+
+    def stream_answer(
+        self,
+        session_id: int,
+        user_message_id: int,
+        content: str,
+        context: Optional[List[str]],
+        user_id: int,
+        section_id: Optional[int]
+    ):
+        """Même chose que generate_answer, en flux de tokens"""
+        if settings.OLLAMA_CHAT_MODE:
+            messages = self.ollama_service.build_chat_messages(
+                content,
+                context=context,
+                history=self.get_history_window(session_id, exclude_message_id=user_message_id)
+            )
+            return self.ollama_service.generate_chat_streaming_response(
+                messages, user_id=user_id, section_id=section_id, session_id=session_id
+            )
+        return self.ollama_service.generate_streaming_response(
+            prompt=content, context=context, user_id=user_id, section_id=section_id, session_id=session_id
+        )
+
     async def send_message(self, session_id: int, user_id: int, content: str) -> Dict[str, Any]:
         """
         Gère l'envoi d'un message par l'utilisateur, récupère le contexte RAG,
@@ -213,28 +497,22 @@ class ChatService:
             self.db.flush()  # Pour obtenir l'ID du message utilisateur si besoin avant commit
 
             # 4. Récupérer le contexte RAG via ChromaDB
-            retrieved_context_texts = []
             section = None
-            if self.chroma_client and session.section_id:
+            if session.section_id:
                 section = self.db.query(Section).filter(Section.id == session.section_id).first()
-                if section and section.chroma_collection_name:
-                    try:
-                        logger.info(f"Querying ChromaDB collection: {section.chroma_collection_name} for section {section.id}")
-                        collection = self.chroma_client.get_collection(name=section.chroma_collection_name)
-                        # Nombre de résultats à récupérer (ajuster si nécessaire)
-                        results = collection.query(query_texts=[content], n_results=3) 
-                        if results and results.get('documents') and results['documents'][0]:
-                            retrieved_context_texts = results['documents'][0]
-                            logger.info(f"Retrieved {len(retrieved_context_texts)} context snippets from ChromaDB.")
-                        else:
-                            logger.info("No context found in ChromaDB for the query.")
-                    except Exception as chroma_exc:
-                        logger.error(f"Error querying ChromaDB collection {section.chroma_collection_name}: {chroma_exc}", exc_info=True)
-                        # Continuer sans contexte si ChromaDB échoue
-                else:
+                if not section or not section.chroma_collection_name:
                     logger.warning(f"Section {session.section_id} not found or has no chroma_collection_name for RAG.")
+
+            timings: Dict[str, float] = {}
+            cached_answer = None
+            if existing_count == 0:
+                cache_version = answer_cache.version(section.id) if section else 0
+                cached_answer = await self.lookup_cached_answer(section, content, timings)
+            if cached_answer is not None:
+                retrieval, is_relevant = {"texts": [], "query_embedding": None}, True
             else:
-                logger.info("ChromaDB client not available or section_id missing; proceeding without RAG context.")
+                retrieval, is_relevant = await self.retrieve_and_check(section, content, user_id, timings=timings)
+            retrieved_context_texts = retrieval["texts"]
 
             if retrieved_context_texts:
                 logger.info(f"Retrieved RAG context. Number of snippets: {len(retrieved_context_texts)}")
@@ -243,32 +521,29 @@ class ChatService:
                     logger.info(f"RAG context snippet {i+1} (length): {len(text)}")
             else:
                 logger.info("No RAG context was retrieved or used.")
-            
-            # Construire un contexte simple pour la vérification de pertinence
-            if section:
-                relevance_context = f"Nom de la section: {section.name}. Description: {section.description or ''}"
-            else:
-                relevance_context = ""
-
 
-            is_relevant = await self.ollama_service.check_relevance(content, relevance_context)
-
-            if not is_relevant:
-                ai_response_content = "Désolé, cette question ne semble pas liée au sujet de cette section."
+            if cached_answer is not None:
+                ai_response_content = cached_answer
+            elif not is_relevant:
+                ai_response_content = OFF_TOPIC_REPLY
             else:
-                # 4. Obtenir la réponse de OllamaService
-                # Le system_prompt par défaut est dans OllamaService._build_prompt
-                ai_response_content = await self.ollama_service.generate_response(
-                    prompt=content,
-                    context=retrieved_context_texts if retrieved_context_texts else None
-                )
-
-                if existing_count == 0:
-                    try:
-                        new_title = await self.ollama_service.generate_title(content)
-                        session.title = new_title
-                    except Exception:
-                        pass
+                # 4. Obtenir la réponse de OllamaService (avec l'historique de la session)
+                async with chat_stage_metrics.measure("answer", timings):
+                    ai_response_content = await self.generate_answer(
+                        session_id=session_id,
+                        user_message_id=user_message.id,
+                        content=content,
+                        context=retrieved_context_texts if retrieved_context_texts else None,
+                        user_id=user_id,
+                        section_id=session.section_id
+                    )
+                # Réponse réutilisable: premier message, appuyée sur le contenu de la section (jamais un message d'erreur)
+                generated = not isinstance(ai_response_content, OllamaErrorMessage)
+                if generated and existing_count == 0 and section is not None and retrieved_context_texts:
+                    answer_cache.store(
+                        section.id, content, ai_response_content, retrieval["query_embedding"],
+                        timings["answer"], cache_version
+                    )
 
             # 5. Sauvegarder le message de l'assistant
             assistant_message = ChatMessage(
@@ -289,6 +564,12 @@ class ChatService:
             
             logger.info(f"User message (id: {user_message.id}) and assistant message (id: {assistant_message.id}) saved.")
 
+            # Le titre ne retarde pas la réponse: il est généré après coup
+            if is_relevant and existing_count == 0:
+                self.schedule_title_generation(session_id, content, user_id, session.section_id)
+
+            logger.info(f"Chat pipeline timings for session {session_id}: {timings}")
+
             # 7. Retourner les messages (ou leurs représentations Pydantic si nécessaire par l'API)
             # L'API s'attend à Dict[str, Any], qui est ensuite probablement converti en ChatMessageResponse.
             # Pour simplifier ici, nous allons retourner les objets ORM, l'API se chargera de la sérialisation.
@@ -305,13 +586,18 @@ class ChatService:
             # Donc, la structure doit être:
             return {
                 "user_message": ChatMessageResponse.from_orm(user_message).model_dump(),
-                "system_message": ChatMessageResponse.from_orm(assistant_message).model_dump()
+                "system_message": ChatMessageResponse.from_orm(assistant_message).model_dump(),
+                "timings": timings
             }
 
         except ValueError as ve:
             logger.warning(f"ValueError in send_message: {ve}")
             self.db.rollback() # Rollback en cas d'erreur avant commit
             raise ve
+        except OllamaUnavailableError:
+            logger.warning(f"LLM backend unavailable, message not answered for session_id {session_id}")
+            self.db.rollback()
+            raise
         except Exception as e:
             logger.error(f"Error in send_message for session_id {session_id}: {e}", exc_info=True)
             self.db.rollback()
@@ -364,3 +650,34 @@ class ChatService:
             # Pour correspondre à l'API, on peut retourner False ici, mais c'est discutable.
             # Levons l'exception pour que l'API la gère comme un 500, ce qui est plus précis pour une erreur interne.
             raise Exception(f"Erreur interne lors de la suppression de la session: {str(e)}")
+
+
+async def _update_session_title(
+    ollama_service: OllamaService,
+    session_id: int,
+    content: str,
+    user_id: int,
+    section_id: Optional[int]
+) -> None:
+    """Tâche de fond: générer le titre puis l'enregistrer avec sa propre session DB"""
+    try:
+        async with chat_stage_metrics.measure("title"):
+            new_title = await ollama_service.generate_title(
+                content, user_id=user_id, section_id=section_id, session_id=session_id
+            )
+    except Exception as e:
+        logger.warning(f"Title generation failed for session {session_id}: {e}")
+        return
+
+    db = SessionLocal()
+    try:
+        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        if session:
+            session.title = new_title
+            db.commit()
+            logger.info(f"Session {session_id} titled: {new_title}")
+    except Exception as e:
+        logger.error(f"Could not save title for session {session_id}: {e}")
+        db.rollback()
+    finally:
+        db.close()
@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from ..core.config import settings
+from .chroma_client import chroma_manager, ChromaUnavailableError
+from .metrics import LatencyWindow, StageMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class ChromaTimeoutError(ChromaUnavailableError):
+    """Opération Chroma trop longue: l'appelant continue sans elle (le thread finit en arrière-plan)"""
+
+
+class AsyncChroma:
+    """
+    Façade asynchrone de Chroma: les appels synchrones du client (query, add, get, delete)
+    s'exécutent sur un pool de threads dédié et borné, avec un nombre d'opérations simultanées
+    limité et un délai maximal, pour ne jamais bloquer la boucle d'événements d'uvicorn.
+    """
+
+    def __init__(self):
+        self.max_concurrency = max(1, settings.CHROMA_MAX_CONCURRENCY)
+        self.query_timeout = settings.CHROMA_QUERY_TIMEOUT
+        self.write_timeout = settings.CHROMA_WRITE_TIMEOUT
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.operations = StageMetrics()
+        self.wait = LatencyWindow()
+        self.stats = {"calls": 0, "timeouts": 0, "errors": 0, "max_in_flight": 0, "event_loop_ms_saved": 0.0}
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="chroma")
+        return self._executor
+
+    def _timed(self, operation: str, fn: Callable, *args, **kwargs):
+        # Exécuté dans le thread: ce temps aurait bloqué la boucle d'événements
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.operations.record(operation, elapsed_ms)
+            self.stats["event_loop_ms_saved"] += elapsed_ms
+
+    async def run(self, operation: str, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Exécuter `fn(*args, **kwargs)` sur le pool Chroma; ChromaTimeoutError après `timeout` s"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = self.query_timeout if timeout is None else timeout
+        self.stats["calls"] += 1
+        started = time.perf_counter()
+
+        async def call() -> Any:
+            async with self._semaphore:
+                self.wait.add((time.perf_counter() - started) * 1000)
+                self.in_flight += 1
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        self.executor, functools.partial(self._timed, operation, fn, *args, **kwargs)
+                    )
+                finally:
+                    self.in_flight -= 1
+
+        try:
+            return await asyncio.wait_for(call(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.error(f"Chroma operation '{operation}' timed out after {timeout:.1f}s")
+            raise ChromaTimeoutError(f"Opération Chroma '{operation}' expirée après {timeout:.1f}s")
+        except ChromaUnavailableError:
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+    async def get_collection(self, name: str, create: bool = False):
+        """Handle de collection: immédiat s'il est en cache, sinon résolu sur le pool"""
+        collection = chroma_manager.cached_collection(name)
+        if collection is not None:
+            return collection
+        return await self.run("get_collection", chroma_manager.get_collection, name, create=create)
+
+    async def query(self, collection, **params) -> Dict[str, Any]:
+        return await self.run("query", collection.query, **params)
+
+    async def get(self, collection, **params) -> Dict[str, Any]:
+        return await self.run("get", collection.get, **params)
+
+    async def add(self, collection, **params) -> None:
+        # Gros lots (et embeddings calculés par Chroma s'ils ne sont pas fournis): délai d'écriture
+        await self.run("add", collection.add, timeout=self.write_timeout, **params)
+
+    async def delete(self, collection, **params) -> None:
+        await self.run("delete", collection.delete, timeout=self.write_timeout, **params)
+
+    async def delete_collection(self, name: str) -> None:
+        await self.run("delete_collection", chroma_manager.delete_collection, name, timeout=self.write_timeout)
+
+    def shutdown(self) -> None:
+        """Libérer les threads (appelé à l'arrêt de FastAPI)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            **self.stats,
+            "event_loop_ms_saved": round(self.stats["event_loop_ms_saved"], 1),
+            "wait": self.wait.to_dict(),
+            "operations": self.operations.to_dict(),
+        }
+
+
+# Instance globale de la façade
+chroma_async = AsyncChroma()
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import chromadb
+    CHROMADB_AVAILABLE = True
+except (ImportError, RuntimeError) as e:
+    logging.warning(f"ChromaDB not available: {e}")
+    CHROMADB_AVAILABLE = False
+
+from ..core.config import settings, get_chroma_config
+from .numpy_store import numpy_store, NumpyCollection
+
+logger = logging.getLogger(__name__)
+
+
+class ChromaUnavailableError(Exception):
+    """Chroma injoignable (ou non installé): échec immédiat jusqu'à la prochaine tentative"""
+
+
+def _is_connection_error(error: Exception) -> bool:
+    if isinstance(error, ChromaUnavailableError):
+        # Déjà traité (échec rapide, délai de la façade): ne pas fermer le client
+        return False
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or "Connect" in name or "Timeout" in name
+
+
+class ChromaClientManager:
+    """
+    Client Chroma partagé par tout le processus (paramètres lus une fois) et cache des
+    collections par nom. Quand Chroma est injoignable, les appels échouent immédiatement
+    pendant `retry_interval` secondes au lieu de retenter la connexion à chaque requête.
+    """
+
+    def __init__(self):
+        config = get_chroma_config()
+        self.host = config["host"]
+        self.port = config["port"]
+        self.persist_directory = config["persist_directory"]
+        self.persistent_fallback = settings.CHROMA_PERSISTENT_FALLBACK
+        # "numpy": magasin dans le processus à la place de Chroma (même interface, pas de serveur)
+        self.backend = settings.VECTOR_STORE_BACKEND
+        self.retry_interval = settings.CHROMA_RETRY_INTERVAL
+        self._client = None
+        self._collections: Dict[str, Any] = {}
+        # Les appels Chroma s'exécutent sur les threads de la façade asynchrone (chroma_async)
+        self._lock = threading.RLock()
+        self._down_until = 0.0
+        self.last_error: Optional[str] = None
+        self.mode: Optional[str] = None
+        self.stats = {
+            "connects": 0,
+            "connect_failures": 0,
+            "fast_failures": 0,
+            "collection_hits": 0,
+            "collection_misses": 0,
+            "invalidations": 0,
+        }
+
+    def _connect(self):
+        if self.backend == "numpy":
+            self.mode = "numpy"
+            logger.info(f"Using the in-process NumPy vector store ({numpy_store.directory})")
+            return numpy_store
+        try:
+            client = chromadb.HttpClient(host=self.host, port=self.port)
+            self.mode = "http"
+            logger.info(f"ChromaDB HttpClient connected to {self.host}:{self.port}")
+            return client
+        except Exception as e:
+            if not self.persistent_fallback:
+                raise
+            logger.warning(f"Failed to initialize ChromaDB HttpClient: {e}; falling back to PersistentClient")
+        client = chromadb.PersistentClient(path=self.persist_directory)
+        self.mode = "persistent"
+        logger.info(f"ChromaDB initialized as PersistentClient ({self.persist_directory})")
+        return client
+
+    @property
+    def client(self):
+        """Client partagé, ou ChromaUnavailableError sans nouvelle tentative pendant `retry_interval`"""
+        if self._client is not None:
+            return self._client
+        if not CHROMADB_AVAILABLE and self.backend != "numpy":
+            raise ChromaUnavailableError("ChromaDB n'est pas installé")
+        with self._lock:
+            if self._client is not None:
+                return self._client
+            if time.time() < self._down_until:
+                self.stats["fast_failures"] += 1
+                raise ChromaUnavailableError(f"ChromaDB indisponible: {self.last_error}")
+            try:
+                self._client = self._connect()
+                self.stats["connects"] += 1
+                self.last_error = None
+            except Exception as e:
+                self.stats["connect_failures"] += 1
+                self._mark_down(str(e))
+                raise ChromaUnavailableError(f"ChromaDB indisponible: {e}") from e
+            return self._client
+
+    def is_available(self) -> bool:
+        try:
+            self.client
+            return True
+        except ChromaUnavailableError:
+            return False
+
+    @property
+    def mirror_enabled(self) -> bool:
+        """Écritures copiées dans le magasin NumPy, qui sert les requêtes quand Chroma est injoignable"""
+        return settings.NUMPY_STORE_FALLBACK and self.backend != "numpy"
+
+    def fallback_collection(self, name: str) -> Optional[NumpyCollection]:
+        """Copie locale de la collection (None si la copie est désactivée ou vide)"""
+        if not self.mirror_enabled or not numpy_store.has_collection(name):
+            return None
+        return numpy_store.get_collection(name)
+
+    def cached_collection(self, name: str):
+        """Handle déjà en cache, sans appel réseau (None sinon)"""
+        collection = self._collections.get(name)
+        if collection is not None:
+            self.stats["collection_hits"] += 1
+        return collection
+
+    def get_collection(self, name: str, create: bool = False):
+        """Collection en cache; `create` la crée (distance cosinus) si elle n'existe pas"""
+        collection = self._collections.get(name)
+        if collection is not None:
+            self.stats["collection_hits"] += 1
+            return collection
+        client = self.client
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is not None:
+                self.stats["collection_hits"] += 1
+                return collection
+            self.stats["collection_misses"] += 1
+            try:
+                if create:
+                    collection = client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+                else:
+                    collection = client.get_collection(name=name)
+            except Exception as e:
+                self.report_error(e)
+                raise
+            self._collections[name] = collection
+            return collection
+
+    def delete_collection(self, name: str) -> None:
+        """Supprimer la collection (suppression d'une section) et oublier son handle"""
+        self.invalidate(name)
+        self.client.delete_collection(name=name)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Oublier le handle d'une collection (ou de toutes)"""
+        with self._lock:
+            if name is None:
+                self._collections.clear()
+            elif self._collections.pop(name, None) is None:
+                return
+            self.stats["invalidations"] += 1
+
+    def report_error(self, error: Exception, collection_name: Optional[str] = None) -> None:
+        """
+        Signaler l'échec d'un appel Chroma: une erreur de connexion ferme le client (échec rapide
+        jusqu'à la prochaine tentative), une autre erreur oublie le handle de la collection
+        (collection supprimée ou recréée ailleurs).
+        """
+        if _is_connection_error(error):
+            with self._lock:
+                self._client = None
+                self._collections.clear()
+                self._mark_down(str(error))
+        elif collection_name is not None:
+            self.invalidate(collection_name)
+
+    def _mark_down(self, error: str) -> None:
+        self.last_error = error
+        self._down_until = time.time() + self.retry_interval
+        logger.error(f"ChromaDB unavailable, failing fast for {self.retry_interval:.0f}s: {error}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        down_for = max(0.0, self._down_until - time.time())
+        return {
+            "connected": self._client is not None,
+            "mode": self.mode,
+            "numpy_store": numpy_store.get_stats() if self.mirror_enabled or self.backend == "numpy" else None,
+            "retry_in_seconds": round(down_for, 1) if self._client is None and down_for else None,
+            "last_error": self.last_error,
+            "cached_collections": len(self._collections),
+            **self.stats,
+        }
+
+
+# Instance globale du gestionnaire de client Chroma
+chroma_manager = ChromaClientManager()
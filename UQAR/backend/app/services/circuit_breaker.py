@@ -0,0 +1,86 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur d'un nœud LLM: s'ouvre après N échecs consécutifs (erreurs, réponses 5xx
+    ou dépassements du SLO de latence), refuse les appels pendant `reset_timeout`,
+    puis laisse passer un seul appel d'essai (semi-ouvert) avant de se refermer.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_failure: Optional[str] = None
+        self.trial_in_flight = False
+        self.stats = {"opened": 0, "rejected": 0, "failures": 0, "slo_breaches": 0}
+
+    def _cooled_down(self) -> bool:
+        return self.opened_at is not None and time.time() - self.opened_at >= self.reset_timeout
+
+    def available(self) -> bool:
+        """Un appel peut-il être envoyé maintenant (sans modifier l'état)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return self._cooled_down()
+        return not self.trial_in_flight
+
+    def begin(self) -> None:
+        """Début d'un appel; le premier après le délai de réouverture devient l'appel d'essai"""
+        if self.state == self.OPEN and self._cooled_down():
+            self.state = self.HALF_OPEN
+            logger.info(f"Circuit breaker {self.name} half-open, sending trial request")
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit breaker {self.name} closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self, reason: str, slo_breach: bool = False) -> None:
+        self.consecutive_failures += 1
+        self.last_failure = reason
+        self.stats["slo_breaches" if slo_breach else "failures"] += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.stats["opened"] += 1
+                logger.error(f"Circuit breaker {self.name} open after {self.consecutive_failures} failures ({reason})")
+            self.state = self.OPEN
+            self.opened_at = time.time()
+        self.trial_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """Appel annulé par l'appelant: ni succès ni échec, libérer l'essai éventuel"""
+        self.trial_in_flight = False
+
+    def record_rejected(self) -> None:
+        self.stats["rejected"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == self.OPEN and self.opened_at is not None:
+            retry_in = round(max(0.0, self.reset_timeout - (time.time() - self.opened_at)), 1)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "last_failure": self.last_failure,
+            "retry_in_seconds": retry_in,
+            **self.stats,
+        }
@@ -0,0 +1,136 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from ..core.config import settings
+from .token_budget import token_budget
+
+logger = logging.getLogger(__name__)
+
+# Taille des n-grammes de mots comparés pour repérer les passages quasi identiques
+SHINGLE_SIZE = 5
+_WORD = re.compile(r"\w+")
+
+# Appels, passages fusionnés, doublons écartés et tokens économisés
+context_assembly_stats = {"calls": 0, "chunks_in": 0, "chunks_out": 0, "merged": 0, "duplicates": 0, "tokens_in": 0, "tokens_saved": 0}
+
+
+@dataclass(eq=False)
+class _Passage:
+    rank: int  # rang du meilleur extrait du passage (ordre de pertinence)
+    chunk: Dict[str, Any]
+    document_id: Optional[str]
+    first_index: Optional[int]
+    last_index: Optional[int]
+    shingles: FrozenSet[int] = field(default_factory=frozenset)
+
+
+def _overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """Longueur du plus long suffixe de `left` qui est aussi un préfixe de `right`"""
+    for length in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def _shingles(text: str) -> FrozenSet[int]:
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return frozenset([hash(" ".join(words))]) if words else frozenset()
+    return frozenset(hash(" ".join(words[i:i + SHINGLE_SIZE])) for i in range(len(words) - SHINGLE_SIZE + 1))
+
+
+def _contained(inner: FrozenSet[int], outer: FrozenSet[int], threshold: float) -> bool:
+    """La plupart des n-grammes de `inner` se retrouvent dans `outer`"""
+    return bool(inner) and len(inner & outer) >= threshold * len(inner)
+
+
+def _chunk_position(chunk: Dict[str, Any]):
+    metadata = chunk.get("metadata") or {}
+    document_id = metadata.get("document_id", chunk.get("document_id"))
+    chunk_index = metadata.get("chunk_index")
+    return (str(document_id) if document_id is not None else None,
+            int(chunk_index) if chunk_index is not None else None)
+
+
+def assemble_context(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Préparer les extraits récupérés (triés par pertinence) avant le prompt:
+    fusionner les extraits consécutifs d'un même document (`chunk_index`) en retirant le
+    chevauchement du découpage, puis écarter les passages quasi identiques (document envoyé
+    deux fois, passage contenu dans un autre). Les passages gardent l'ordre de pertinence
+    de leur meilleur extrait; chaque dictionnaire garde les clés de cet extrait.
+    """
+    if not settings.CONTEXT_ASSEMBLY_ENABLED or len(chunks) < 2:
+        return chunks
+
+    # 1. Fusion des suites d'extraits consécutifs d'un même document
+    passages: List[_Passage] = []
+    by_document: Dict[str, List[_Passage]] = {}
+    for rank, chunk in enumerate(chunks):
+        document_id, chunk_index = _chunk_position(chunk)
+        passage = _Passage(rank, dict(chunk), document_id, chunk_index, chunk_index)
+        passages.append(passage)
+        if document_id is not None and chunk_index is not None:
+            by_document.setdefault(document_id, []).append(passage)
+
+    merged = 0
+    for document_passages in by_document.values():
+        document_passages.sort(key=lambda passage: passage.first_index)
+        current = document_passages[0]
+        for passage in document_passages[1:]:
+            if passage.first_index != current.last_index + 1:
+                current = passage
+                continue
+            left, right = current.chunk["text"], passage.chunk["text"]
+            overlap = _overlap_length(left, right, settings.CONTEXT_MAX_OVERLAP)
+            current.chunk["text"] = left + right[overlap:]
+            current.last_index = passage.last_index
+            if passage.rank < current.rank:
+                # Le passage fusionné prend le rang (et la distance) du meilleur extrait
+                current.rank = passage.rank
+                if passage.chunk.get("distance") is not None:
+                    current.chunk["distance"] = passage.chunk["distance"]
+            passages.remove(passage)
+            merged += 1
+    passages.sort(key=lambda passage: passage.rank)
+
+    # 2. Passages quasi identiques: le moins pertinent est écarté, sauf s'il contient l'autre
+    threshold = settings.CONTEXT_DUPLICATE_THRESHOLD
+    kept: List[_Passage] = []
+    duplicates = 0
+    for passage in passages:
+        passage.shingles = _shingles(passage.chunk["text"])
+        duplicate = False
+        for position, existing in enumerate(kept):
+            if _contained(passage.shingles, existing.shingles, threshold):
+                duplicate = True
+                break
+            if _contained(existing.shingles, passage.shingles, threshold):
+                # Le nouveau passage englobe l'ancien: il le remplace à son rang
+                passage.rank = existing.rank
+                kept[position] = passage
+                duplicate = True
+                break
+        if duplicate:
+            duplicates += 1
+        else:
+            kept.append(passage)
+
+    assembled = [passage.chunk for passage in kept]
+    tokens_in = token_budget.estimate("".join(chunk["text"] for chunk in chunks))
+    tokens_out = token_budget.estimate("".join(chunk["text"] for chunk in assembled))
+    context_assembly_stats["calls"] += 1
+    context_assembly_stats["chunks_in"] += len(chunks)
+    context_assembly_stats["chunks_out"] += len(assembled)
+    context_assembly_stats["merged"] += merged
+    context_assembly_stats["duplicates"] += duplicates
+    context_assembly_stats["tokens_in"] += tokens_in
+    context_assembly_stats["tokens_saved"] += tokens_in - tokens_out
+    if merged or duplicates:
+        logger.info(
+            f"Context assembly: {len(chunks)} chunks -> {len(assembled)} passages "
+            f"({merged} merged, {duplicates} duplicates), ~{tokens_in - tokens_out} tokens saved"
+        )
+    return assembled
@@ -0,0 +1,76 @@
+import logging
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sélections, candidats, extraits retenus, documents couverts et choix bloqués par un quota
+diversity_stats = {"calls": 0, "candidates": 0, "selected": 0, "documents": 0, "quota_skips": 0}
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _document_of(chunk: Dict[str, Any]) -> Optional[str]:
+    metadata = chunk.get("metadata") or {}
+    document_id = metadata.get("document_id", chunk.get("document_id"))
+    return str(document_id) if document_id is not None else None
+
+
+def mmr_select(
+    chunks: List[Dict[str, Any]],
+    query_embedding: Sequence[float],
+    embeddings: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.5,
+    document_share: float = 1.0
+) -> List[Dict[str, Any]]:
+    """
+    Maximal marginal relevance: choisir `k` extraits pertinents pour la requête et différents
+    de ceux déjà choisis (λ·sim(requête) − (1−λ)·max sim(choisis)), avec au plus
+    ceil(`document_share` × k) extraits par document tant que d'autres documents ont des candidats.
+    Les similarités sont calculées en un seul produit matriciel; l'ordre de sélection est conservé.
+    """
+    if len(chunks) <= k:
+        return list(chunks)
+    vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+    relevance = vectors @ _normalize(np.asarray(query_embedding, dtype=np.float32))
+    similarity = vectors @ vectors.T
+
+    documents = [_document_of(chunk) for chunk in chunks]
+    # Indice du document de chaque candidat (-1: document inconnu, jamais limité)
+    document_codes: Dict[str, int] = {}
+    codes = np.array([
+        -1 if document is None else document_codes.setdefault(document, len(document_codes)) for document in documents
+    ])
+    per_document = np.zeros(len(document_codes) + 1, dtype=np.int32)
+    quota = max(1, math.ceil(document_share * k))
+    max_similarity = np.full(len(chunks), -np.inf, dtype=np.float32)
+    available = np.ones(len(chunks), dtype=bool)
+    selected: List[int] = []
+    quota_skips = 0
+
+    while len(selected) < k and available.any():
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        # Documents ayant atteint leur quota: écartés tant qu'il reste d'autres candidats
+        blocked = (codes >= 0) & (per_document[codes] >= quota)
+        if (available & ~blocked).any():
+            quota_skips += int((available & blocked).any())
+            scores = np.where(blocked, -np.inf, scores)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        per_document[codes[best]] += 1
+        max_similarity = np.maximum(max_similarity, similarity[best])
+
+    diversity_stats["calls"] += 1
+    diversity_stats["candidates"] += len(chunks)
+    diversity_stats["selected"] += len(selected)
+    diversity_stats["documents"] += len({documents[i] for i in selected})
+    diversity_stats["quota_skips"] += quota_skips
+    return [chunks[i] for i in selected]
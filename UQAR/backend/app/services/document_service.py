@@ -1,13 +1,7 @@
+import asyncio
 import os
 import uuid
 import logging
-# Import chromadb conditionally to avoid errors
-try:
-    import chromadb
-    CHROMADB_AVAILABLE = True
-except (ImportError, RuntimeError) as e:
-    logging.warning(f"ChromaDB not available: {e}")
-    CHROMADB_AVAILABLE = False
 from typing import List, Optional, Dict, Any
 from fastapi import UploadFile
 from sqlalchemy.orm import Session
@@ -15,6 +9,13 @@ from sqlalchemy.orm import Session
 from ..models.document import Document, DocumentStatus, DocumentType
 from ..models.section import Section
 from ..core.config import settings
+from .chroma_client import chroma_manager, ChromaUnavailableError
+from .numpy_store import numpy_store
+from .chroma_async import chroma_async
+from .embeddings import embedding_engine
+from .lexical_index import lexical_index
+from .relevance_gate import relevance_gate
+from .answer_cache import answer_cache
 
 logger = logging.getLogger(__name__)
 
@@ -29,26 +30,6 @@ class DocumentService:
         
         # Créer le répertoire d'upload s'il n'existe pas
         os.makedirs(self.upload_dir, exist_ok=True)
-        
-        # Only initialize ChromaDB if it's available
-        self.chroma_client = None
-        if CHROMADB_AVAILABLE:
-            try:
-                # Tenter d'initialiser ChromaDB HTTP
-                self.chroma_client = chromadb.HttpClient(
-                    host=settings.CHROMA_HOST,
-                    port=settings.CHROMA_PORT
-                )
-                logger.info("ChromaDB initialized as HttpClient")
-            except Exception as e:
-                logger.warning(f"Failed to initialize ChromaDB HttpClient: {e}")
-                # Fallback to PersistentClient
-                self.chroma_client = chromadb.PersistentClient(
-                    path=settings.CHROMA_PERSIST_DIRECTORY
-                )
-                logger.info("ChromaDB initialized as PersistentClient")
-        else:
-            logger.warning("ChromaDB is not available, document indexing features will be disabled")
     
     async def upload_document(self, file: UploadFile, section_id: int, user_id: int) -> Document:
         """
@@ -138,7 +119,7 @@ class DocumentService:
             
             # Vectoriser le document dans ChromaDB
             chunks = self._chunk_text(extracted_text)
-            self._vectorize_chunks(document, chunks)
+            await self._vectorize_chunks(document, chunks)
             
             # Mettre à jour le statut
             document.status = DocumentStatus.PROCESSED
@@ -181,7 +162,7 @@ class DocumentService:
             return document.file_path, document.original_filename
         return None
     
-    def delete_document(self, document_id: int, user_id: int) -> bool:
+    async def delete_document(self, document_id: int, user_id: int) -> bool:
         """
         Supprime un document et ses vecteurs
         """
@@ -203,16 +184,31 @@ class DocumentService:
                 logger.error(f"Erreur lors de la suppression du fichier {document.file_path}: {e}")
         
         # Supprimer les vecteurs de ChromaDB
-        if document.is_vectorized and self.chroma_client is not None:
+        if document.is_vectorized:
             try:
-                collection = self._get_chroma_collection(section.chroma_collection_name)
+                collection = await self._get_chroma_collection(section.chroma_collection_name)
                 if collection:
                     # Supprimer les vecteurs avec l'ID du document
-                    collection.delete(filter={"document_id": str(document.id)})
+                    await chroma_async.delete(collection, where={"document_id": str(document.id)})
                     logger.info(f"Vecteurs supprimés pour le document {document_id}")
+                    relevance_gate.invalidate(section.chroma_collection_name)
             except Exception as e:
                 logger.error(f"Erreur lors de la suppression des vecteurs du document {document_id}: {e}")
                 # Ne pas bloquer la suppression en cas d'erreur avec ChromaDB
+            if chroma_manager.mirror_enabled:
+                try:
+                    await asyncio.to_thread(
+                        numpy_store.delete, section.chroma_collection_name, where={"document_id": str(document.id)}
+                    )
+                except Exception as e:
+                    logger.error(f"Erreur lors de la suppression de la copie locale du document {document_id}: {e}")
+            try:
+                await asyncio.to_thread(lexical_index.delete_document, section.chroma_collection_name, document.id)
+            except Exception as e:
+                logger.error(f"Erreur lors de la suppression du document {document_id} de l'index lexical: {e}")
+        
+        # Les réponses en cache de la section ont pu s'appuyer sur ce document
+        answer_cache.invalidate(section.id)
         
         # Supprimer le document de la base de données
         self.db.delete(document)
@@ -331,7 +327,7 @@ class DocumentService:
         
         return chunks
     
-    def _vectorize_chunks(self, document: Document, chunks: List[str]) -> None:
+    async def _vectorize_chunks(self, document: Document, chunks: List[str]) -> None:
         """
         Vectorise les chunks dans ChromaDB
         """
@@ -339,10 +335,6 @@ class DocumentService:
             logger.warning(f"Aucun chunk à vectoriser pour le document {document.id}")
             return
             
-        if self.chroma_client is None:
-            logger.warning(f"ChromaDB client non initialisé, vectorisation impossible pour le document {document.id}")
-            return
-        
         try:
             # Récupérer la section pour obtenir le nom de la collection
             section = self.db.query(Section).filter(Section.id == document.section_id).first()
@@ -351,12 +343,14 @@ class DocumentService:
                 return
         
             # Récupérer ou créer la collection
-            collection = self._get_chroma_collection(section.chroma_collection_name)
+            collection = await self._get_chroma_collection(section.chroma_collection_name)
             
             # Vérifier si la collection est None (ChromaDB non disponible)
             if collection is None:
-                logger.warning(f"ChromaDB collection {section.chroma_collection_name} non disponible, vectorisation ignorée")
-                return
+                if not chroma_manager.mirror_enabled:
+                    logger.warning(f"ChromaDB collection {section.chroma_collection_name} non disponible, vectorisation ignorée")
+                    return
+                logger.warning(f"ChromaDB collection {section.chroma_collection_name} non disponible, vectorisation dans le magasin local seulement")
         
             # Préparer les données pour ChromaDB
             ids = [f"{document.id}_{i}" for i in range(len(chunks))]
@@ -369,59 +363,72 @@ class DocumentService:
             } for i in range(len(chunks))]
             
             # Vérifier si des chunks avec les mêmes IDs existent déjà
-            try:
-                existing_ids = collection.get(ids=ids, include=["documents"])
-                if existing_ids and "ids" in existing_ids and existing_ids["ids"]:
-                    logger.info(f"Suppression des chunks existants pour le document {document.id}")
-                    collection.delete(ids=ids)
-            except Exception as e:
-                logger.warning(f"Impossible de vérifier les chunks existants: {e}, continuons avec l'ajout")
+            if collection is not None:
+                try:
+                    existing_ids = await chroma_async.get(collection, ids=ids, include=[])
+                    if existing_ids and "ids" in existing_ids and existing_ids["ids"]:
+                        logger.info(f"Suppression des chunks existants pour le document {document.id}")
+                        await chroma_async.delete(collection, ids=ids)
+                except Exception as e:
+                    logger.warning(f"Impossible de vérifier les chunks existants: {e}, continuons avec l'ajout")
+            
+            # Embeddings calculés dans le processus, par lots (cache disque: un chunk déjà vu n'est pas recalculé)
+            embeddings = await embedding_engine.aembed(chunks)
+            if embeddings is None:
+                logger.warning(f"Aucun modèle d'embedding disponible, ChromaDB calculera les embeddings du document {document.id}")
             
             # Ajouter les chunks à ChromaDB, en lots si nécessaire
             batch_size = 100  # Réduire la taille des lots si nécessaire
-            for i in range(0, len(chunks), batch_size):
-                batch_ids = ids[i:i+batch_size]
-                batch_chunks = chunks[i:i+batch_size]
-                batch_metadatas = metadatas[i:i+batch_size]
+            if collection is not None:
+                for i in range(0, len(chunks), batch_size):
+                    batch_ids = ids[i:i+batch_size]
+                    batch_chunks = chunks[i:i+batch_size]
+                    batch_metadatas = metadatas[i:i+batch_size]
+                    batch_params = {"embeddings": embeddings[i:i+batch_size]} if embeddings is not None else {}
                 
+                    try:
+                        await chroma_async.add(
+                            collection,
+                            ids=batch_ids,
+                            documents=batch_chunks,
+                            metadatas=batch_metadatas,
+                            **batch_params
+                        )
+                        logger.info(f"Vectorisation réussie pour le lot {i//batch_size + 1}/{(len(chunks) + batch_size - 1)//batch_size} du document {document.id}")
+                    except Exception as batch_error:
+                        logger.error(f"Erreur lors de la vectorisation du lot {i//batch_size + 1}: {batch_error}")
+            
+            # Copie locale (magasin NumPy) servant les requêtes quand Chroma est injoignable
+            if chroma_manager.mirror_enabled and embeddings is not None:
                 try:
-                    collection.add(
-                        ids=batch_ids,
-                        documents=batch_chunks,
-                        metadatas=batch_metadatas
+                    await asyncio.to_thread(
+                        numpy_store.add, section.chroma_collection_name,
+                        ids=ids, documents=chunks, metadatas=metadatas, embeddings=embeddings
                     )
-                    logger.info(f"Vectorisation réussie pour le lot {i//batch_size + 1}/{(len(chunks) + batch_size - 1)//batch_size} du document {document.id}")
-                except Exception as batch_error:
-                    logger.error(f"Erreur lors de la vectorisation du lot {i//batch_size + 1}: {batch_error}")
+                except Exception as e:
+                    logger.error(f"Erreur lors de la copie locale des vecteurs du document {document.id}: {e}")
             
             logger.info(f"Vectorisation complétée pour le document {document.id} ({len(chunks)} chunks)")
+            try:
+                await asyncio.to_thread(lexical_index.add, section.chroma_collection_name, ids, chunks, metadatas)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'indexation lexicale du document {document.id}: {e}")
+            # Après l'index lexical: une réponse générée avant la fin de l'indexation reste périmée
+            answer_cache.invalidate(section.id)
+            relevance_gate.invalidate(section.chroma_collection_name)
         except Exception as e:
             logger.error(f"Erreur lors de la vectorisation dans ChromaDB: {e}")
             # Ne pas bloquer le traitement en cas d'erreur avec ChromaDB
     
-    def _get_chroma_collection(self, collection_name: str):
+    async def _get_chroma_collection(self, collection_name: str):
         """
-        Récupère ou crée une collection ChromaDB
+        Récupère ou crée une collection ChromaDB (handle partagé, en cache)
         """
-        if self.chroma_client is None:
-            logger.warning(f"ChromaDB client not initialized, cannot get collection {collection_name}")
-            return None
-            
         try:
-            # Vérifier si la collection existe
-            try:
-                collection = self.chroma_client.get_collection(name=collection_name)
-                logger.info(f"Collection ChromaDB {collection_name} récupérée avec succès")
-                return collection
-            except Exception as e:
-                logger.warning(f"Collection {collection_name} non trouvée, tentative de création: {e}")
-            # Tenter de créer la collection si elle n'existe pas
-            collection = self.chroma_client.create_collection(
-                name=collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
-            logger.info(f"Collection ChromaDB {collection_name} créée avec succès")
-            return collection
+            return await chroma_async.get_collection(collection_name, create=True)
+        except ChromaUnavailableError as e:
+            logger.warning(f"{e}, cannot get collection {collection_name}")
+            return None
         except Exception as e:
             logger.error(f"Impossible d'accéder ou de créer la collection {collection_name}: {e}")
             return None
@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from chromadb.utils import embedding_functions
+    CHROMADB_EMBEDDINGS_AVAILABLE = True
+except (ImportError, RuntimeError) as e:
+    logging.warning(f"ChromaDB embedding functions not available: {e}")
+    CHROMADB_EMBEDDINGS_AVAILABLE = False
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except (ImportError, RuntimeError):
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+_SPACES = re.compile(r"\s+")
+
+
+class Embedder(ABC):
+    """Modèle d'embedding en mémoire: `name` identifie les vecteurs produits (clé du cache)"""
+
+    name = "embedder"
+    dimension = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Un vecteur par texte, dans l'ordre"""
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """settings.EMBEDDING_MODEL chargé avec sentence-transformers (vecteurs normalisés)"""
+
+    def __init__(self, model_name: str):
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = model_name
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True, show_progress_bar=False)
+        return vectors.astype(np.float32).tolist()
+
+
+class ChromaDefaultEmbedder(Embedder):
+    """Fonction par défaut de Chroma (all-MiniLM-L6-v2 en ONNX), celle des collections existantes"""
+
+    name = "chroma-default/all-MiniLM-L6-v2"
+    dimension = 384
+
+    def __init__(self):
+        self.function = embedding_functions.DefaultEmbeddingFunction()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [list(map(float, vector)) for vector in self.function(texts)]
+
+
+class HashEmbedder(Embedder):
+    """
+    Embedder déterministe sans modèle (hachage signé des mots et bigrammes, normalisé):
+    mêmes textes, mêmes vecteurs, sur toute machine. Sert aux tests et au développement.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.name = f"hash-{dimension}"
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        words = _TOKEN.findall(text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text).tolist() for text in texts]
+
+
+class EmbeddingDiskCache:
+    """Vecteurs déjà calculés, sur disque (SQLite), par empreinte (modèle, texte)"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # Par paquets: limite du nombre de paramètres SQLite
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+            )
+            self._connection.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def normalize_query(text: str) -> str:
+    """Forme normalisée d'une question (casse, espaces): les variantes triviales partagent un embedding"""
+    return _SPACES.sub(" ", text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """Embeddings des questions récentes: LRU borné, entrées expirées après `ttl` secondes"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[List[float], float]]" = OrderedDict()
+        # Appelé depuis la boucle d'événements et depuis les threads de chroma_async
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, model: str, query: str, vector: List[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(model, query)] = (vector, time.time())
+            self._entries.move_to_end((model, query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, object]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
+
+
+def _build_embedder() -> Optional[Embedder]:
+    backend = settings.EMBEDDING_BACKEND
+    if backend == "hash":
+        return HashEmbedder(settings.EMBEDDING_DIMENSION)
+    if backend in ("auto", "sentence_transformers") and SENTENCE_TRANSFORMERS_AVAILABLE:
+        try:
+            return SentenceTransformerEmbedder(settings.EMBEDDING_MODEL)
+        except Exception as e:
+            logger.error(f"Could not load embedding model {settings.EMBEDDING_MODEL}: {e}")
+    elif backend == "sentence_transformers":
+        logger.warning("sentence-transformers is not installed; falling back to Chroma's default embedding function")
+    if CHROMADB_EMBEDDINGS_AVAILABLE:
+        try:
+            return ChromaDefaultEmbedder()
+        except Exception as e:
+            logger.error(f"Could not load default embedding function: {e}")
+    return None
+
+
+class EmbeddingEngine:
+    """
+    Calcul des embeddings dans le processus, par lots, derrière un cache disque: un extrait
+    déjà vu (ré-upload, réindexation) n'est jamais recalculé. Les questions, texte des
+    utilisateurs, ne sont gardées qu'en mémoire (LRU borné avec durée de vie).
+    """
+
+    def __init__(self, embedder: Optional[Embedder] = None, cache_path: Optional[str] = None):
+        self._embedder = embedder
+        self._loaded = embedder is not None
+        self._cache_path = cache_path if cache_path is not None else settings.EMBEDDING_CACHE_PATH
+        self._cache: Optional[EmbeddingDiskCache] = None
+        self._lock = threading.Lock()
+        self.batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        self.stats = {"texts": 0, "cache_hits": 0, "computed": 0, "batches": 0, "errors": 0}
+        # Compteurs mis à jour depuis la boucle d'événements et les threads de l'exécuteur
+        self._stats_lock = threading.Lock()
+        self.query_cache = QueryEmbeddingCache(settings.QUERY_EMBEDDING_CACHE_SIZE, settings.QUERY_EMBEDDING_CACHE_TTL)
+
+    @property
+    def embedder(self) -> Optional[Embedder]:
+        # Chargement paresseux: le modèle n'est lu qu'au premier besoin
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._embedder = _build_embedder()
+                    self._loaded = True
+                    if self._embedder is not None:
+                        logger.info(f"Embedding model: {self._embedder.name} ({self._embedder.dimension} dims)")
+        return self._embedder
+
+    @property
+    def cache(self) -> Optional[EmbeddingDiskCache]:
+        if self._cache is None and self._cache_path:
+            with self._lock:
+                if self._cache is None:
+                    try:
+                        self._cache = EmbeddingDiskCache(self._cache_path)
+                    except Exception as e:
+                        logger.error(f"Embedding cache disabled ({self._cache_path}): {e}")
+                        self._cache_path = None
+        return self._cache
+
+    @property
+    def model_name(self) -> Optional[str]:
+        embedder = self.embedder
+        return embedder.name if embedder is not None else None
+
+    def _count(self, **increments: int) -> None:
+        with self._stats_lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def embed(self, texts: List[str], persist: bool = True) -> Optional[List[List[float]]]:
+        """
+        Embeddings de `texts` (même ordre); None si aucun modèle n'est disponible.
+        Avec `persist=False`, le cache disque n'est ni lu ni écrit.
+        """
+        embedder = self.embedder
+        if embedder is None or not texts:
+            return None
+
+        keys = [EmbeddingDiskCache.key(embedder.name, text) for text in texts]
+        cache = self.cache if persist else None
+        vectors: Dict[str, List[float]] = cache.get_many(list(set(keys))) if cache is not None else {}
+        self._count(texts=len(texts), cache_hits=sum(1 for key in keys if key in vectors))
+
+        # Textes manquants, sans doublons, calculés par lots
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            missing_keys = list(missing)
+            computed: Dict[str, List[float]] = {}
+            batches = 0
+            try:
+                for start in range(0, len(missing_keys), self.batch_size):
+                    batch = missing_keys[start:start + self.batch_size]
+                    for key, vector in zip(batch, embedder.embed([missing[key] for key in batch])):
+                        computed[key] = vector
+                    batches += 1
+            except Exception as e:
+                self._count(batches=batches, errors=1)
+                logger.error(f"Error computing embeddings: {e}")
+                return None
+            self._count(batches=batches, computed=len(computed))
+            vectors.update(computed)
+            if cache is not None:
+                try:
+                    cache.put_many(computed)
+                except Exception as e:
+                    logger.warning(f"Could not persist embeddings: {e}")
+
+        return [vectors[key] for key in keys]
+
+    async def aembed(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """`embed` hors de la boucle d'événements (calcul CPU)"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed, texts)
+
+    def embed_query(self, text: str) -> Optional[List[float]]:
+        """Embedding d'une question, servi par le cache LRU quand elle a déjà été posée"""
+        embedder = self.embedder
+        if embedder is None:
+            return None
+        query = normalize_query(text)
+        vector = self.query_cache.get(embedder.name, query)
+        return vector if vector is not None else self._embed_new_query(embedder.name, query)
+
+    async def aembed_query(self, text: str) -> Optional[List[float]]:
+        """`embed_query` depuis la boucle: un succès du cache évite le passage par un thread"""
+        embedder = self.embedder
+        if embedder is None:
+            return None
+        query = normalize_query(text)
+        vector = self.query_cache.get(embedder.name, query)
+        if vector is not None:
+            return vector
+        return await asyncio.get_running_loop().run_in_executor(None, self._embed_new_query, embedder.name, query)
+
+    def _embed_new_query(self, model: str, query: str) -> Optional[List[float]]:
+        # Texte saisi par l'utilisateur: jamais écrit dans le cache disque, qui n'est pas borné
+        vectors = self.embed([query], persist=False)
+        if not vectors:
+            return None
+        self.query_cache.put(model, query, vectors[0])
+        return vectors[0]
+
+    def get_stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        hits, texts = stats["cache_hits"], stats["texts"]
+        return {
+            "model": self.model_name,
+            "cache_path": self._cache_path,
+            **stats,
+            "cache_hit_rate": round(hits / texts, 3) if texts else 0.0,
+            "query_cache": self.query_cache.get_stats(),
+        }
+
+
+# Instance globale du moteur d'embeddings
+embedding_engine = EmbeddingEngine()
+
+
+def embed_texts(texts: List[str]) -> Optional[List[List[float]]]:
+    """Calculer les embeddings de textes; None si aucun modèle n'est disponible"""
+    return embedding_engine.embed(texts)
@@ -1,43 +1,52 @@
 import logging
 import json
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, AsyncGenerator, Callable
 from sqlalchemy.orm import Session, joinedload
 
 from ..models import Exercise, Question, Section, Document
 from ..models.exercise import ExerciseStatus
-from ..services.ollama_service import OllamaService
+from ..core.config import settings
+from ..services.ollama_service import OllamaService, OllamaErrorMessage, PROMPT_TEMPLATE_TOKENS
+from .ollama_router import OllamaUnavailableError
 from ..services.chroma_service import ChromaService
-from ..schemas.exercise_schemas import QuestionType, DifficultyLevel
+from ..schemas.exercise_schemas import (
+    QuestionType, DifficultyLevel, QuestionInDB, question_list_json_schema, prompt_parameters_json_schema
+)
+from .json_stream import IncrementalJSONArrayParser
+from .token_budget import token_budget
+from .retrieval_policy import get_retrieval_policy
+from .context_assembly import assemble_context
+from .hybrid_retrieval import hybrid_search
+from .embeddings import embedding_engine
+from .diversity import mmr_select
 
 logger = logging.getLogger(__name__)
 
+# Réponses JSON du LLM: appels, échecs de génération et de parsing, nouvelles tentatives, repli
+structured_output_stats = {
+    "questions": {"calls": 0, "generation_failures": 0, "parse_failures": 0, "retries": 0, "fallbacks": 0},
+    "parameters": {"calls": 0, "generation_failures": 0, "parse_failures": 0, "retries": 0, "fallbacks": 0},
+}
+
+
+def get_structured_output_stats() -> Dict[str, Any]:
+    """Compteurs et taux d'échec/de relance de la génération JSON"""
+    stats: Dict[str, Any] = {"structured_output": settings.OLLAMA_STRUCTURED_OUTPUT}
+    for kind, counts in structured_output_stats.items():
+        calls = counts["calls"]
+        stats[kind] = {
+            **counts,
+            "parse_failure_rate": round(counts["parse_failures"] / calls, 3) if calls else 0.0,
+            "retry_rate": round(counts["retries"] / calls, 3) if calls else 0.0,
+        }
+    return stats
+
 
 class ExerciseGenerationService:
     """Service pour la génération automatique d'exercices"""
     
     def __init__(self):
         self.ollama_service = OllamaService()
-        # Initialize ChromaDB client if available
-        self.chroma_client = None
-        try:
-            import chromadb
-            # Try different initialization methods
-            try:
-                self.chroma_client = chromadb.HttpClient(
-                    host="localhost",
-                    port=8001
-                )
-                logger.info("ChromaDB HttpClient initialized successfully")
-            except Exception as e:
-                logger.warning(f"Failed to initialize ChromaDB HttpClient: {e}")
-                # Try PersistentClient
-                try:
-                    self.chroma_client = chromadb.PersistentClient(path="./chroma_data")
-                    logger.info("ChromaDB PersistentClient initialized successfully")
-                except Exception as e2:
-                    logger.error(f"Failed to initialize ChromaDB PersistentClient: {e2}")
-        except (ImportError, RuntimeError) as e:
-            logger.warning(f"ChromaDB not available: {e}. Will use document text directly")
         
     async def generate_exercises(
         self,
@@ -105,7 +114,8 @@ class ExerciseGenerationService:
                 num_questions=num_questions,
                 difficulty=difficulty,
                 exercise_type=exercise_type,
-                section_name=section.name
+                section_name=section.name,
+                section_id=section.id
             )
             
             logger.info(f"Generated {len(questions)} questions")
@@ -218,7 +228,10 @@ class ExerciseGenerationService:
                 content_chunks=content_chunks,
                 custom_prompt=custom_prompt,
                 temp_content=temp_content,
-                section_name=section.name
+                section_name=section.name,
+                section_id=section.id,
+                collection_name=section.chroma_collection_name,
+                document_ids=use_specific_documents
             )
             
             logger.info(f"Generated {len(questions)} questions using advanced mode")
@@ -264,6 +277,193 @@ class ExerciseGenerationService:
                 exercise.status = ExerciseStatus.PENDING  # Set to pending even on error
                 db.commit()
             raise
+
+    async def generate_exercises_stream(
+        self,
+        db: Session,
+        section_id: int,
+        num_questions: int = 5,
+        difficulty: DifficultyLevel = DifficultyLevel.MEDIUM,
+        exercise_type: QuestionType = QuestionType.MCQ,
+        use_specific_documents: Optional[List[int]] = None,
+        custom_prompt: Optional[str] = None,
+        temp_content: Optional[str] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Générer un exercice en streaming (mode simple ou avancé si custom_prompt).
+        Chaque question est parsée dès que son objet JSON se ferme, enregistrée, puis renvoyée.
+        Événements: exercise (créé), question (enregistrée), done.
+        """
+        
+        advanced = bool(custom_prompt)
+        logger.info(f"Starting streamed exercise generation for section {section_id} (advanced={advanced})")
+        
+        if advanced:
+            generation_params = {
+                "mode": "advanced",
+                "custom_prompt": custom_prompt,
+                "temp_content": temp_content[:500] if temp_content else None,
+                "use_specific_documents": use_specific_documents
+            }
+        else:
+            generation_params = {
+                "num_questions": num_questions,
+                "difficulty": difficulty.value,
+                "exercise_type": exercise_type.value,
+                "use_specific_documents": use_specific_documents
+            }
+        exercise = Exercise(
+            section_id=section_id,
+            status=ExerciseStatus.GENERATING,
+            generation_params=generation_params
+        )
+        db.add(exercise)
+        db.commit()
+        db.refresh(exercise)
+        logger.info(f"Created exercise with ID {exercise.id}")
+        yield {"type": "exercise", "exercise_id": exercise.id}
+        
+        try:
+            section = db.query(Section).filter(Section.id == section_id).first()
+            if not section:
+                raise ValueError(f"Section {section_id} not found")
+            
+            content_chunks = await self._get_relevant_content(
+                section=section,
+                db=db,
+                num_chunks=20 if advanced else num_questions * 3,
+                specific_document_ids=use_specific_documents
+            )
+            if not content_chunks:
+                content_chunks = await self._get_content_from_documents(
+                    section=section,
+                    db=db,
+                    specific_document_ids=use_specific_documents
+                )
+            if not content_chunks:
+                raise ValueError("No content found for exercise generation")
+            
+            if advanced:
+                generation = await self._prepare_advanced_generation(
+                    content_chunks=content_chunks,
+                    custom_prompt=custom_prompt,
+                    temp_content=temp_content,
+                    section_name=section.name,
+                    section_id=section.id,
+                    collection_name=section.chroma_collection_name,
+                    document_ids=use_specific_documents
+                )
+            else:
+                system_prompt = self._build_system_prompt(exercise_type, difficulty, section.name)
+                content_text = self._pack_content(
+                    [chunk["text"] for chunk in content_chunks[:10]],
+                    system_prompt,
+                    lambda text: self._build_user_prompt(
+                        content_text=text,
+                        num_questions=num_questions,
+                        exercise_type=exercise_type,
+                        difficulty=difficulty
+                    )
+                )
+                generation = {
+                    "system_prompt": system_prompt,
+                    "user_prompt": self._build_user_prompt(
+                        content_text=content_text,
+                        num_questions=num_questions,
+                        exercise_type=exercise_type,
+                        difficulty=difficulty
+                    ),
+                    "exercise_type": exercise_type,
+                    "num_questions": num_questions
+                }
+            exercise_type = generation["exercise_type"]
+            num_questions = generation["num_questions"]
+            
+            stats = structured_output_stats["questions"]
+            stats["calls"] += 1
+            parser = IncrementalJSONArrayParser()
+            saved = 0
+            
+            chunks = self.ollama_service.generate_streaming_response(
+                prompt=generation["user_prompt"],
+                system_prompt=generation["system_prompt"],
+                task="exercise",
+                section_id=section.id,
+                json_schema=(
+                    question_list_json_schema(exercise_type, num_questions)
+                    if settings.OLLAMA_STRUCTURED_OUTPUT else None
+                )
+            )
+            try:
+                async for chunk in chunks:
+                    for item in parser.feed(chunk):
+                        question_data = self._validate_question(item, exercise_type)
+                        if question_data is None or saved >= num_questions:
+                            continue
+                        question = self._save_question(db, exercise, question_data, exercise_type, saved, advanced)
+                        saved += 1
+                        yield {"type": "question", "index": saved - 1, "question": QuestionInDB.from_orm(question).model_dump(mode="json")}
+                    if parser.finished or saved >= num_questions:
+                        break
+            finally:
+                # Arrêter la génération en amont si on sort avant la fin du flux
+                await chunks.aclose()
+            
+            logger.info(f"Streamed {saved} questions for exercise {exercise.id} ({parser.errors} malformed)")
+            
+            if saved == 0:
+                stats["parse_failures"] += 1
+                stats["fallbacks"] += 1
+                fallback = (
+                    self._get_fallback_questions_advanced(custom_prompt) if advanced
+                    else self._get_fallback_questions(num_questions, exercise_type)
+                )
+                for question_data in fallback:
+                    question = self._save_question(db, exercise, question_data, exercise_type, saved, advanced)
+                    saved += 1
+                    yield {"type": "question", "index": saved - 1, "fallback": True, "question": QuestionInDB.from_orm(question).model_dump(mode="json")}
+            
+            exercise.status = ExerciseStatus.PENDING
+            exercise.source_documents = [doc.get("document_id") for doc in content_chunks if "document_id" in doc]
+            db.commit()
+            yield {"type": "done", "exercise_id": exercise.id, "num_questions": saved}
+            
+        except Exception as e:
+            logger.error(f"Error in streamed exercise generation: {e}", exc_info=True)
+            raise
+        finally:
+            # Erreur ou client parti: les questions déjà reçues restent, l'exercice redevient éditable
+            if exercise.status == ExerciseStatus.GENERATING:
+                exercise.status = ExerciseStatus.PENDING
+                db.commit()
+
+    def _save_question(
+        self,
+        db: Session,
+        exercise: Exercise,
+        question_data: Dict,
+        exercise_type: QuestionType,
+        order_index: int,
+        advanced: bool = False
+    ) -> Question:
+        """Enregistrer une question générée dès son arrivée"""
+        
+        question = Question(
+            exercise_id=exercise.id,
+            text=question_data.get("text", ""),
+            question_type=question_data.get("question_type", exercise_type.value) if advanced else exercise_type.value,
+            options=question_data.get("options"),
+            correct_answer=question_data.get("correct_answer"),
+            expected_keywords=question_data.get("expected_keywords"),
+            explanation=question_data.get("explanation"),
+            points=question_data.get("points", 1),
+            order_index=order_index
+        )
+        db.add(question)
+        db.commit()
+        db.refresh(question)
+        logger.info(f"Saved question {order_index + 1}: {question.text[:50]}...")
+        return question
             
     async def _get_relevant_content(
         self,
@@ -272,54 +472,41 @@ class ExerciseGenerationService:
         num_chunks: int = 15,
         specific_document_ids: Optional[List[int]] = None
     ) -> List[Dict]:
-        """Récupérer le contenu pertinent depuis ChromaDB"""
+        """Récupérer le contenu pertinent depuis ChromaDB (au plus `num_chunks`, top-k adaptatif)"""
         
         logger.info(f"Attempting to get content from ChromaDB for section {section.id}")
         
-        if not self.chroma_client:
-            logger.warning("ChromaDB client not initialized")
+        if not section.chroma_collection_name:
+            logger.warning(f"Section {section.id} has no chroma_collection_name")
             return []
-            
+        
         try:
-            # Get collection
-            collection = None
-            if section.chroma_collection_name:
-                try:
-                    collection = self.chroma_client.get_collection(name=section.chroma_collection_name)
-                    logger.info(f"Got ChromaDB collection: {section.chroma_collection_name}")
-                except Exception as e:
-                    logger.error(f"Failed to get collection {section.chroma_collection_name}: {e}")
-                    return []
-            else:
-                logger.warning(f"Section {section.id} has no chroma_collection_name")
-                return []
-                
-            # Query the collection
-            if specific_document_ids:
-                # Query with document filter
-                where_clause = {"document_id": {"$in": [str(doc_id) for doc_id in specific_document_ids]}}
-                results = collection.query(
-                    query_texts=[section.name + " " + (section.description or "")],
-                    n_results=num_chunks,
-                    where=where_clause
-                )
-            else:
-                # General query
-                results = collection.query(
-                    query_texts=[section.name + " " + (section.description or "")],
-                    n_results=num_chunks
-                )
-                
+            # Recherche hybride (vectorielle + BM25) sur le thème de la section; avec MMR, un
+            # ensemble plus large de candidats dans lequel choisir des extraits variés
+            query_text = section.name + " " + (section.description or "")
+            pool_size = num_chunks * settings.EXERCISE_MMR_POOL_FACTOR if settings.EXERCISE_MMR_ENABLED else num_chunks
+            policy = get_retrieval_policy("exercise", max_k=pool_size)
+            result = await hybrid_search(
+                section.chroma_collection_name,
+                query_text,
+                policy,
+                document_ids=specific_document_ids or None
+            )
+            candidates = result.chunks
+            if len(candidates) > num_chunks:
+                candidates = await self._select_diverse(candidates, query_text, result.query_embedding, num_chunks)
+            
             # Format results
-            chunks = []
-            if results and results.get("documents") and results["documents"][0]:
-                for i, doc in enumerate(results["documents"][0]):
-                    chunk = {
-                        "text": doc,
-                        "metadata": results["metadatas"][0][i] if results.get("metadatas") else {},
-                        "document_id": results["metadatas"][0][i].get("document_id") if results.get("metadatas") else None
-                    }
-                    chunks.append(chunk)
+            chunks = [
+                {
+                    "text": chunk["text"],
+                    "metadata": chunk["metadata"],
+                    "document_id": chunk["metadata"].get("document_id"),
+                    "distance": chunk["distance"]
+                }
+                for chunk in candidates
+            ]
+            chunks = assemble_context(chunks)
                     
             logger.info(f"Retrieved {len(chunks)} chunks from ChromaDB")
             return chunks
@@ -328,6 +515,35 @@ class ExerciseGenerationService:
             logger.error(f"Error getting content from ChromaDB: {e}", exc_info=True)
             return []
             
+    async def _select_diverse(
+        self,
+        chunks: List[Dict],
+        query_text: str,
+        query_embedding: Optional[List[float]],
+        num_chunks: int
+    ) -> List[Dict]:
+        """Choisir `num_chunks` extraits par MMR avec quotas par document (les plus proches sans modèle d'embedding)"""
+        texts = [chunk["text"] for chunk in chunks]
+        # Vecteurs des chunks: cache disque du moteur (calculés à la vectorisation)
+        embeddings = await embedding_engine.aembed(texts)
+        if query_embedding is None:
+            query_embedding = await embedding_engine.aembed_query(query_text)
+        if embeddings is None or query_embedding is None:
+            return chunks[:num_chunks]
+        selected = mmr_select(
+            chunks,
+            query_embedding,
+            embeddings,
+            num_chunks,
+            lambda_mult=settings.EXERCISE_MMR_LAMBDA,
+            document_share=settings.EXERCISE_MMR_DOCUMENT_SHARE
+        )
+        logger.info(
+            f"MMR selected {len(selected)} of {len(chunks)} candidates from "
+            f"{len({(chunk.get('metadata') or {}).get('document_id') for chunk in selected})} documents"
+        )
+        return selected
+
     async def _get_content_from_documents(
         self,
         section: Section,
@@ -354,18 +570,19 @@ class ExerciseGenerationService:
             if doc.extracted_text:
                 # Split text into chunks
                 text_chunks = self._chunk_text(doc.extracted_text)
-                for chunk_text in text_chunks[:3]:  # Take first 3 chunks per document
+                for chunk_index, chunk_text in enumerate(text_chunks[:3]):  # Take first 3 chunks per document
                     chunks.append({
                         "text": chunk_text,
                         "document_id": str(doc.id),
                         "metadata": {
                             "document_id": str(doc.id),
-                            "filename": doc.original_filename
+                            "filename": doc.original_filename,
+                            "chunk_index": chunk_index
                         }
                     })
                     
         logger.info(f"Created {len(chunks)} chunks from document texts")
-        return chunks
+        return assemble_context(chunks)
         
     def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
         """Split text into chunks"""
@@ -387,18 +604,25 @@ class ExerciseGenerationService:
         num_questions: int,
         difficulty: DifficultyLevel,
         exercise_type: QuestionType,
-        section_name: str
+        section_name: str,
+        section_id: Optional[int] = None
     ) -> List[Dict]:
         """Générer les questions en utilisant Ollama"""
         
         logger.info(f"Generating {num_questions} {exercise_type.value} questions")
         
-        # Prepare content for generation
-        content_text = "\n\n".join([chunk["text"] for chunk in content_chunks[:10]])  # Limit content size
-        logger.info(f"Using {len(content_text)} characters of content for generation")
-        
-        # Build the generation prompt
+        # Build the generation prompt, content limited to the task's token budget
         system_prompt = self._build_system_prompt(exercise_type, difficulty, section_name)
+        content_text = self._pack_content(
+            [chunk["text"] for chunk in content_chunks[:10]],
+            system_prompt,
+            lambda text: self._build_user_prompt(
+                content_text=text,
+                num_questions=num_questions,
+                exercise_type=exercise_type,
+                difficulty=difficulty
+            )
+        )
         user_prompt = self._build_user_prompt(
             content_text=content_text,
             num_questions=num_questions,
@@ -409,18 +633,16 @@ class ExerciseGenerationService:
         try:
             # Generate with Ollama
             logger.info("Calling Ollama to generate questions...")
-            response = await self.ollama_service.generate_response(
-                prompt=user_prompt,
-                system_prompt=system_prompt
+            questions = await self._generate_question_list(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                exercise_type=exercise_type,
+                num_questions=num_questions,
+                section_id=section_id
             )
-            
-            logger.info(f"Ollama response received (length: {len(response)})")
-            logger.debug(f"Ollama response: {response[:500]}...")
-            
-            # Parse the response
-            questions = self._parse_generated_questions(response, exercise_type)
-            
-            logger.info(f"Parsed {len(questions)} questions from Ollama response")
+            if not questions:
+                structured_output_stats["questions"]["fallbacks"] += 1
+                return self._get_fallback_questions(num_questions, exercise_type)
             
             # Ensure we have the requested number of questions
             if len(questions) < num_questions:
@@ -428,11 +650,77 @@ class ExerciseGenerationService:
                 
             return questions[:num_questions]
             
+        except OllamaUnavailableError:
+            # Tous les nœuds hors service: l'API répond 503 plutôt que des questions génériques
+            raise
         except Exception as e:
             logger.error(f"Error generating questions with Ollama: {e}", exc_info=True)
             # Return fallback questions
+            structured_output_stats["questions"]["fallbacks"] += 1
             return self._get_fallback_questions(num_questions, exercise_type)
+
+    async def _generate_question_list(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        exercise_type: QuestionType,
+        num_questions: int,
+        section_id: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Appeler Ollama et parser le tableau de questions. En sortie structurée, le schéma
+        dérivé de QuestionBase garantit un JSON valide; sinon on extrait le JSON du texte.
+        Relance jusqu'à EXERCISE_GENERATION_RETRIES fois si la réponse n'est pas exploitable;
+        un échec de la génération elle-même (OllamaErrorMessage) n'est pas relancé.
+        """
+        stats = structured_output_stats["questions"]
+        json_schema = (
+            question_list_json_schema(exercise_type, num_questions)
+            if settings.OLLAMA_STRUCTURED_OUTPUT else None
+        )
+
+        attempts = 1 + max(0, settings.EXERCISE_GENERATION_RETRIES)
+        for attempt in range(attempts):
+            if attempt:
+                stats["retries"] += 1
+                logger.warning(f"Retrying question generation ({attempt}/{attempts - 1})")
+            stats["calls"] += 1
+
+            response = await self.ollama_service.generate_response(
+                prompt=user_prompt,
+                system_prompt=system_prompt,
+                task="exercise",
+                section_id=section_id,
+                json_schema=json_schema
+            )
+            if isinstance(response, OllamaErrorMessage):
+                # Nœud en erreur ou délai dépassé: une relance immédiate échouerait de la même façon
+                stats["generation_failures"] += 1
+                logger.warning(f"Question generation failed, not retrying: {response}")
+                return []
+            logger.info(f"Ollama response received (length: {len(response)})")
+            logger.debug(f"Ollama response: {response[:500]}...")
+
+            questions = self._parse_generated_questions(response, exercise_type)
+            logger.info(f"Parsed {len(questions)} questions from Ollama response")
+            if questions:
+                return questions
+            stats["parse_failures"] += 1
+
+        return []
             
+    def _pack_content(self, texts: List[str], system_prompt: str, build_user_prompt: Callable[[str], str]) -> str:
+        """
+        Joindre les extraits (triés par pertinence) qui tiennent dans le budget de tokens de la
+        génération, une fois comptés le prompt système et le prompt utilisateur sans contenu
+        """
+        model = token_budget.model_for("exercise")
+        budget = token_budget.available("exercise", system_prompt, build_user_prompt(""), model=model)
+        packed = token_budget.pack(texts, budget - PROMPT_TEMPLATE_TOKENS, item_overhead=1, model=model)
+        token_budget.record_packing("exercise", packed)
+        logger.info(f"Using ~{packed.tokens} tokens of content ({len(packed.texts)}/{len(texts)} chunks) for generation")
+        return "\n\n".join(packed.texts)
+
     def _build_system_prompt(self, exercise_type: QuestionType, difficulty: DifficultyLevel, section_name: str) -> str:
         """Construire le prompt système pour la génération"""
         
@@ -522,29 +810,28 @@ Génère les {num_questions} questions maintenant:"""
             # Clean the response
             response = response.strip()
             
-            # Try to extract JSON from the response
-            json_start = response.find('[')
-            json_end = response.rfind(']') + 1
+            questions = None
+            if response.startswith('['):
+                # Sortie structurée: le JSON est la réponse entière
+                try:
+                    questions = json.loads(response)
+                except json.JSONDecodeError:
+                    questions = None
             
-            if json_start >= 0 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                questions = json.loads(json_str)
-                
+            if questions is None:
+                # Try to extract JSON from the response
+                json_start = response.find('[')
+                json_end = response.rfind(']') + 1
+                if json_start >= 0 and json_end > json_start:
+                    questions = json.loads(response[json_start:json_end])
+            
+            if isinstance(questions, list):
                 # Validate and clean questions
                 valid_questions = []
                 for q in questions:
-                    if isinstance(q, dict) and 'text' in q:
-                        # Ensure required fields based on type
-                        if exercise_type == QuestionType.MCQ:
-                            if 'options' in q and 'correct_answer' in q:
-                                valid_questions.append(q)
-                        elif exercise_type == QuestionType.OPEN_ENDED:
-                            if 'expected_keywords' not in q:
-                                q['expected_keywords'] = []
-                            valid_questions.append(q)
-                        else:
-                            if 'correct_answer' in q:
-                                valid_questions.append(q)
+                    q = self._validate_question(q, exercise_type)
+                    if q is not None:
+                        valid_questions.append(q)
                                 
                 return valid_questions
                 
@@ -553,6 +840,25 @@ Génère les {num_questions} questions maintenant:"""
             logger.debug(f"Response was: {response}")
             
         return []
+
+    def _validate_question(self, q: Any, exercise_type: QuestionType) -> Optional[Dict]:
+        """Vérifier les champs requis d'une question selon son type (None si inutilisable)"""
+        
+        if not isinstance(q, dict) or 'text' not in q:
+            return None
+        
+        # Ensure required fields based on type
+        if exercise_type == QuestionType.MCQ:
+            if 'options' in q and 'correct_answer' in q:
+                return q
+        elif exercise_type == QuestionType.OPEN_ENDED:
+            if 'expected_keywords' not in q:
+                q['expected_keywords'] = []
+            return q
+        else:
+            if 'correct_answer' in q:
+                return q
+        return None
         
     def _get_fallback_questions(self, num_questions: int, exercise_type: QuestionType) -> List[Dict]:
         """Générer des questions de secours en cas d'échec"""
@@ -592,42 +898,107 @@ Génère les {num_questions} questions maintenant:"""
         content_chunks: List[Dict],
         custom_prompt: str,
         temp_content: Optional[str] = None,
-        section_name: str = "cours"
+        section_name: str = "cours",
+        section_id: Optional[int] = None,
+        collection_name: Optional[str] = None,
+        document_ids: Optional[List[int]] = None
     ) -> List[Dict]:
         """Générer les questions en mode avancé avec un agent extracteur en deux étapes"""
         
+        generation = await self._prepare_advanced_generation(
+            content_chunks=content_chunks,
+            custom_prompt=custom_prompt,
+            temp_content=temp_content,
+            section_name=section_name,
+            section_id=section_id,
+            collection_name=collection_name,
+            document_ids=document_ids
+        )
+        system_prompt = generation["system_prompt"]
+        user_prompt = generation["user_prompt"]
+        exercise_type = generation["exercise_type"]
+        num_questions = generation["num_questions"]
+        
+        try:
+            # Generate with Ollama using the basic mode logic
+            logger.info("Calling Ollama to generate questions with extracted parameters...")
+            questions = await self._generate_question_list(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                exercise_type=exercise_type,
+                num_questions=num_questions,
+                section_id=section_id
+            )
+            
+            logger.info(f"Parsed {len(questions)} questions from advanced mode response")
+            if not questions:
+                structured_output_stats["questions"]["fallbacks"] += 1
+                return self._get_fallback_questions(num_questions, exercise_type)
+            
+            return questions
+            
+        except OllamaUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating questions with extracted parameters: {e}", exc_info=True)
+            # Return fallback questions
+            structured_output_stats["questions"]["fallbacks"] += 1
+            return self._get_fallback_questions(num_questions, exercise_type)
+    
+    async def _prepare_advanced_generation(
+        self,
+        content_chunks: List[Dict],
+        custom_prompt: str,
+        temp_content: Optional[str] = None,
+        section_name: str = "cours",
+        section_id: Optional[int] = None,
+        collection_name: Optional[str] = None,
+        document_ids: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        """Mode avancé: extraire les paramètres du prompt et construire les prompts de génération"""
+        
         logger.info(f"Starting advanced generation with custom prompt (length: {len(custom_prompt)})")
         
         # ÉTAPE 1: Extraction des paramètres via l'agent extracteur
-        params = await self._extract_prompt_parameters(custom_prompt)
+        params = await self._extract_prompt_parameters(custom_prompt, section_id=section_id)
         logger.info(f"Extracted parameters: {params}")
         
         # ÉTAPE 2: Prepare content for generation
         if temp_content:
             # Si on a un contenu temporaire, on l'utilise comme source principale
-            content_text = temp_content
+            content_texts = [temp_content]
             logger.info(f"Using temporary content ({len(temp_content)} chars) as primary source")
         else:
             # Sinon on utilise le contenu de la section, filtré par sujet si spécifié
-            content_text = "\n\n".join([chunk["text"] for chunk in content_chunks[:15]])
+            content_texts = [chunk["text"] for chunk in content_chunks[:15]]
             
             # Si un sujet spécifique est mentionné, on filtre le contenu
             if params["sujet"] != "contenu du cours":
-                sujet_keywords = params["sujet"].lower().split()
-                # Filtrer les chunks qui contiennent les mots-clés du sujet
                 filtered_chunks = []
-                for chunk in content_chunks:
-                    chunk_text_lower = chunk["text"].lower()
-                    if any(keyword in chunk_text_lower for keyword in sujet_keywords):
-                        filtered_chunks.append(chunk)
+                if collection_name:
+                    # Recherche hybride sur le sujet dans toute la section (termes exacts via BM25)
+                    result = await hybrid_search(
+                        collection_name,
+                        params["sujet"],
+                        get_retrieval_policy("exercise", max_k=10),
+                        document_ids=document_ids or None
+                    )
+                    filtered_chunks = assemble_context(result.chunks)
+                if not filtered_chunks:
+                    # Contenu lu directement dans les documents (sans index): filtre par mots-clés
+                    sujet_keywords = params["sujet"].lower().split()
+                    filtered_chunks = [
+                        chunk for chunk in content_chunks
+                        if any(keyword in chunk["text"].lower() for keyword in sujet_keywords)
+                    ]
                 
                 if filtered_chunks:
-                    content_text = "\n\n".join([chunk["text"] for chunk in filtered_chunks[:10]])
+                    content_texts = [chunk["text"] for chunk in filtered_chunks[:10]]
                     logger.info(f"Filtered content for subject '{params['sujet']}': {len(filtered_chunks)} relevant chunks")
                 else:
                     logger.warning(f"No content found for subject '{params['sujet']}', using all content")
             
-            logger.info(f"Using section content ({len(content_text)} chars) for advanced generation")
+            logger.info(f"Using section content ({len(content_texts)} chunks) for advanced generation")
         
         # ÉTAPE 3: Générer avec les paramètres extraits en utilisant le mode basique
         from ..schemas.exercise_schemas import QuestionType, DifficultyLevel
@@ -654,6 +1025,17 @@ Génère les {num_questions} questions maintenant:"""
         
         # Utiliser la logique du mode basique mais avec un prompt adapté au sujet
         system_prompt = self._build_system_prompt(exercise_type, difficulty, section_name)
+        content_text = self._pack_content(
+            content_texts,
+            system_prompt,
+            lambda text: self._build_user_prompt_with_subject(
+                content_text=text,
+                num_questions=num_questions,
+                exercise_type=exercise_type,
+                difficulty=difficulty,
+                subject=params["sujet"]
+            )
+        )
         user_prompt = self._build_user_prompt_with_subject(
             content_text=content_text,
             num_questions=num_questions,
@@ -662,29 +1044,13 @@ Génère les {num_questions} questions maintenant:"""
             subject=params["sujet"]
         )
         
-        try:
-            # Generate with Ollama using the basic mode logic
-            logger.info("Calling Ollama to generate questions with extracted parameters...")
-            response = await self.ollama_service.generate_response(
-                prompt=user_prompt,
-                system_prompt=system_prompt
-            )
-            
-            logger.info(f"Ollama response received for advanced mode (length: {len(response)})")
-            logger.debug(f"Ollama response: {response[:500]}...")
-            
-            # Parse the response using basic mode logic
-            questions = self._parse_generated_questions(response, exercise_type)
-            
-            logger.info(f"Parsed {len(questions)} questions from advanced mode response")
-            
-            return questions
-            
-        except Exception as e:
-            logger.error(f"Error generating questions with extracted parameters: {e}", exc_info=True)
-            # Return fallback questions
-            return self._get_fallback_questions(num_questions, exercise_type)
-    
+        return {
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "exercise_type": exercise_type,
+            "num_questions": num_questions
+        }
+        
     def _build_system_prompt_advanced(self, section_name: str) -> str:
         """Construire le prompt système pour le mode avancé"""
         
@@ -858,7 +1224,7 @@ Génère maintenant les exercices selon les instructions de l'enseignant:"""
         
         return fallback_questions
             
-    async def _extract_prompt_parameters(self, custom_prompt: str) -> Dict[str, Any]:
+    async def _extract_prompt_parameters(self, custom_prompt: str, section_id: Optional[int] = None) -> Dict[str, Any]:
         """Extraire les paramètres du prompt personnalisé via un agent LLM"""
         
         logger.info(f"Extracting parameters from custom prompt: {custom_prompt[:100]}...")
@@ -898,15 +1264,24 @@ Exemples:
 
 Analyse maintenant:"""
         
+        stats = structured_output_stats["parameters"]
         try:
+            stats["calls"] += 1
             response = await self.ollama_service.generate_response(
                 prompt=user_prompt,
-                system_prompt=system_prompt
+                system_prompt=system_prompt,
+                task="param_extraction",
+                section_id=section_id,
+                json_schema=prompt_parameters_json_schema() if settings.OLLAMA_STRUCTURED_OUTPUT else None
             )
             
+            if isinstance(response, OllamaErrorMessage):
+                stats["generation_failures"] += 1
+                stats["fallbacks"] += 1
+                return self._extract_parameters_fallback(custom_prompt)
             logger.info(f"Parameter extraction response: {response[:200]}...")
             
-            # Parse la réponse JSON
+            # Parse la réponse JSON (la réponse entière en sortie structurée)
             json_start = response.find('{')
             json_end = response.rfind('}') + 1
             
@@ -942,11 +1317,16 @@ Analyse maintenant:"""
                 
                 logger.info(f"Extracted parameters: {cleaned_params}")
                 return cleaned_params
-                
+            
+            stats["parse_failures"] += 1
+        except json.JSONDecodeError as e:
+            stats["parse_failures"] += 1
+            logger.error(f"Failed to parse extracted parameters: {e}")
         except Exception as e:
             logger.error(f"Error extracting parameters: {e}")
         
         # Fallback: analyse simple par mots-clés
+        stats["fallbacks"] += 1
         return self._extract_parameters_fallback(custom_prompt)
     
     def _extract_parameters_fallback(self, custom_prompt: str) -> Dict[str, Any]:
@@ -1082,7 +1462,9 @@ class ExerciseFeedbackService:
         self,
         question: Question,
         student_answer: str,
-        is_correct: bool
+        is_correct: bool,
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None
     ) -> str:
         """Générer un feedback pédagogique pour une réponse d'étudiant"""
         
@@ -1123,7 +1505,10 @@ Fournis un feedback pédagogique (3-4 phrases) qui:
         try:
             feedback = await self.ollama_service.generate_response(
                 prompt=user_prompt,
-                system_prompt=system_prompt
+                system_prompt=system_prompt,
+                task="feedback",
+                user_id=user_id,
+                section_id=section_id
             )
             return feedback.strip()
         except Exception as e:
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..core.config import settings
+from .chroma_client import chroma_manager, ChromaUnavailableError
+from .chroma_async import chroma_async
+from .embeddings import embedding_engine
+from .lexical_index import lexical_index
+from .reranker import reranker
+from .retrieval_policy import RetrievalPolicy
+
+logger = logging.getLogger(__name__)
+
+# Requêtes, extraits de chaque recherche, extraits apportés par le seul BM25, échecs du côté vectoriel,
+# requêtes servies par la copie locale (magasin NumPy) pendant une panne de Chroma
+hybrid_stats = {
+    "queries": 0, "vector_hits": 0, "lexical_hits": 0, "lexical_only": 0,
+    "vector_failures": 0, "lexical_failures": 0, "fallback_queries": 0,
+}
+
+
+@dataclass
+class HybridResult:
+    """Extraits fusionnés (meilleur d'abord) et résultat brut de la recherche vectorielle"""
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    distances: List[float] = field(default_factory=list)  # distances gardées par la politique (côté vectoriel)
+    query_embedding: Optional[List[float]] = None
+    collection: Any = None  # copie locale si Chroma est indisponible, None sans copie locale
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int) -> Dict[str, float]:
+    """Score RRF de chaque identifiant: somme de 1 / (k + rang) sur les classements qui le contiennent"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+async def _vector_search(
+    collection_name: str,
+    query_text: str,
+    policy: RetrievalPolicy,
+    where: Optional[Dict[str, Any]],
+    result: HybridResult,
+    fetch_k: int
+) -> List[Dict[str, Any]]:
+    """Candidats triés par distance; `result.distances` reçoit ceux que garde la politique"""
+    result.query_embedding = await embedding_engine.aembed_query(query_text)
+    params: Dict[str, Any] = {"n_results": fetch_k, "include": ["documents", "metadatas", "distances"]}
+    if result.query_embedding:
+        params["query_embeddings"] = [result.query_embedding]
+    else:
+        params["query_texts"] = [query_text]
+    if where:
+        params["where"] = where
+    try:
+        collection = await chroma_async.get_collection(collection_name)
+        result.collection = collection
+        results = await chroma_async.query(collection, **params)
+    except ChromaUnavailableError as e:
+        results = await _fallback_query(collection_name, params, result, e)
+        if results is None:
+            return []
+    except Exception as e:
+        hybrid_stats["vector_failures"] += 1
+        chroma_manager.report_error(e, collection_name)
+        logger.error(f"Error querying ChromaDB collection {collection_name}: {e}")
+        return []
+
+    if not (results and results.get("documents") and results["documents"][0]):
+        return []
+    texts = results["documents"][0]
+    ids = (results.get("ids") or [[]])[0]
+    metadatas = (results.get("metadatas") or [[]])[0] or [{}] * len(texts)
+    distances = (results.get("distances") or [[]])[0]
+    keep = policy.cut(distances) if distances else min(len(texts), policy.max_k)
+    result.distances = list(distances[:keep])
+    return [
+        {
+            "id": ids[i] if i < len(ids) else f"vector_{i}",
+            "text": texts[i],
+            "metadata": metadatas[i] or {},
+            "distance": distances[i] if i < len(distances) else None,
+        }
+        for i in range(len(texts))
+    ]
+
+
+async def _fallback_query(
+    collection_name: str,
+    params: Dict[str, Any],
+    result: HybridResult,
+    error: ChromaUnavailableError
+) -> Optional[Dict[str, Any]]:
+    """Chroma injoignable: même requête sur la copie locale (magasin NumPy), si elle existe"""
+    collection = None
+    if result.query_embedding:
+        try:
+            # Hors du pool Chroma, que des appels bloqués peuvent encore occuper
+            collection = await asyncio.to_thread(chroma_manager.fallback_collection, collection_name)
+        except Exception as e:
+            logger.error(f"Local vector store unavailable for {collection_name}: {e}")
+    if collection is None:
+        hybrid_stats["vector_failures"] += 1
+        logger.warning(f"{error}; vector search skipped for {collection_name}")
+        return None
+    hybrid_stats["fallback_queries"] += 1
+    logger.warning(f"{error}; querying local vector store for {collection_name}")
+    result.collection = collection
+    try:
+        return await asyncio.to_thread(collection.query, **params)
+    except Exception as e:
+        hybrid_stats["vector_failures"] += 1
+        logger.error(f"Error querying local vector store {collection_name}: {e}")
+        return None
+
+
+async def _backfill(collection_name: str) -> None:
+    """Indexer une collection créée avant l'index lexical (tout son contenu, lu dans Chroma)"""
+    collection = await chroma_async.get_collection(collection_name)
+    data = await chroma_async.run(
+        "lexical_backfill", collection.get, include=["documents", "metadatas"], timeout=chroma_async.write_timeout
+    )
+    ids = data.get("ids") or []
+    await asyncio.get_running_loop().run_in_executor(
+        None, lexical_index.backfill, collection_name, ids, data.get("documents") or [], data.get("metadatas") or [{}] * len(ids)
+    )
+
+
+async def _lexical_search(
+    collection_name: str,
+    query_text: str,
+    fetch_k: int,
+    document_ids: Optional[List[str]]
+) -> List[Dict[str, Any]]:
+    """Extraits BM25 dont le score atteint HYBRID_LEXICAL_MIN_SCORE_RATIO du meilleur"""
+    loop = asyncio.get_running_loop()
+    try:
+        if not await loop.run_in_executor(None, lexical_index.is_indexed, collection_name):
+            await _backfill(collection_name)
+        hits = await loop.run_in_executor(
+            None, lexical_index.search, collection_name, query_text, fetch_k, document_ids
+        )
+    except ChromaUnavailableError as e:
+        # Collection pas encore indexée et Chroma injoignable: recherche sur les chunks déjà indexés
+        logger.warning(f"{e}; lexical index of {collection_name} may be incomplete")
+        hits = await loop.run_in_executor(
+            None, lexical_index.search, collection_name, query_text, fetch_k, document_ids
+        )
+    except Exception as e:
+        hybrid_stats["lexical_failures"] += 1
+        logger.error(f"Lexical search failed on {collection_name}: {e}")
+        return []
+
+    if not hits:
+        return []
+    # Même logique que la politique vectorielle: écart relatif au meilleur score
+    floor = hits[0]["score"] * settings.HYBRID_LEXICAL_MIN_SCORE_RATIO
+    return [{**hit, "distance": None} for hit in hits if hit["score"] >= floor]
+
+
+def _fuse(vector_chunks: List[Dict[str, Any]], lexical_chunks: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Classements vectoriel et lexical fusionnés par RRF, au plus `limit` extraits"""
+    if not lexical_chunks:
+        return vector_chunks[:limit]
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for chunk in lexical_chunks + vector_chunks:
+        # Le côté vectoriel fournit la distance quand un extrait est trouvé par les deux recherches
+        by_id[chunk["id"]] = chunk
+    scores = reciprocal_rank_fusion(
+        [[chunk["id"] for chunk in vector_chunks], [chunk["id"] for chunk in lexical_chunks]], settings.HYBRID_RRF_K
+    )
+    fused = sorted(scores, key=lambda chunk_id: scores[chunk_id], reverse=True)[:limit]
+    return [{**by_id[chunk_id], "rrf_score": scores[chunk_id]} for chunk_id in fused]
+
+
+async def hybrid_search(
+    collection_name: str,
+    query_text: str,
+    policy: RetrievalPolicy,
+    document_ids: Optional[Iterable[Any]] = None,
+    where: Optional[Dict[str, Any]] = None,
+    lexical: bool = True,
+    rerank: bool = False
+) -> HybridResult:
+    """
+    Recherche vectorielle (Chroma, top-k adaptatif de `policy`) et BM25 (index FTS5) lancées en
+    parallèle, fusionnées par reciprocal rank fusion; au plus `policy.max_k` extraits.
+    `document_ids` restreint les deux recherches; `where` (filtre Chroma libre) désactive le BM25.
+    Avec `rerank` (et le reranker activé), RERANK_CANDIDATES candidats sont notés par le
+    cross-encoder et seuls les RERANK_TOP_K meilleurs sont gardés.
+    """
+    hybrid_stats["queries"] += 1
+    result = HybridResult()
+    document_ids = [str(document_id) for document_id in document_ids] if document_ids is not None else None
+    if document_ids is not None and where is None:
+        where = {"document_id": {"$in": document_ids}}
+    elif where is not None and document_ids is None:
+        lexical = False
+    rerank = rerank and reranker.available
+    fetch_k = max(policy.fetch_k, reranker.candidates) if rerank else policy.fetch_k
+
+    legs = [_vector_search(collection_name, query_text, policy, where, result, fetch_k)]
+    if lexical and settings.HYBRID_RETRIEVAL_ENABLED:
+        legs.append(_lexical_search(collection_name, query_text, fetch_k, document_ids))
+    rankings = await asyncio.gather(*legs)
+    vector_candidates = rankings[0]
+    lexical_candidates = rankings[1] if len(rankings) > 1 else []
+
+    # Sans reranking: extraits gardés par la politique vectorielle et au plus max_k extraits BM25
+    vector_chunks = vector_candidates[:len(result.distances)]
+    lexical_chunks = lexical_candidates[:policy.max_k]
+    hybrid_stats["vector_hits"] += len(vector_chunks)
+    hybrid_stats["lexical_hits"] += len(lexical_chunks)
+    result.chunks = _fuse(vector_chunks, lexical_chunks, policy.max_k)
+
+    if rerank:
+        # Reranking: candidats sous max_distance (au moins ceux de la politique) et tous les extraits BM25
+        pool = [
+            chunk for position, chunk in enumerate(vector_candidates)
+            if position < len(vector_chunks) or (chunk["distance"] is not None and chunk["distance"] <= policy.max_distance)
+        ]
+        reranked = await reranker.rerank(query_text, _fuse(pool, lexical_candidates, reranker.candidates))
+        if reranked is not None:
+            result.chunks = reranked[:max(policy.min_k, min(policy.max_k, reranker.top_k))]
+
+    vector_ids = {chunk["id"] for chunk in vector_candidates}
+    hybrid_stats["lexical_only"] += sum(1 for chunk in result.chunks if chunk["id"] not in vector_ids)
+    return result
+
+
+def get_hybrid_stats() -> Dict[str, Any]:
+    return {
+        **hybrid_stats,
+        "enabled": settings.HYBRID_RETRIEVAL_ENABLED,
+        "index": lexical_index.get_stats(),
+        "rerank": reranker.get_stats(),
+    }
@@ -0,0 +1,75 @@
+import json
+import logging
+from typing import Any, List
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONArrayParser:
+    """
+    Parseur incrémental d'un tableau JSON produit token par token par le LLM.
+    `feed()` renvoie chaque élément de premier niveau dès que son accolade fermante arrive;
+    le texte éventuel avant le `[` (préambule, bloc ```json) est ignoré.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._element: List[str] = []
+        self.started = False
+        self.finished = False
+        self.emitted = 0
+        self.errors = 0
+
+    def feed(self, text: str) -> List[Any]:
+        items: List[Any] = []
+        for char in text:
+            if self.finished:
+                break
+
+            if not self.started:
+                if char == "[":
+                    self.started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._depth >= 2:
+                    self._element.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth >= 2:
+                    self._element.append(char)
+            elif char in "{[":
+                self._depth += 1
+                self._element.append(char)
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth >= 1:
+                    self._element.append(char)
+                if self._depth == 1:
+                    self._emit(items)
+                elif self._depth == 0:
+                    self.finished = True
+            elif self._depth >= 2:
+                self._element.append(char)
+        return items
+
+    def _emit(self, items: List[Any]) -> None:
+        raw = "".join(self._element)
+        self._element = []
+        try:
+            items.append(json.loads(raw))
+            self.emitted += 1
+        except json.JSONDecodeError as e:
+            self.errors += 1
+            logger.warning(f"Skipping malformed array element in streamed JSON: {e}")
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+# Mots vides français (et anglais courants) retirés des requêtes: sans poids en BM25, ils
+# élargissent seulement la liste des extraits à classer
+STOPWORDS = frozenset("""
+a au aux avec ce ces cette comment dans de des du elle en est et il ils je la le les leur lui
+ma mais me mes moi mon ne nous on ou par pas pour qu que quel quelle quelles quels qui quoi sa
+se ses son sont sur ta te tes toi ton tu un une vos votre vous y
+the of and to in is what how
+""".split())
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Requête FTS5: termes significatifs de la question, reliés par OR (classement BM25)"""
+    terms: List[str] = []
+    for word in _WORD.findall(query.lower()):
+        if word in STOPWORDS or (len(word) < 2 and not word.isdigit()) or word in terms:
+            continue
+        terms.append(word)
+    return " OR ".join(f'"{term}"' for term in terms) if terms else None
+
+
+class LexicalIndex:
+    """
+    Index plein texte des chunks (SQLite FTS5, BM25): retrouve les identifiants exacts (mots-clés
+    de code, formules, sigles) que la recherche par embeddings manque. Le tokenizer unicode61
+    retire les accents ("élève" = "eleve"). Une collection absente de l'index est complétée
+    depuis Chroma à sa première recherche (documents indexés avant l'index lexical).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path is not None else settings.LEXICAL_INDEX_PATH
+        self._connection: Optional[sqlite3.Connection] = None
+        # Appelé depuis les threads du pool par défaut de la boucle d'événements
+        self._lock = threading.Lock()
+        self.stats = {"searches": 0, "hits": 0, "indexed_chunks": 0, "backfills": 0, "errors": 0}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                "text, chunk_id UNINDEXED, collection UNINDEXED, document_id UNINDEXED, metadata UNINDEXED, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS indexed_collections (name TEXT PRIMARY KEY)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def is_indexed(self, collection: str) -> bool:
+        with self._lock:
+            row = self.connection.execute("SELECT 1 FROM indexed_collections WHERE name = ?", (collection,)).fetchone()
+        return row is not None
+
+    def add(self, collection: str, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Indexer des chunks (remplace ceux qui ont le même identifiant)"""
+        with self._lock:
+            connection = self.connection
+            self._delete_ids(connection, collection, ids)
+            self._insert(connection, collection, ids, texts, metadatas)
+            connection.commit()
+        self.stats["indexed_chunks"] += len(ids)
+
+    def backfill(self, collection: str, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Indexer tout le contenu d'une collection (lu dans Chroma) et la marquer comme indexée"""
+        with self._lock:
+            connection = self.connection
+            # Remplacement par identifiant: un document ajouté pendant la lecture reste indexé
+            self._delete_ids(connection, collection, ids)
+            self._insert(connection, collection, ids, texts, metadatas)
+            connection.execute("INSERT OR IGNORE INTO indexed_collections (name) VALUES (?)", (collection,))
+            connection.commit()
+        self.stats["backfills"] += 1
+        self.stats["indexed_chunks"] += len(ids)
+        logger.info(f"Lexical index backfilled for {collection} ({len(ids)} chunks)")
+
+    @staticmethod
+    def _insert(connection: sqlite3.Connection, collection: str, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        connection.executemany(
+            "INSERT INTO chunks (text, chunk_id, collection, document_id, metadata) VALUES (?, ?, ?, ?, ?)",
+            [
+                (text, chunk_id, collection, str((metadata or {}).get("document_id", "")), json.dumps(metadata or {}))
+                for chunk_id, text, metadata in zip(ids, texts, metadatas)
+            ]
+        )
+
+    @staticmethod
+    def _delete_ids(connection: sqlite3.Connection, collection: str, ids: List[str]) -> None:
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            connection.execute(
+                f"DELETE FROM chunks WHERE collection = ? AND chunk_id IN ({','.join('?' * len(batch))})",
+                [collection, *batch]
+            )
+
+    def delete_document(self, collection: str, document_id: Any) -> None:
+        with self._lock:
+            self.connection.execute(
+                "DELETE FROM chunks WHERE collection = ? AND document_id = ?", (collection, str(document_id))
+            )
+            self.connection.commit()
+
+    def delete_collection(self, collection: str) -> None:
+        with self._lock:
+            self.connection.execute("DELETE FROM chunks WHERE collection = ?", (collection,))
+            self.connection.execute("DELETE FROM indexed_collections WHERE name = ?", (collection,))
+            self.connection.commit()
+
+    def search(
+        self,
+        collection: str,
+        query: str,
+        limit: int,
+        document_ids: Optional[Iterable[Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Extraits classés par BM25 (score positif, plus grand = meilleur)"""
+        expression = _match_expression(query)
+        self.stats["searches"] += 1
+        if expression is None or limit <= 0:
+            return []
+        sql = "SELECT chunk_id, text, metadata, bm25(chunks) FROM chunks WHERE chunks MATCH ? AND collection = ?"
+        params: List[Any] = [expression, collection]
+        if document_ids is not None:
+            document_ids = [str(document_id) for document_id in document_ids]
+            if not document_ids:
+                return []
+            sql += f" AND document_id IN ({','.join('?' * len(document_ids))})"
+            params.extend(document_ids)
+        sql += " ORDER BY bm25(chunks) LIMIT ?"
+        params.append(limit)
+        try:
+            with self._lock:
+                rows = self.connection.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            logger.error(f"Lexical search failed on {collection}: {e}")
+            return []
+        self.stats["hits"] += len(rows)
+        return [
+            {"id": chunk_id, "text": text, "metadata": json.loads(metadata), "score": -rank}
+            for chunk_id, text, metadata, rank in rows
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"path": self.path, **self.stats}
+
+
+# Instance globale de l'index lexical
+lexical_index = LexicalIndex()
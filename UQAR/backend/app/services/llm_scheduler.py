@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, Deque, Dict, Optional
+
+from ..core.config import settings
+from .metrics import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+
+class LLMPriority(IntEnum):
+    """Classes de priorité (plus petit = servi en premier)"""
+    INTERACTIVE = 0  # chat étudiant en direct
+    GENERATION = 1   # génération d'exercices, feedback de correction
+    ANALYTICS = 2    # analyses d'étudiants pour l'enseignant
+
+
+# Priorité par défaut de chaque tâche Ollama (voir get_ollama_task_profiles)
+TASK_PRIORITIES = {
+    "relevance": LLMPriority.INTERACTIVE,
+    "title": LLMPriority.INTERACTIVE,
+    "answer": LLMPriority.INTERACTIVE,
+    "param_extraction": LLMPriority.GENERATION,
+    "exercise": LLMPriority.GENERATION,
+    "feedback": LLMPriority.GENERATION,
+    "analysis": LLMPriority.ANALYTICS,
+}
+
+
+class _PriorityQueue:
+    """File équitable d'une classe: tourniquet sur les sections, puis sur les utilisateurs"""
+
+    def __init__(self):
+        # section -> (utilisateur -> file de waiters), ordre = tour de passage
+        self.sections: "OrderedDict[str, OrderedDict[str, Deque[asyncio.Future]]]" = OrderedDict()
+        self.depth = 0
+
+    def push(self, section_key: str, user_key: str, waiter: asyncio.Future) -> None:
+        users = self.sections.setdefault(section_key, OrderedDict())
+        users.setdefault(user_key, deque()).append(waiter)
+        self.depth += 1
+
+    def pop(self) -> Optional[asyncio.Future]:
+        while self.sections:
+            section_key, users = next(iter(self.sections.items()))
+            user_key, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            self.depth -= 1
+
+            # Passer le tour: l'utilisateur puis la section vont en fin de file
+            if waiters:
+                users.move_to_end(user_key)
+            else:
+                del users[user_key]
+            if users:
+                self.sections.move_to_end(section_key)
+            else:
+                del self.sections[section_key]
+
+            if not waiter.cancelled():
+                return waiter
+        return None
+
+
+class LLMScheduler:
+    """Ordonnanceur en mémoire devant Ollama: concurrence bornée, priorités et équité"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.in_flight = 0
+        self._queues = {priority: _PriorityQueue() for priority in LLMPriority}
+        self._wait_times = {priority: LatencyWindow() for priority in LLMPriority}
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_concurrency:
+            waiter = None
+            for priority in LLMPriority:
+                waiter = self._queues[priority].pop()
+                if waiter is not None:
+                    break
+            if waiter is None:
+                return
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+    ):
+        """Réserver une place d'exécution auprès d'Ollama pour la durée du bloc"""
+
+        section_key = f"section:{section_id}" if section_id is not None else "section:-"
+        user_key = f"user:{user_id}" if user_id is not None else "user:-"
+        started = time.perf_counter()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].push(section_key, user_key, waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # La place venait d'être attribuée: la rendre
+                self.in_flight -= 1
+                self._dispatch()
+            raise
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        self._wait_times[priority].add(wait_ms)
+        if wait_ms > 1000:
+            logger.info(f"LLM request ({priority.name}, {section_key}, {user_key}) waited {wait_ms:.0f} ms in queue")
+
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": sum(queue.depth for queue in self._queues.values()),
+            "classes": {
+                priority.name.lower(): {
+                    "queue_depth": self._queues[priority].depth,
+                    "wait": self._wait_times[priority].to_dict(),
+                }
+                for priority in LLMPriority
+            },
+        }
+
+
+# Instance globale de l'ordonnanceur (concurrence par nœud × nombre de nœuds)
+llm_scheduler = LLMScheduler(settings.OLLAMA_MAX_CONCURRENCY * len(settings.get_ollama_backends()))
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(model: str, prompt: str, options: Dict[str, Any]) -> str:
+    """Clé de coalescence: hash de (modèle, prompt complet, options)"""
+    payload = json.dumps({"model": model, "prompt": prompt, "options": options}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _StreamBroadcast:
+    """Flux de tokens produit une fois, rejouable par chaque abonné"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk: str) -> None:
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def close(self) -> None:
+        async with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                pending = self.chunks[index:]
+                finished = self.done
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class _InFlightCall:
+    """Appel non streamé partagé, annulé quand plus personne ne l'attend"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class LLMSingleFlight:
+    """Regroupe les requêtes LLM identiques en vol sur un seul appel amont"""
+
+    def __init__(self):
+        self._calls: Dict[str, _InFlightCall] = {}
+        self._streams: Dict[str, _StreamBroadcast] = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "stream_leaders": 0, "stream_coalesced": 0}
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Exécuter `call` une seule fois pour toutes les requêtes concurrentes de même clé"""
+
+        in_flight = self._calls.get(key)
+        if in_flight is None:
+            self.stats["leaders"] += 1
+            in_flight = _InFlightCall(asyncio.ensure_future(call()))
+            self._calls[key] = in_flight
+            in_flight.task.add_done_callback(
+                lambda task: self._calls.pop(key, None) if self._calls.get(key) is in_flight else None
+            )
+        else:
+            self.stats["coalesced"] += 1
+            logger.info(f"Coalescing identical LLM request {key[:12]}")
+
+        in_flight.waiters += 1
+        try:
+            # shield: l'annulation d'un appelant ne doit pas annuler l'appel des autres
+            return await asyncio.shield(in_flight.task)
+        finally:
+            in_flight.waiters -= 1
+            if in_flight.waiters == 0 and not in_flight.task.done():
+                in_flight.task.cancel()
+
+    async def _pump(self, key: str, broadcast: _StreamBroadcast, produce: Callable[[], AsyncGenerator[str, None]]) -> None:
+        try:
+            async for chunk in produce():
+                await broadcast.publish(chunk)
+        except Exception as e:
+            # Propagée à chaque abonné une fois les tokens déjà reçus rejoués
+            broadcast.error = e
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            await broadcast.close()
+
+    async def stream(
+        self,
+        key: str,
+        produce: Callable[[], AsyncGenerator[str, None]]
+    ) -> AsyncGenerator[str, None]:
+        """Diffuser un flux unique; les suiveurs s'attachent et rejouent les tokens du leader"""
+
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.stats["stream_leaders"] += 1
+            broadcast = _StreamBroadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, produce))
+        else:
+            self.stats["stream_coalesced"] += 1
+            logger.info(f"Attaching to in-flight LLM stream {key[:12]}")
+
+        broadcast.subscribers += 1
+        try:
+            async for chunk in broadcast.subscribe():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.task.done():
+                # Tous les clients sont partis: inutile de continuer à générer
+                broadcast.task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "in_flight": len(self._calls),
+            "streams_in_flight": len(self._streams),
+        }
+
+
+# Instance globale
+llm_singleflight = LLMSingleFlight()
@@ -0,0 +1,60 @@
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+
+class LatencyWindow:
+    """Latences (ms) sur une fenêtre glissante: moyenne, percentiles, maximum"""
+
+    def __init__(self, window: int = 500):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.max_ms = 0.0
+
+    def add(self, value_ms: float) -> None:
+        self.samples.append(value_ms)
+        self.count += 1
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        samples = list(self.samples)
+        return {
+            "count": self.count,
+            "avg_ms": round(sum(samples) / len(samples), 1) if samples else 0.0,
+            "p50_ms": round(self.percentile(0.5) or 0.0, 1),
+            "p95_ms": round(self.percentile(0.95) or 0.0, 1),
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class StageMetrics:
+    """Latences par étape nommée (ex: étapes du pipeline de chat)"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.stages: Dict[str, LatencyWindow] = {}
+
+    def record(self, stage: str, value_ms: float) -> None:
+        self.stages.setdefault(stage, LatencyWindow(self.window)).add(value_ms)
+
+    @asynccontextmanager
+    async def measure(self, stage: str, timings: Optional[Dict[str, float]] = None):
+        """Mesurer un bloc; la durée est aussi copiée dans `timings` si fourni"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.record(stage, elapsed_ms)
+            if timings is not None:
+                timings[stage] = round(elapsed_ms, 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {stage: window.to_dict() for stage, window in self.stages.items()}
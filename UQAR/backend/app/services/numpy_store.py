@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..core.config import settings
+from .embeddings import embedding_engine
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+# Requêtes servies, collections chargées, réécritures des fichiers
+numpy_store_stats = {"queries": 0, "loads": 0, "writes": 0}
+
+
+def _matches(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Sous-ensemble des filtres Chroma: égalité, $eq, $ne, $in, $nin, $and, $or"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class NumpyCollection:
+    """
+    Collection au format de Chroma (add, get, query, delete, count) stockée dans un dossier:
+    matrice float32 des embeddings normalisés (ou int8 + échelle par ligne) dans un .npy ouvert
+    en mémoire partagée (mmap), identifiants, textes et métadonnées dans un fichier JSON.
+    La recherche est exacte: un produit matrice-vecteur, puis les k meilleurs par argpartition.
+    Chaque écriture réécrit les fichiers (remplacement atomique): adapté aux volumes d'un cours.
+    """
+
+    def __init__(self, name: str, directory: str, quantize: bool):
+        self.name = name
+        self.directory = directory
+        self.quantize = quantize
+        self.metadata = {"hnsw:space": "cosine", "backend": "numpy"}
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._load()
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def _load(self) -> None:
+        sidecar = self._path("metadata.json")
+        if not os.path.exists(sidecar):
+            return
+        with open(sidecar, encoding="utf-8") as f:
+            data = json.load(f)
+        self._ids, self._documents, self._metadatas = data["ids"], data["documents"], data["metadatas"]
+        self.quantize = data.get("quantized", self.quantize)
+        if self._ids:
+            self._matrix = np.load(self._path("embeddings.npy"), mmap_mode="r")
+            if self.quantize:
+                self._scales = np.load(self._path("scales.npy"), mmap_mode="r")
+        numpy_store_stats["loads"] += 1
+
+    def _save(self, vectors: np.ndarray) -> None:
+        """Écrire les fichiers (vecteurs float32 normalisés) puis les rouvrir en mmap"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        def write_array(filename: str, array: np.ndarray) -> None:
+            temporary = self._path(filename + ".tmp")
+            with open(temporary, "wb") as f:
+                np.save(f, array)
+            os.replace(temporary, self._path(filename))
+
+        if self.quantize:
+            scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+            scales = np.where(scales == 0, 1.0, scales)
+            quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+            # Échelle = 1 / norme de la ligne arrondie: int8 × échelle reste de norme 1 (distance cosinus exacte)
+            norms = np.linalg.norm(quantized.astype(np.float32), axis=1)
+            write_array("embeddings.npy", quantized)
+            write_array("scales.npy", (1.0 / np.where(norms == 0, 1.0, norms)).astype(np.float32))
+        else:
+            write_array("embeddings.npy", vectors.astype(np.float32))
+        temporary = self._path("metadata.json.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": self._ids, "documents": self._documents, "metadatas": self._metadatas, "quantized": self.quantize,
+            }, f, ensure_ascii=False)
+        os.replace(temporary, self._path("metadata.json"))
+        numpy_store_stats["writes"] += 1
+
+        self._matrix = np.load(self._path("embeddings.npy"), mmap_mode="r") if self._ids else None
+        self._scales = np.load(self._path("scales.npy"), mmap_mode="r") if self._ids and self.quantize else None
+
+    def _vectors(self) -> np.ndarray:
+        """Vecteurs float32 de la collection (déquantifiés si besoin)"""
+        if self._matrix is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self.quantize:
+            return np.asarray(self._matrix, dtype=np.float32) * np.asarray(self._scales)[:, None]
+        return np.asarray(self._matrix, dtype=np.float32)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def add(
+        self,
+        ids: List[str],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ) -> None:
+        """Ajouter (ou remplacer, même identifiant) des extraits"""
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        if embeddings is None:
+            embeddings = embedding_engine.embed(documents)
+            if embeddings is None:
+                raise ValueError("Aucun modèle d'embedding disponible pour la collection NumPy")
+        new_vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            replaced = set(ids)
+            keep = [i for i, chunk_id in enumerate(self._ids) if chunk_id not in replaced]
+            vectors = self._vectors()[keep] if keep else np.zeros((0, new_vectors.shape[1]), dtype=np.float32)
+            self._ids = [self._ids[i] for i in keep] + list(ids)
+            self._documents = [self._documents[i] for i in keep] + list(documents)
+            self._metadatas = [self._metadatas[i] for i in keep] + [dict(metadata or {}) for metadata in metadatas]
+            self._save(np.vstack([vectors, new_vectors]))
+
+    def _select(self, ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> List[int]:
+        wanted = set(ids) if ids is not None else None
+        return [
+            i for i, chunk_id in enumerate(self._ids)
+            if (wanted is None or chunk_id in wanted) and _matches(self._metadatas[i], where)
+        ]
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            removed = set(self._select(ids, where))
+            if not removed:
+                return
+            keep = [i for i in range(len(self._ids)) if i not in removed]
+            vectors = self._vectors()[keep]
+            self._ids = [self._ids[i] for i in keep]
+            self._documents = [self._documents[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._save(vectors)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            selected = self._select(ids, where)[:limit] if limit is not None else self._select(ids, where)
+            result: Dict[str, Any] = {"ids": [self._ids[i] for i in selected]}
+            if "documents" in include:
+                result["documents"] = [self._documents[i] for i in selected]
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[i] for i in selected]
+            if "embeddings" in include:
+                result["embeddings"] = self._vectors()[selected] if selected else np.zeros((0, 0), dtype=np.float32)
+        return result
+
+    def query(
+        self,
+        query_embeddings: Optional[List[List[float]]] = None,
+        query_texts: Optional[List[str]] = None,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Top-k exact par similarité cosinus (distance = 1 - similarité, comme Chroma en cosinus)"""
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        if query_embeddings is None:
+            query_embeddings = embedding_engine.embed(query_texts or [])
+            if query_embeddings is None:
+                raise ValueError("Aucun modèle d'embedding disponible pour la collection NumPy")
+        numpy_store_stats["queries"] += 1
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        result: Dict[str, Any] = {key: [] for key in ["ids", *include] if key != "embeddings"}
+        with self._lock:
+            candidates = np.asarray(self._select(None, where) if where else range(len(self._ids)), dtype=np.int64)
+            if len(candidates) and self._matrix is not None:
+                matrix = self._matrix if len(candidates) == len(self._ids) else self._matrix[candidates]
+                similarities = (np.asarray(matrix, dtype=np.float32) @ queries.T).T
+                if self.quantize:
+                    scales = np.asarray(self._scales)
+                    similarities = similarities * (scales if len(candidates) == len(self._ids) else scales[candidates])
+            else:
+                similarities = np.zeros((len(queries), 0), dtype=np.float32)
+
+            k = min(n_results, similarities.shape[1])
+            for row in similarities:
+                top = np.argpartition(-row, k - 1)[:k] if 0 < k < len(row) else np.arange(k)
+                top = top[np.argsort(-row[top])]
+                positions = candidates[top]
+                result["ids"].append([self._ids[i] for i in positions])
+                if "documents" in include:
+                    result["documents"].append([self._documents[i] for i in positions])
+                if "metadatas" in include:
+                    result["metadatas"].append([self._metadatas[i] for i in positions])
+                if "distances" in include:
+                    result["distances"].append([float(1.0 - row[i]) for i in top])
+        return result
+
+
+class NumpyVectorStore:
+    """
+    Magasin de vecteurs dans le processus, avec l'interface du client Chroma utilisée par
+    l'application (get_collection, get_or_create_collection, delete_collection): backend
+    principal d'un déploiement sur un seul nœud, ou copie de secours quand Chroma est injoignable.
+    """
+
+    def __init__(self, directory: Optional[str] = None, quantize: Optional[bool] = None):
+        self.directory = directory if directory is not None else settings.NUMPY_STORE_DIRECTORY
+        self.quantize = settings.NUMPY_STORE_QUANTIZE if quantize is None else quantize
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def _collection_path(self, name: str) -> str:
+        return os.path.join(self.directory, _UNSAFE.sub("_", name))
+
+    def has_collection(self, name: str) -> bool:
+        return name in self._collections or os.path.exists(os.path.join(self._collection_path(name), "metadata.json"))
+
+    def get_collection(self, name: str, **kwargs) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                if not os.path.exists(os.path.join(self._collection_path(name), "metadata.json")):
+                    raise ValueError(f"Collection {name} does not exist.")
+                collection = self._collections[name] = NumpyCollection(name, self._collection_path(name), self.quantize)
+            return collection
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None, **kwargs) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = NumpyCollection(name, self._collection_path(name), self.quantize)
+            return collection
+
+    def add(self, name: str, **params) -> None:
+        """Copie d'un ajout fait dans Chroma (collection créée au besoin)"""
+        self.get_or_create_collection(name).add(**params)
+
+    def delete(self, name: str, **params) -> None:
+        """Copie d'une suppression faite dans Chroma"""
+        if self.has_collection(name):
+            self.get_collection(name).delete(**params)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+            shutil.rmtree(self._collection_path(name), ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "quantized": self.quantize,
+            "loaded_collections": len(self._collections),
+            "chunks": sum(collection.count() for collection in self._collections.values()),
+            **numpy_store_stats,
+        }
+
+
+# Instance globale du magasin NumPy
+numpy_store = NumpyVectorStore()
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+
+from ..core.config import get_ollama_config
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaClientPool:
+    """Client HTTP partagé (keep-alive) vers Ollama pour tout le processus"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = asyncio.Lock()
+
+    def _build_client(self) -> httpx.AsyncClient:
+        config = get_ollama_config()
+        limits = httpx.Limits(
+            max_connections=config["pool_max_connections"],
+            max_keepalive_connections=config["pool_max_keepalive"],
+            keepalive_expiry=config["pool_keepalive_expiry"],
+        )
+        logger.info(
+            f"Opening Ollama HTTP pool (max_connections={limits.max_connections}, "
+            f"max_keepalive={limits.max_keepalive_connections})"
+        )
+        return httpx.AsyncClient(limits=limits, timeout=self.timeout())
+
+    @staticmethod
+    def timeout(read: Optional[float] = None) -> httpx.Timeout:
+        """Construire un timeout par appel (connexion courte, lecture configurable)"""
+        config = get_ollama_config()
+        read_timeout = read if read is not None else config["timeout"]
+        return httpx.Timeout(read_timeout, connect=config["connect_timeout"])
+
+    async def start(self) -> None:
+        """Ouvrir le pool (appelé au démarrage de FastAPI)"""
+        async with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = self._build_client()
+
+    async def close(self) -> None:
+        """Fermer proprement le pool (appelé à l'arrêt de FastAPI)"""
+        async with self._lock:
+            if self._client is not None and not self._client.is_closed:
+                await self._client.aclose()
+                logger.info("Ollama HTTP pool closed")
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Client partagé; ouvert à la demande hors FastAPI (scripts, tests manuels)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+
+# Instance globale du pool
+ollama_client_pool = OllamaClientPool()
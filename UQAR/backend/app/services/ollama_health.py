@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ..core.config import get_ollama_config, get_ollama_task_profiles
+from .ollama_client import ollama_client_pool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OllamaHealthState:
+    """Dernier état connu d'Ollama, mis en cache par le moniteur"""
+    healthy: Optional[bool] = None  # None tant qu'aucune sonde n'a abouti
+    checked_at: Optional[float] = None
+    latency_ms: Optional[float] = None
+    version: Optional[str] = None
+    models: List[str] = field(default_factory=list)
+    missing_models: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    consecutive_failures: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "checked_at": self.checked_at,
+            "age_seconds": round(time.time() - self.checked_at, 1) if self.checked_at else None,
+            "latency_ms": self.latency_ms,
+            "version": self.version,
+            "models": self.models,
+            "missing_models": self.missing_models,
+            "error": self.error,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class OllamaHealthMonitor:
+    """Sonde chaque nœud Ollama en arrière-plan et met leur état en cache pour les requêtes"""
+
+    def __init__(self):
+        config = get_ollama_config()
+        self.backends: List[str] = config["backends"]
+        self.base_url = config["base_url"]
+        self.model = config["model"]
+        self.task_models = sorted({profile["model"] for profile in get_ollama_task_profiles().values()})
+        self.health_timeout = config["health_timeout"]
+        self.interval = config["health_interval"]
+        self.unhealthy_interval = config["health_unhealthy_interval"]
+        self.max_age = config["health_max_age"]
+        self.states: Dict[str, OllamaHealthState] = {backend: OllamaHealthState() for backend in self.backends}
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def state(self) -> OllamaHealthState:
+        """État agrégé: sain si au moins un nœud l'est, modèles disponibles sur tous les nœuds sains"""
+        if len(self.backends) == 1:
+            return self.states[self.base_url]
+
+        states = list(self.states.values())
+        healthy = [state for state in states if state.healthy]
+        checked = [state.checked_at for state in states if state.checked_at is not None]
+        model_sets = [set(state.models) for state in (healthy or states) if state.models]
+        models = sorted(set.intersection(*model_sets)) if model_sets else []
+        errors = [f"{backend}: {state.error}" for backend, state in self.states.items() if state.healthy is False]
+
+        return OllamaHealthState(
+            healthy=True if healthy else (None if any(state.healthy is None for state in states) else False),
+            checked_at=max(checked) if checked else None,
+            latency_ms=min(state.latency_ms for state in healthy) if healthy else None,
+            version=healthy[0].version if healthy else None,
+            models=models,
+            missing_models=sorted({model for state in healthy for model in state.missing_models}),
+            error="; ".join(errors) or None,
+            consecutive_failures=min(state.consecutive_failures for state in states),
+        )
+
+    async def probe(self, base_url: Optional[str] = None) -> OllamaHealthState:
+        """Interroger /api/version puis /api/tags (une seule fois chacun) d'un nœud"""
+
+        base_url = base_url or self.base_url
+        client = ollama_client_pool.client
+        timeout = ollama_client_pool.timeout(self.health_timeout)
+        started = time.perf_counter()
+        state = OllamaHealthState(consecutive_failures=self.states[base_url].consecutive_failures)
+
+        try:
+            version_response = await client.get(f"{base_url}/api/version", timeout=timeout)
+            if version_response.status_code != 200:
+                raise RuntimeError(f"/api/version returned {version_response.status_code}")
+            state.version = version_response.json().get("version")
+
+            tags_response = await client.get(f"{base_url}/api/tags", timeout=timeout)
+            if tags_response.status_code != 200:
+                raise RuntimeError(f"/api/tags returned {tags_response.status_code}")
+            state.models = [model.get("name") for model in tags_response.json().get("models", [])]
+
+            state.missing_models = [model for model in self.task_models if model not in state.models]
+            if self.model not in state.models:
+                raise RuntimeError(f"Model {self.model} not in available models: {state.models}")
+
+            state.healthy = True
+            state.consecutive_failures = 0
+        except Exception as e:
+            state.healthy = False
+            state.error = str(e) or e.__class__.__name__
+            state.consecutive_failures += 1
+
+        state.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        state.checked_at = time.time()
+        return state
+
+    async def refresh(self) -> OllamaHealthState:
+        """Sonder immédiatement tous les nœuds et mettre à jour le cache"""
+        async with self._refresh_lock:
+            probed = await asyncio.gather(*(self.probe(backend) for backend in self.backends))
+            for backend, state in zip(self.backends, probed):
+                previous = self.states[backend].healthy
+                self.states[backend] = state
+                if state.healthy != previous:
+                    if state.healthy:
+                        logger.info(f"Ollama at {backend} is healthy ({state.latency_ms} ms)")
+                        if state.missing_models:
+                            logger.warning(f"Task models not pulled on {backend}, main model will be used instead: {state.missing_models}")
+                    else:
+                        logger.error(f"Ollama at {backend} is unhealthy: {state.error}")
+            return self.state
+
+    def is_fresh(self, base_url: Optional[str] = None) -> bool:
+        state = self.states[base_url or self.base_url]
+        return state.checked_at is not None and time.time() - state.checked_at <= self.max_age
+
+    def is_backend_available(self, base_url: str) -> bool:
+        """Lecture du cache: un nœud n'est écarté que si un état récent est négatif"""
+        if not self.is_fresh(base_url):
+            return True
+        return self.states[base_url].healthy is not False
+
+    def is_available(self) -> bool:
+        """Échec rapide seulement si tous les nœuds sont récemment en échec"""
+        return any(self.is_backend_available(backend) for backend in self.backends)
+
+    def record_failure(self, error: str, base_url: Optional[str] = None) -> None:
+        """Signaler une erreur de connexion observée lors d'un appel réel (écarte le nœud)"""
+        state = self.states[base_url or self.base_url]
+        state.healthy = False
+        state.error = error
+        state.checked_at = time.time()
+        state.consecutive_failures += 1
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ollama health monitor iteration failed: {e}")
+            all_healthy = all(state.healthy for state in self.states.values())
+            await asyncio.sleep(self.interval if all_healthy else self.unhealthy_interval)
+
+    def start(self) -> None:
+        """Démarrer la boucle de sonde (appelé au démarrage de FastAPI)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Ollama health monitor started for {len(self.backends)} backend(s) (interval={self.interval}s)")
+
+    async def stop(self) -> None:
+        """Arrêter la boucle de sonde (appelé à l'arrêt de FastAPI)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Instance globale du moniteur
+ollama_health_monitor = OllamaHealthMonitor()
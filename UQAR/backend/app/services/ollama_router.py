@@ -0,0 +1,225 @@
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from ..core.config import get_ollama_config
+from .circuit_breaker import CircuitBreaker
+from .metrics import LatencyWindow
+from .ollama_health import ollama_health_monitor
+
+logger = logging.getLogger(__name__)
+
+# Nombre minimal de mesures avant de se fier au p95 d'une tâche pour le hedging
+HEDGE_MIN_SAMPLES = 20
+
+
+class OllamaUnavailableError(Exception):
+    """Aucun nœud Ollama n'accepte d'appel (disjoncteurs ouverts): échec rapide"""
+
+
+@dataclass
+class OllamaBackend:
+    """Nœud Ollama et sa charge courante vue par ce processus"""
+    url: str
+    breaker: CircuitBreaker
+    outstanding: int = 0
+    requests: int = 0
+    errors: int = 0
+    latency: LatencyWindow = field(default_factory=LatencyWindow)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": ollama_health_monitor.states[self.url].healthy,
+            "available": ollama_health_monitor.is_backend_available(self.url),
+            "breaker": self.breaker.to_dict(),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency": self.latency.to_dict(),
+        }
+
+
+class TrackedCall:
+    """Appel en cours sur un nœud: l'appelant signale l'arrivée de la réponse (statut HTTP)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.status_code: Optional[int] = None
+        self.response_ms: Optional[float] = None
+
+    def responded(self, status_code: int) -> None:
+        self.status_code = status_code
+        self.response_ms = (time.perf_counter() - self.started) * 1000
+
+
+class OllamaRouter:
+    """
+    Répartit les appels entre les nœuds Ollama: le moins de requêtes en cours parmi les
+    nœuds sains, avec affinité par session de chat (le nœud garde le cache KV de la conversation).
+    Chaque nœud a son disjoncteur; quand tous sont ouverts, les appels échouent immédiatement.
+    """
+
+    def __init__(self):
+        config = get_ollama_config()
+        self.backends: List[OllamaBackend] = [
+            OllamaBackend(
+                url,
+                CircuitBreaker(url, config["breaker_failure_threshold"], config["breaker_reset_timeout"])
+            )
+            for url in config["backends"]
+        ]
+        self.affinity_ttl = config["affinity_ttl"]
+        self.affinity_max_sessions = config["affinity_max_sessions"]
+        self.hedge_enabled = config["hedge_enabled"]
+        self.hedge_tasks = set(config["hedge_tasks"])
+        self.hedge_default_delay = config["hedge_default_delay"]
+        self.hedge_min_delay = config["hedge_min_delay"]
+        # clé de session -> (url du nœud, dernière utilisation), ordre LRU
+        self._affinity: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._task_latency: Dict[str, LatencyWindow] = {}
+        self._next = 0
+        self.stats = {
+            "sticky": 0,
+            "rerouted": 0,
+            "least_outstanding": 0,
+            "no_healthy_backend": 0,
+            "rejected_open": 0,
+            "hedged": 0,
+            "hedge_won": 0,
+        }
+
+    def accepting(self) -> bool:
+        """Au moins un disjoncteur laisse passer les appels"""
+        return any(backend.breaker.available() for backend in self.backends)
+
+    def _candidates(self, exclude: Optional[OllamaBackend] = None) -> List[OllamaBackend]:
+        open_circuit = [backend for backend in self.backends if backend is not exclude and backend.breaker.available()]
+        if not open_circuit:
+            return []
+        available = [backend for backend in open_circuit if ollama_health_monitor.is_backend_available(backend.url)]
+        if not available:
+            # Tous écartés par la sonde: tenter quand même plutôt que d'échouer sans essayer
+            self.stats["no_healthy_backend"] += 1
+            return open_circuit
+        return available
+
+    def _least_outstanding(self, candidates: List[OllamaBackend]) -> OllamaBackend:
+        # Départage en tourniquet pour ne pas toujours favoriser le premier nœud
+        self._next = (self._next + 1) % len(self.backends)
+        offset = self._next
+        ordered = sorted(
+            candidates,
+            key=lambda backend: (backend.outstanding, (self.backends.index(backend) - offset) % len(self.backends))
+        )
+        return ordered[0]
+
+    def select(self, session_key: Optional[str] = None) -> OllamaBackend:
+        """Choisir le nœud d'un appel; une session revient sur son nœud tant qu'il est sain"""
+
+        candidates = self._candidates()
+        if not candidates:
+            self.stats["rejected_open"] += 1
+            for backend in self.backends:
+                backend.breaker.record_rejected()
+            raise OllamaUnavailableError("Tous les nœuds Ollama sont indisponibles (disjoncteur ouvert)")
+        if len(candidates) == 1:
+            return candidates[0]
+
+        now = time.time()
+        if session_key is not None:
+            pinned = self._affinity.get(session_key)
+            if pinned is not None and now - pinned[1] <= self.affinity_ttl:
+                backend = next((b for b in candidates if b.url == pinned[0]), None)
+                if backend is not None:
+                    self.stats["sticky"] += 1
+                    self._pin(session_key, backend.url, now)
+                    return backend
+                self.stats["rerouted"] += 1
+                logger.info(f"Backend {pinned[0]} unavailable, rerouting {session_key}")
+
+        backend = self._least_outstanding(candidates)
+        self.stats["least_outstanding"] += 1
+        if session_key is not None:
+            self._pin(session_key, backend.url, now)
+        return backend
+
+    def select_alternate(self, primary: OllamaBackend) -> Optional[OllamaBackend]:
+        """Second nœud pour une requête couverte (hedging), sans toucher à l'affinité"""
+        candidates = self._candidates(exclude=primary)
+        return self._least_outstanding(candidates) if candidates else None
+
+    def _pin(self, session_key: str, url: str, now: float) -> None:
+        self._affinity[session_key] = (url, now)
+        self._affinity.move_to_end(session_key)
+        while len(self._affinity) > self.affinity_max_sessions:
+            self._affinity.popitem(last=False)
+
+    def hedge_delay(self, task: str) -> Optional[float]:
+        """Délai (s) avant d'envoyer une copie de la requête à un second nœud; None = pas de hedging"""
+        if not self.hedge_enabled or task not in self.hedge_tasks or len(self.backends) < 2:
+            return None
+        window = self._task_latency.get(task)
+        if window is None or len(window.samples) < HEDGE_MIN_SAMPLES:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, window.percentile(0.95) / 1000)
+
+    def record_task_latency(self, task: str, latency_ms: float) -> None:
+        self._task_latency.setdefault(task, LatencyWindow()).add(latency_ms)
+
+    @asynccontextmanager
+    async def track(self, backend: OllamaBackend, slo: Optional[float] = None):
+        """
+        Compter la requête en cours et sa latence, et alimenter le disjoncteur du nœud:
+        erreurs de connexion/timeout, réponses 5xx et dépassements du SLO (s) sont des échecs.
+        """
+        backend.outstanding += 1
+        backend.requests += 1
+        backend.breaker.begin()
+        call = TrackedCall()
+        try:
+            yield call
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            backend.errors += 1
+            backend.breaker.record_failure(e.__class__.__name__)
+            ollama_health_monitor.record_failure(e.__class__.__name__, backend.url)
+            raise
+        except httpx.HTTPError as e:
+            backend.errors += 1
+            backend.breaker.record_failure(e.__class__.__name__)
+            raise
+        except BaseException:
+            # Annulation (client parti, hedging perdant) ou erreur côté appelant
+            backend.breaker.record_abandoned()
+            raise
+        else:
+            response_ms = call.response_ms if call.response_ms is not None else (time.perf_counter() - call.started) * 1000
+            if call.status_code is not None and call.status_code >= 500:
+                backend.errors += 1
+                backend.breaker.record_failure(f"HTTP {call.status_code}")
+            elif slo is not None and response_ms > slo * 1000:
+                backend.breaker.record_failure(f"latency {response_ms:.0f} ms > SLO {slo:.0f} s", slo_breach=True)
+            else:
+                backend.breaker.record_success()
+        finally:
+            backend.outstanding -= 1
+            backend.latency.add((time.perf_counter() - call.started) * 1000)
+
+    def get_breakers(self) -> Dict[str, Any]:
+        return {backend.url: backend.breaker.to_dict() for backend in self.backends}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "sessions_pinned": len(self._affinity),
+            "hedge_delays": {task: self.hedge_delay(task) for task in sorted(self.hedge_tasks)},
+            "backends": {backend.url: backend.to_dict() for backend in self.backends},
+        }
+
+
+# Instance globale du routeur
+ollama_router = OllamaRouter()
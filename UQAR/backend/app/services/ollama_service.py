@@ -1,12 +1,57 @@
+import asyncio
 import httpx
 import json
 import logging
 from typing import Dict, List, Optional, AsyncGenerator
-import aiohttp
-from ..core.config import get_ollama_config
+from ..core.config import get_ollama_config, get_ollama_task_profiles
+from .ollama_client import ollama_client_pool
+from .ollama_health import ollama_health_monitor
+from .ollama_router import ollama_router, OllamaBackend, OllamaUnavailableError
+from .llm_scheduler import llm_scheduler, LLMPriority, TASK_PRIORITIES
+from .llm_singleflight import llm_singleflight, request_key
+from .token_budget import token_budget
 
 logger = logging.getLogger(__name__)
 
+# Appels courts servis par le modèle auxiliaire (SLO de latence du disjoncteur)
+AUX_TASKS = ("relevance", "title", "param_extraction")
+
+# Tokens des en-têtes du gabarit de prompt, hors système, question et contexte
+PROMPT_TEMPLATE_TOKENS = 32
+
+
+class OllamaErrorMessage(str):
+    """Message d'erreur renvoyé (ou diffusé) à la place de la réponse: la génération a échoué"""
+
+
+# Textes des OllamaErrorMessage. Une fois enregistrés dans l'historique, le type est perdu:
+# is_error_reply les reconnaît pour écarter ces tours du contexte envoyé au modèle
+OLLAMA_ERROR_TEXTS = {
+    "unreachable": "Désolé, le service de génération de texte n'est pas accessible actuellement.",
+    "misconfigured": "Désolé, le service de génération de texte n'est pas accessible. Veuillez vérifier la configuration.",
+    "model_missing": "Désolé, le modèle demandé n'est pas disponible actuellement.",
+    "server_error": "Désolé, le service de génération de texte a rencontré une erreur interne.",
+    "unavailable": "Désolé, je ne peux pas répondre pour le moment. Veuillez réessayer plus tard.",
+    "timeout": "Désolé, la génération de réponse a pris trop de temps. Veuillez essayer une question plus courte.",
+    "failed": "Désolé, une erreur s'est produite lors de la génération de la réponse.",
+    "stream_failed": "Désolé, une erreur s'est produite.",
+    "stream_status": "Erreur lors de la génération de la réponse.",
+}
+
+
+def is_error_reply(content: str) -> bool:
+    """Réponse enregistrée qui est un message d'erreur, ou un flux interrompu qui se termine par un"""
+    return any(content.endswith(text) for text in OLLAMA_ERROR_TEXTS.values())
+
+
+DEFAULT_SYSTEM_PROMPT = (
+    "Tu es un assistant éducatif pour l'UQAR. Réponds de manière pédagogique et précise. "
+    "Utilise le format Markdown pour structurer tes réponses : "
+    "**gras** pour les mots importants, `code` pour les termes techniques, "
+    "```code``` pour les blocs de code, ## pour les titres, et - pour les listes. "
+    "Si tu utilises des informations du contexte, cite tes sources."
+)
+
 
 class OllamaService:
     """Service pour interagir avec Ollama"""
@@ -18,126 +63,446 @@ class OllamaService:
         self.max_tokens = self.config["max_tokens"]
         self.temperature = self.config["temperature"]
         self.timeout = self.config.get("timeout", 300)
-        logger.info(f"OllamaService initialized with model: {self.model} at {self.base_url}")
+        self.health_timeout = self.config.get("health_timeout", 10.0)
+        self.relevance_timeout = self.config.get("relevance_timeout", 30.0)
+        self.keep_alive = self.config.get("keep_alive", "30m")
+        self.aux_slo = self.config["breaker_aux_slo"]
+        self.first_token_slo = self.config["breaker_first_token_slo"]
+        self.backends = self.config["backends"]
+        self.task_profiles = get_ollama_task_profiles()
+        logger.info(f"OllamaService initialized with model: {self.model} at {', '.join(self.backends)}")
+
+    def _task_profile(self, task: str) -> Dict:
+        """Profil (modèle et options) d'une tâche, avec repli sur le modèle principal"""
+
+        profile = dict(self.task_profiles.get(task) or self.task_profiles["answer"])
+        available_models = ollama_health_monitor.state.models
+        if available_models and profile["model"] not in available_models:
+            logger.warning(f"Model {profile['model']} for task '{task}' is not pulled; falling back to {self.model}")
+            profile["model"] = self.model
+        return profile
+
+    def _task_options(self, profile: Dict, **extra) -> Dict:
+        options = {
+            "temperature": profile["temperature"],
+            "num_predict": profile["num_predict"],
+            "num_ctx": profile["num_ctx"],
+        }
+        options.update(extra)
+        return options
+
+    def _slot(self, task: str, user_id: Optional[int], section_id: Optional[int]):
+        """Place dans l'ordonnanceur LLM selon la priorité de la tâche"""
+        priority = TASK_PRIORITIES.get(task, LLMPriority.INTERACTIVE)
+        return llm_scheduler.slot(priority, user_id=user_id, section_id=section_id)
+
+    async def _post_generate(
+        self,
+        payload: Dict,
+        task: str,
+        timeout: float,
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        endpoint: str = "/api/generate",
+        session_id: Optional[int] = None
+    ) -> httpx.Response:
+        """Envoyer une requête non streamée (coalescée, via l'ordonnanceur, routée vers un nœud)"""
+
+        async def call() -> httpx.Response:
+            async with self._slot(task, user_id, section_id):
+                backend = ollama_router.select(self._affinity_key(session_id))
+                hedge_delay = ollama_router.hedge_delay(task)
+                if hedge_delay is None:
+                    return await self._send(backend, endpoint, payload, task, timeout)
+                return await self._hedged_send(backend, hedge_delay, endpoint, payload, task, timeout)
+
+        return await llm_singleflight.do(self._payload_key(payload), call)
+
+    async def _send(
+        self,
+        backend: OllamaBackend,
+        endpoint: str,
+        payload: Dict,
+        task: str,
+        timeout: float
+    ) -> httpx.Response:
+        """POST vers un nœud, suivi par son disjoncteur"""
+        slo = self.aux_slo if task in AUX_TASKS else None
+        async with ollama_router.track(backend, slo=slo) as call:
+            response = await ollama_client_pool.client.post(
+                f"{backend.url}{endpoint}",
+                json=payload,
+                timeout=ollama_client_pool.timeout(timeout)
+            )
+            call.responded(response.status_code)
+        if response.status_code == 200:
+            ollama_router.record_task_latency(task, call.response_ms)
+        return response
+
+    async def _hedged_send(
+        self,
+        primary: OllamaBackend,
+        hedge_delay: float,
+        endpoint: str,
+        payload: Dict,
+        task: str,
+        timeout: float
+    ) -> httpx.Response:
+        """
+        Requête couverte: si le premier nœud n'a pas répondu après `hedge_delay` (p95 de la tâche),
+        la même requête part vers un second nœud; la première réponse valide l'emporte.
+        """
+        first = asyncio.ensure_future(self._send(primary, endpoint, payload, task, timeout))
+        attempts = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=hedge_delay)
+            if done:
+                return first.result()
+
+            alternate = ollama_router.select_alternate(primary)
+            if alternate is None:
+                return await first
+            ollama_router.stats["hedged"] += 1
+            logger.info(f"Hedging '{task}' request to {alternate.url} after {hedge_delay:.2f}s")
+            second = asyncio.ensure_future(self._send(alternate, endpoint, payload, task, timeout))
+            attempts.append(second)
+
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None and attempt.result().status_code == 200:
+                        if attempt is second:
+                            ollama_router.stats["hedge_won"] += 1
+                        return attempt.result()
+            # Aucune réponse valide: rendre celle du premier nœud (ou son erreur)
+            if first.exception() is None or second.exception() is not None:
+                return first.result()
+            return second.result()
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+
+    @staticmethod
+    def _affinity_key(session_id: Optional[int]) -> Optional[str]:
+        return f"session:{session_id}" if session_id is not None else None
+
+    @staticmethod
+    def _payload_key(payload: Dict) -> str:
+        if "messages" in payload:
+            prompt = json.dumps(payload["messages"], ensure_ascii=False)
+        else:
+            prompt = f"{payload.get('system', '')}\n{payload['prompt']}"
+        options = dict(payload.get("options", {}))
+        if "format" in payload:
+            options["format"] = payload["format"]
+        return request_key(payload["model"], prompt, options)
+
+    async def _stream_generate(
+        self,
+        payload: Dict,
+        task: str,
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        endpoint: str = "/api/generate",
+        session_id: Optional[int] = None
+    ) -> AsyncGenerator[str, None]:
+        """Flux de tokens /api/generate ou /api/chat via l'ordonnanceur"""
+        async with self._slot(task, user_id, section_id):
+            backend = ollama_router.select(self._affinity_key(session_id))
+            async with ollama_router.track(backend, slo=self.first_token_slo) as call:
+                async with ollama_client_pool.client.stream(
+                    "POST",
+                    f"{backend.url}{endpoint}",
+                    json=payload,
+                    timeout=ollama_client_pool.timeout(self.timeout)
+                ) as response:
+                    call.responded(response.status_code)
+                    if response.status_code != 200:
+                        yield OllamaErrorMessage(OLLAMA_ERROR_TEXTS["stream_status"])
+                        return
+                    async for line in response.aiter_lines():
+                        if line:
+                            try:
+                                data = json.loads(line)
+                                text = self._extract_text(data)
+                                if text:
+                                    yield text
+                                if data.get("done", False):
+                                    self._record_tokens(task, payload, data)
+                                    break
+                            except json.JSONDecodeError:
+                                continue
 
     async def generate_response(
         self,
         prompt: str,
         context: Optional[List[str]] = None,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        task: str = "answer",
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        session_id: Optional[int] = None,
+        json_schema: Optional[Dict] = None
     ) -> str:
-        """Générer une réponse avec Ollama"""
+        """
+        Générer une réponse avec Ollama, en routant vers le profil de la tâche.
+        `json_schema` contraint la sortie (option `format` d'Ollama).
+        """
+
+        profile = self._task_profile(task)
+        full_prompt = self._build_prompt(prompt, context, system_prompt, task=task, model=profile["model"])
+        logger.info(f"Ollama full_prompt to be sent: {full_prompt}")
+
+        payload = {
+            "model": profile["model"],
+            "prompt": full_prompt,
+            "stream": False,
+            "options": self._task_options(profile)
+        }
+        if json_schema is not None:
+            payload["format"] = json_schema
+
+        return await self._complete(
+            "/api/generate",
+            payload,
+            task=task,
+            user_id=user_id,
+            section_id=section_id,
+            session_id=session_id
+        )
 
-        full_prompt = self._build_prompt(prompt, context, system_prompt)
+    async def generate_chat_response(
+        self,
+        messages: List[Dict[str, str]],
+        task: str = "answer",
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        session_id: Optional[int] = None
+    ) -> str:
+        """Générer une réponse multi-tour via /api/chat (réutilise le cache KV d'Ollama)"""
+
+        profile = self._task_profile(task)
+        return await self._complete(
+            "/api/chat",
+            {
+                "model": profile["model"],
+                "messages": messages,
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": self._task_options(profile)
+            },
+            task=task,
+            user_id=user_id,
+            section_id=section_id,
+            session_id=session_id
+        )
 
+    async def _complete(
+        self,
+        endpoint: str,
+        payload: Dict,
+        task: str,
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        session_id: Optional[int] = None
+    ) -> str:
+        """Appel non streamé commun à /api/generate et /api/chat; en cas d'échec, un OllamaErrorMessage"""
+
+        model = payload["model"]
+        if not ollama_router.accepting():
+            raise OllamaUnavailableError("Service de génération temporairement indisponible (disjoncteur ouvert)")
         try:
-            timeout = self.timeout
-            is_healthy = await self.health_check()
-            if not is_healthy:
-                logger.error("Ollama service is not healthy.")
-                return "Désolé, le service de génération de texte n'est pas accessible. Veuillez vérifier la configuration."
-            
-            logger.info(f"Ollama full_prompt to be sent: {full_prompt}")
-
-
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": full_prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": self.temperature,
-                            "num_predict": self.max_tokens
-                        }
-                    }
-                )
-
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get("response", "")
-                elif response.status_code == 404:
-                    logger.error(f"Modèle {self.model} non trouvé.")
-                    return "Désolé, le modèle demandé n'est pas disponible actuellement."
-                elif response.status_code == 500:
-                    logger.error(f"Ollama returned 500 Internal Server Error for the preceding logged prompt. Ollama response: {response.text}")
-                    return "Désolé, le service de génération de texte a rencontré une erreur interne."
-                else:
-                    logger.error(f"Erreur Ollama: {response.status_code} - {response.text}")
-                    return "Désolé, je ne peux pas répondre pour le moment. Veuillez réessayer plus tard."
+            if not ollama_health_monitor.is_available():
+                logger.error(f"Ollama service is not healthy (cached): {ollama_health_monitor.state.error}")
+                return OllamaErrorMessage(OLLAMA_ERROR_TEXTS["misconfigured"])
+
+            response = await self._post_generate(
+                payload,
+                task=task,
+                timeout=self.timeout,
+                user_id=user_id,
+                section_id=section_id,
+                endpoint=endpoint,
+                session_id=session_id
+            )
 
+            if response.status_code == 200:
+                data = response.json()
+                self._record_tokens(task, payload, data)
+                return self._extract_text(data)
+            elif response.status_code == 404:
+                logger.error(f"Modèle {model} non trouvé.")
+                return OllamaErrorMessage(OLLAMA_ERROR_TEXTS["model_missing"])
+            elif response.status_code == 500:
+                logger.error(f"Ollama returned 500 Internal Server Error for the preceding logged prompt. Ollama response: {response.text}")
+                return OllamaErrorMessage(OLLAMA_ERROR_TEXTS["server_error"])
+            else:
+                logger.error(f"Erreur Ollama: {response.status_code} - {response.text}")
+                return OllamaErrorMessage(OLLAMA_ERROR_TEXTS["unavailable"])
+
+        except OllamaUnavailableError:
+            raise
         except httpx.ReadTimeout:
             logger.error("Timeout lors de l'appel à Ollama.")
-            return "Désolé, la génération de réponse a pris trop de temps. Veuillez essayer une question plus courte."
+            return OllamaErrorMessage(OLLAMA_ERROR_TEXTS["timeout"])
         except httpx.ConnectTimeout:
             logger.error("Impossible de se connecter au serveur Ollama.")
-            return "Désolé, le service de génération de texte n'est pas accessible actuellement."
-        except httpx.ConnectError:
-            logger.error(f"Erreur de connexion à Ollama à {self.base_url}")
-            return "Désolé, le service de génération de texte n'est pas accessible. Veuillez vérifier la configuration."
+            return OllamaErrorMessage(OLLAMA_ERROR_TEXTS["unreachable"])
+        except httpx.ConnectError as e:
+            logger.error(f"Erreur de connexion à Ollama: {e}")
+            return OllamaErrorMessage(OLLAMA_ERROR_TEXTS["misconfigured"])
         except Exception as e:
             logger.error(f"Erreur inattendue: {e}")
-            return "Désolé, une erreur s'est produite lors de la génération de la réponse."
+            return OllamaErrorMessage(OLLAMA_ERROR_TEXTS["failed"])
+
+    @staticmethod
+    def _extract_text(data: Dict) -> str:
+        """Texte d'une réponse Ollama (/api/generate ou /api/chat)"""
+        if "message" in data:
+            return (data.get("message") or {}).get("content", "")
+        return data.get("response", "")
+
+    @staticmethod
+    def _record_tokens(task: str, payload: Dict, data: Dict) -> None:
+        """Reporter les comptes de tokens d'Ollama (fin de réponse) au gestionnaire de budget"""
+        if "messages" in payload:
+            chars = sum(len(message.get("content", "")) for message in payload["messages"])
+            # Avec un historique, le préfixe est souvent déjà dans le cache KV: compte non représentatif
+            calibrate = len(payload["messages"]) <= 2
+        else:
+            chars = len(payload.get("system", "")) + len(payload["prompt"])
+            calibrate = True
+        token_budget.record_call(
+            task,
+            payload["model"],
+            chars,
+            data.get("prompt_eval_count"),
+            data.get("eval_count"),
+            calibrate=calibrate
+        )
 
     async def generate_streaming_response(
         self,
         prompt: str,
         context: Optional[List[str]] = None,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        task: str = "answer",
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        session_id: Optional[int] = None,
+        json_schema: Optional[Dict] = None
     ) -> AsyncGenerator[str, None]:
-        """Générer une réponse en streaming avec Ollama"""
-
-        full_prompt = self._build_prompt(prompt, context, system_prompt)
+        """Générer une réponse en streaming avec Ollama (sortie contrainte par `json_schema` si fourni)"""
+
+        profile = self._task_profile(task)
+        full_prompt = self._build_prompt(prompt, context, system_prompt, task=task, model=profile["model"])
+        payload = {
+            "model": profile["model"],
+            "prompt": full_prompt,
+            "stream": True,
+            "options": self._task_options(profile)
+        }
+        if json_schema is not None:
+            payload["format"] = json_schema
+        async for chunk in self._stream("/api/generate", payload, task, user_id, section_id, session_id):
+            yield chunk
+
+    async def generate_chat_streaming_response(
+        self,
+        messages: List[Dict[str, str]],
+        task: str = "answer",
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        session_id: Optional[int] = None
+    ) -> AsyncGenerator[str, None]:
+        """Générer une réponse multi-tour en streaming via /api/chat"""
+
+        profile = self._task_profile(task)
+        payload = {
+            "model": profile["model"],
+            "messages": messages,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": self._task_options(profile)
+        }
+        async for chunk in self._stream("/api/chat", payload, task, user_id, section_id, session_id):
+            yield chunk
+
+    async def _stream(
+        self,
+        endpoint: str,
+        payload: Dict,
+        task: str,
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        session_id: Optional[int] = None
+    ) -> AsyncGenerator[str, None]:
+        if not ollama_router.accepting():
+            raise OllamaUnavailableError("Service de génération temporairement indisponible (disjoncteur ouvert)")
+        if not ollama_health_monitor.is_available():
+            logger.error(f"Ollama service is not healthy (cached): {ollama_health_monitor.state.error}")
+            yield OllamaErrorMessage(OLLAMA_ERROR_TEXTS["unreachable"])
+            return
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": full_prompt,
-                        "stream": True,
-                        "options": {
-                            "temperature": self.temperature,
-                            "num_predict": self.max_tokens
-                        }
-                    }
-                ) as response:
-                    if response.status_code == 200:
-                        async for line in response.aiter_lines():
-                            if line:
-                                try:
-                                    data = json.loads(line)
-                                    if "response" in data:
-                                        yield data["response"]
-                                    if data.get("done", False):
-                                        break
-                                except json.JSONDecodeError:
-                                    continue
-                    else:
-                        yield "Erreur lors de la génération de la réponse."
-
+            # Les demandes identiques simultanées s'attachent au flux du leader
+            async for chunk in llm_singleflight.stream(
+                self._payload_key(payload),
+                lambda: self._stream_generate(payload, task, user_id, section_id, endpoint=endpoint, session_id=session_id)
+            ):
+                yield chunk
+
+        except OllamaUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Erreur lors du streaming Ollama: {e}")
-            yield "Désolé, une erreur s'est produite."
+            yield OllamaErrorMessage(OLLAMA_ERROR_TEXTS["stream_failed"])
+
+    def build_chat_messages(
+        self,
+        user_prompt: str,
+        context: Optional[List[str]] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        system_prompt: Optional[str] = None,
+        task: str = "answer"
+    ) -> List[Dict[str, str]]:
+        """
+        Construire les messages /api/chat: préfixe stable (système + historique), puis le tour courant.
+        Le contexte est réduit au budget de tokens restant après le préfixe et la question.
+        """
+
+        messages = [{"role": "system", "content": system_prompt or DEFAULT_SYSTEM_PROMPT}]
+        messages.extend(history or [])
+
+        # Le contexte RAG ne va que dans le dernier message pour ne pas casser le préfixe
+        content = ""
+        model = self._task_profile(task)["model"]
+        context = self._pack_context(
+            context, task, model, user_prompt, *(message["content"] for message in messages)
+        )
+        if context:
+            content += "### Contexte:\n"
+            for i, ctx in enumerate(context, 1):
+                content += f"[{i}] {ctx}\n"
+            content += "\n### Question:\n"
+        content += user_prompt
+        messages.append({"role": "user", "content": content})
+        return messages
 
     def _build_prompt(
         self,
         user_prompt: str,
         context: Optional[List[str]] = None,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        task: str = "answer",
+        model: Optional[str] = None
     ) -> str:
-        """Construire le prompt complet avec contexte"""
-
-        system = system_prompt or (
-            "Tu es un assistant éducatif pour l'UQAR. Réponds de manière pédagogique et précise. "
-            "Utilise le format Markdown pour structurer tes réponses : "
-            "**gras** pour les mots importants, `code` pour les termes techniques, "
-            "```code``` pour les blocs de code, ## pour les titres, et - pour les listes. "
-            "Si tu utilises des informations du contexte, cite tes sources."
-        )
+        """Construire le prompt complet, avec le contexte réduit au budget de tokens de la tâche"""
+
+        system = system_prompt or DEFAULT_SYSTEM_PROMPT
+        context = self._pack_context(context, task, model, system, user_prompt)
 
         prompt = f"### Instruction:\n{system}\n\n"
 
@@ -150,6 +515,22 @@ class OllamaService:
         prompt += f"### Question:\n{user_prompt}\n\n### Réponse:\n"
         return prompt
 
+    def _pack_context(
+        self,
+        context: Optional[List[str]],
+        task: str,
+        model: Optional[str],
+        *fixed: str
+    ) -> Optional[List[str]]:
+        """Garder les extraits (triés par pertinence) qui tiennent dans le budget, après les parties fixes"""
+        if not context:
+            return context
+        # En-têtes du gabarit (### Instruction, ### Contexte, ...)
+        budget = token_budget.available(task, *fixed, model=model) - PROMPT_TEMPLATE_TOKENS
+        packed = token_budget.pack(context, budget, model=model)
+        token_budget.record_packing(task, packed)
+        return packed.texts
+
     async def generate_exercise(
         self,
         content: str,
@@ -190,7 +571,7 @@ class OllamaService:
             """
 
         try:
-            response = await self.generate_response(user_prompt, system_prompt=system_prompt)
+            response = await self.generate_response(user_prompt, system_prompt=system_prompt, task="exercise")
             response = response.strip()
             if response.startswith("```json"):
                 response = response[7:]
@@ -206,7 +587,13 @@ class OllamaService:
                 "explanation": "Une erreur s'est produite"
             }
 
-    async def check_relevance(self, query: str, context: str) -> bool:
+    async def check_relevance(
+        self,
+        query: str,
+        context: str,
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None
+    ) -> bool:
         """Vérifie si la question est pertinente pour le contexte donné"""
 
         logger.info(f"Checking relevance for query: '{query[:50]}...' with context: '{context[:50]}...'")
@@ -221,41 +608,47 @@ class OllamaService:
             En cas de doute, réponds "oui".
             """
 
+            profile = self._task_profile("relevance")
             payload = {
-                "model": self.model,
+                "model": profile["model"],
                 "prompt": f"Contexte: {context}\n\nQuestion: {query}\n\nCette question est-elle pertinente au contexte fourni? Réponds uniquement par oui ou non.",
                 "system": system_prompt,
                 "stream": False,
-                "options": {
-                    "temperature": 0.1,
-                    "top_p": 0.9,
-                    "top_k": 40,
-                    "num_predict": 10,
-                },
+                "options": self._task_options(profile, top_p=0.9, top_k=40),
             }
 
-            url = f"{self.base_url}/api/generate"
-            logger.info(f"Sending relevance check request to Ollama at {url}")
+            logger.info("Sending relevance check request to Ollama /api/generate")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Ollama API error: {response.status} - {error_text}")
-                        return True
+            response = await self._post_generate(
+                payload,
+                task="relevance",
+                timeout=self.relevance_timeout,
+                user_id=user_id,
+                section_id=section_id
+            )
+            if response.status_code != 200:
+                logger.error(f"Ollama API error: {response.status_code} - {response.text}")
+                return True
 
-                    data = await response.json()
-                    response_text = data.get("response", "").strip().lower()
-                    logger.info(f"Relevance check raw response: '{response_text}'")
+            data = response.json()
+            self._record_tokens("relevance", payload, data)
+            response_text = data.get("response", "").strip().lower()
+            logger.info(f"Relevance check raw response: '{response_text}'")
 
-                    if "non" in response_text:
-                        return False
-                    return True
+            if "non" in response_text:
+                return False
+            return True
         except Exception as e:
             logger.error(f"Error in check_relevance: {e}", exc_info=True)
             return True
     
-    async def generate_title(self, question: str) -> str:
+    async def generate_title(
+        self,
+        question: str,
+        user_id: Optional[int] = None,
+        section_id: Optional[int] = None,
+        session_id: Optional[int] = None
+    ) -> str:
         """Génère un titre court résumant la question"""
 
         try:
@@ -268,7 +661,14 @@ class OllamaService:
             raw = await self.generate_response(
                 prompt=question,
                 system_prompt=system_prompt,
+                task="title",
+                user_id=user_id,
+                section_id=section_id,
+                session_id=session_id,
             )
+            if isinstance(raw, OllamaErrorMessage):
+                # Génération échouée: jamais de message d'erreur tronqué en guise de titre
+                return "Conversation"
 
             title_line = raw.strip().split("\n")[0]
             words = title_line.split()
@@ -279,39 +679,10 @@ class OllamaService:
             return "Conversation"
 
     async def health_check(self) -> bool:
-        """Vérifier si Ollama est disponible et si le modèle est chargé"""
+        """Vérifier si Ollama est disponible et si le modèle est chargé (sonde immédiate)"""
 
-        logger.info(f"Checking Ollama health at {self.base_url}")
-        try:
-            endpoints_to_check = [
-                ("/api/version", "Check API version"),
-                ("/api/tags", "Check available models"),
-            ]
-
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                for endpoint, description in endpoints_to_check:
-                    try:
-                        response = await client.get(f"{self.base_url}{endpoint}")
-                        if response.status_code != 200:
-                            logger.error(f"{description} failed: {response.status_code} - {response.text}")
-                            return False
-                        logger.info(f"{description} successful")
-                    except Exception as e:
-                        logger.error(f"{description} failed: {e}")
-                        return False
-
-                # Vérifier si le modèle est présent
-                tags_response = await client.get(f"{self.base_url}/api/tags")
-                if tags_response.status_code == 200:
-                    tags_data = tags_response.json()
-                    models = [model.get("name") for model in tags_data.get("models", [])]
-                    if self.model in models:
-                        logger.info(f"Model {self.model} is available")
-                        return True
-                    else:
-                        logger.error(f"Model {self.model} not in available models: {models}")
-                        return False
-                return False
-        except Exception as e:
-            logger.error(f"Ollama health check failed: {e}")
-            return False
+        logger.info(f"Checking Ollama health at {', '.join(self.backends)}")
+        state = await ollama_health_monitor.refresh()
+        if not state.healthy:
+            logger.error(f"Ollama health check failed: {state.error}")
+        return bool(state.healthy)
@@ -0,0 +1,153 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..core.config import settings
+from .embeddings import embed_texts
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SectionProfile:
+    """Profil sémantique d'une section: centroïde des chunks et seuils dérivés"""
+    centroid: np.ndarray
+    centroid_accept: float  # similarité au centroïde au-dessus de laquelle on accepte
+    centroid_reject: float  # similarité au centroïde en dessous de laquelle on peut rejeter
+    description_embedding: Optional[np.ndarray]
+    chunk_count: int
+    built_at: float
+
+
+@dataclass
+class RelevanceDecision:
+    verdict: str  # "relevant", "irrelevant" ou "borderline"
+    reason: str
+    scores: Dict[str, Any]
+
+    @property
+    def relevant(self) -> bool:
+        return self.verdict != "irrelevant"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class RelevanceGate:
+    """
+    Filtre de pertinence basé sur les distances de récupération Chroma et un profil
+    de section précalculé. Seuls les cas limites sont envoyés au classifieur LLM.
+    """
+
+    def __init__(self):
+        self.accept_distance = settings.RELEVANCE_ACCEPT_DISTANCE
+        self.reject_distance = settings.RELEVANCE_REJECT_DISTANCE
+        self.description_accept = settings.RELEVANCE_DESCRIPTION_ACCEPT
+        self.profile_ttl = settings.RELEVANCE_PROFILE_TTL
+        self.profile_max_chunks = settings.RELEVANCE_PROFILE_MAX_CHUNKS
+        self._profiles: Dict[str, SectionProfile] = {}
+        self.stats = {"relevant": 0, "irrelevant": 0, "borderline": 0}
+
+    def invalidate(self, collection_name: str) -> None:
+        """Oublier le profil d'une section (documents ajoutés ou supprimés)"""
+        self._profiles.pop(collection_name, None)
+
+    def cached_profile(self, collection_name: str) -> Optional[SectionProfile]:
+        """Profil en cache s'il n'a pas expiré"""
+        cached = self._profiles.get(collection_name)
+        if cached is not None and time.time() - cached.built_at < self.profile_ttl:
+            return cached
+        return None
+
+    def get_profile(self, section: Any, collection: Any) -> Optional[SectionProfile]:
+        """Profil en cache ou construit à partir des embeddings stockés dans la collection"""
+
+        cached = self.cached_profile(section.chroma_collection_name)
+        if cached is not None:
+            return cached
+
+        try:
+            data = collection.get(limit=self.profile_max_chunks, include=["embeddings"])
+            embeddings = data.get("embeddings") if data else None
+            if embeddings is None or len(embeddings) == 0:
+                return None
+
+            chunks = _normalize(np.asarray(embeddings, dtype=np.float32))
+            centroid = _normalize(chunks.mean(axis=0))
+            similarities = chunks @ centroid
+
+            description_embedding = None
+            description = f"{section.name}. {section.description or ''}".strip()
+            vectors = embed_texts([description])
+            if vectors:
+                description_embedding = _normalize(np.asarray(vectors[0], dtype=np.float32))
+
+            profile = SectionProfile(
+                centroid=centroid,
+                # 90 % des chunks de la section sont au-dessus de ce seuil
+                centroid_accept=float(np.percentile(similarities, 10)),
+                # nettement en dessous du chunk le plus éloigné
+                centroid_reject=float(similarities.min()) - 0.1,
+                description_embedding=description_embedding,
+                chunk_count=len(chunks),
+                built_at=time.time(),
+            )
+            self._profiles[section.chroma_collection_name] = profile
+            logger.info(
+                f"Built relevance profile for {section.chroma_collection_name}: {profile.chunk_count} chunks, "
+                f"accept>={profile.centroid_accept:.3f}, reject<{profile.centroid_reject:.3f}"
+            )
+            return profile
+        except Exception as e:
+            logger.error(f"Could not build relevance profile for {section.chroma_collection_name}: {e}")
+            return None
+
+    def evaluate(
+        self,
+        profile: Optional[SectionProfile],
+        distances: Optional[List[float]],
+        query_embedding: Optional[List[float]] = None,
+    ) -> RelevanceDecision:
+        """Décider en quelques millisecondes à partir des distances (cosinus) et du profil"""
+
+        scores: Dict[str, Any] = {}
+        if distances:
+            scores["min_distance"] = round(float(min(distances)), 4)
+        if profile is not None and query_embedding is not None:
+            query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+            scores["centroid_similarity"] = round(float(query @ profile.centroid), 4)
+            if profile.description_embedding is not None:
+                scores["description_similarity"] = round(float(query @ profile.description_embedding), 4)
+
+        min_distance = scores.get("min_distance")
+        centroid_similarity = scores.get("centroid_similarity")
+        description_similarity = scores.get("description_similarity")
+
+        if min_distance is None and centroid_similarity is None:
+            decision = RelevanceDecision("borderline", "no retrieval signal", scores)
+        elif (min_distance is not None and min_distance <= self.accept_distance) or (
+            centroid_similarity is not None and centroid_similarity >= profile.centroid_accept
+        ) or (description_similarity is not None and description_similarity >= self.description_accept):
+            decision = RelevanceDecision("relevant", "close to section content", scores)
+        elif (min_distance is None or min_distance >= self.reject_distance) and (
+            centroid_similarity is None or centroid_similarity < profile.centroid_reject
+        ):
+            decision = RelevanceDecision("irrelevant", "far from section content", scores)
+        else:
+            decision = RelevanceDecision("borderline", "between thresholds", scores)
+
+        self.stats[decision.verdict] += 1
+        logger.info(f"Relevance gate: {decision.verdict} ({decision.reason}) {scores}")
+        return decision
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "profiles_cached": len(self._profiles)}
+
+
+# Instance globale du filtre de pertinence
+relevance_gate = RelevanceGate()
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from sentence_transformers import CrossEncoder
+    CROSS_ENCODER_AVAILABLE = True
+except (ImportError, RuntimeError):
+    CROSS_ENCODER_AVAILABLE = False
+
+from ..core.config import settings
+from .embeddings import normalize_query
+from .metrics import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Second étage de la recherche: un petit cross-encoder (CPU, pool de threads dédié) note chaque
+    paire (question, extrait) parmi les candidats sur-échantillonnés. Au-delà de `timeout` secondes,
+    l'appelant garde l'ordre de la fusion; le calcul se termine en arrière-plan et remplit le cache
+    des scores, indexé par (empreinte de la question, identifiant de l'extrait).
+    """
+
+    def __init__(self):
+        self.enabled = settings.RERANK_ENABLED
+        self.model_name = settings.RERANK_MODEL
+        self.candidates = settings.RERANK_CANDIDATES
+        self.top_k = settings.RERANK_TOP_K
+        self.timeout = settings.RERANK_TIMEOUT
+        self.cache_size = settings.RERANK_CACHE_SIZE
+        self._model = None
+        self._load_failed = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.latency = LatencyWindow()
+        self.stats = {"calls": 0, "pairs": 0, "cache_hits": 0, "timeouts": 0, "errors": 0, "reordered": 0}
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and CROSS_ENCODER_AVAILABLE and not self._load_failed
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, settings.RERANK_WORKERS), thread_name_prefix="rerank")
+        return self._executor
+
+    def _get_model(self):
+        with self._load_lock:
+            if self._model is None:
+                self._model = CrossEncoder(self.model_name, device="cpu")
+                logger.info(f"Cross-encoder loaded: {self.model_name}")
+            return self._model
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def _score(self, query_hash: str, query: str, pending: List[Tuple[str, str]]) -> None:
+        """Noter les paires absentes du cache (exécuté sur le pool du reranker)"""
+        scores = self._get_model().predict([(query, text) for _, text in pending], batch_size=len(pending))
+        with self._lock:
+            for (chunk_id, _), score in zip(pending, scores):
+                self._scores[(query_hash, chunk_id)] = float(score)
+                self._scores.move_to_end((query_hash, chunk_id))
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    async def rerank(self, query: str, chunks: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Extraits triés par score du cross-encoder (clé `rerank_score`); None si indisponible ou trop lent"""
+        if not self.available or len(chunks) < 2:
+            return None
+        self.stats["calls"] += 1
+        self.stats["pairs"] += len(chunks)
+        started = time.perf_counter()
+        query_hash = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+        scores: Dict[str, float] = {}
+        pending: List[Tuple[str, str]] = []
+        for chunk in chunks:
+            score = self._cached((query_hash, chunk["id"]))
+            if score is None:
+                pending.append((chunk["id"], chunk["text"]))
+            else:
+                scores[chunk["id"]] = score
+        self.stats["cache_hits"] += len(scores)
+
+        if pending:
+            task = asyncio.get_running_loop().run_in_executor(self.executor, self._score, query_hash, query, pending)
+            # Une erreur survenue après le délai est lue ici (pas d'avertissement "never retrieved")
+            task.add_done_callback(lambda future: future.cancelled() or future.exception())
+            try:
+                # shield: après le délai, le calcul continue et remplit le cache pour la prochaine fois
+                await asyncio.wait_for(asyncio.shield(task), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                logger.warning(f"Reranking exceeded its {self.timeout:.2f}s budget; keeping fused order")
+                return None
+            except Exception as e:
+                self.stats["errors"] += 1
+                if self._model is None:
+                    self._load_failed = True
+                logger.error(f"Reranking failed: {e}")
+                return None
+            for chunk_id, _ in pending:
+                score = self._cached((query_hash, chunk_id))
+                if score is not None:
+                    scores[chunk_id] = score
+
+        ranked = sorted(chunks, key=lambda chunk: scores.get(chunk["id"], float("-inf")), reverse=True)
+        self.latency.add((time.perf_counter() - started) * 1000)
+        if [chunk["id"] for chunk in ranked] != [chunk["id"] for chunk in chunks]:
+            self.stats["reordered"] += 1
+        return [{**chunk, "rerank_score": scores.get(chunk["id"])} for chunk in ranked]
+
+    def shutdown(self) -> None:
+        """Libérer les threads (appelé à l'arrêt de FastAPI)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "available": self.available,
+            "model": self.model_name,
+            "cached_scores": len(self._scores),
+            **self.stats,
+            "latency": self.latency.to_dict(),
+        }
+
+
+# Instance globale du reranker
+reranker = CrossEncoderReranker()
@@ -0,0 +1,77 @@
+import logging
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Sequence
+
+from ..core.config import get_retrieval_policies
+
+logger = logging.getLogger(__name__)
+
+# Par point d'appel: requêtes, candidats reçus de Chroma, extraits gardés et cause de la coupure
+retrieval_stats: Dict[str, Dict[str, int]] = {}
+
+
+@dataclass(frozen=True)
+class RetrievalPolicy:
+    """
+    Top-k adaptatif: Chroma renvoie `fetch_k` candidats triés par distance, on en garde au
+    moins `min_k` et au plus `max_k`, en s'arrêtant au premier qui dépasse `max_distance`
+    ou dont la similarité (1 - distance) tombe sous (1 - relative_gap) × celle du meilleur.
+    """
+    site: str
+    min_k: int
+    max_k: int
+    fetch_k: int
+    max_distance: float
+    relative_gap: float
+
+    def cut(self, distances: Sequence[float]) -> int:
+        """Nombre de résultats à garder (distances triées par ordre croissant)"""
+        stats = retrieval_stats.setdefault(self.site, {
+            "queries": 0, "candidates": 0, "kept": 0, "cut_by_distance": 0, "cut_by_gap": 0, "cut_by_max_k": 0,
+        })
+        stats["queries"] += 1
+        stats["candidates"] += len(distances)
+        if not distances:
+            return 0
+
+        best_similarity = 1 - distances[0]
+        keep = 0
+        for distance in distances:
+            if keep >= self.max_k:
+                stats["cut_by_max_k"] += 1
+                break
+            if keep >= self.min_k:
+                if distance > self.max_distance:
+                    stats["cut_by_distance"] += 1
+                    break
+                if best_similarity > 0 and 1 - distance < best_similarity * (1 - self.relative_gap):
+                    stats["cut_by_gap"] += 1
+                    break
+            keep += 1
+        stats["kept"] += keep
+        return keep
+
+
+def get_retrieval_policy(site: str, **overrides: Any) -> RetrievalPolicy:
+    """Politique d'un point d'appel; `overrides` ajuste un appel (ex: max_k selon le nombre de questions)"""
+    policy = RetrievalPolicy(site=site, **get_retrieval_policies()[site])
+    if overrides:
+        policy = replace(policy, **overrides)
+    # Toujours demander assez de candidats pour atteindre max_k
+    return replace(
+        policy,
+        min_k=min(policy.min_k, policy.max_k),
+        fetch_k=max(policy.fetch_k, policy.max_k)
+    )
+
+
+def get_retrieval_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {}
+    for site, counts in retrieval_stats.items():
+        queries = counts["queries"]
+        stats[site] = {
+            **counts,
+            "avg_kept": round(counts["kept"] / queries, 2) if queries else 0.0,
+            "avg_candidates": round(counts["candidates"] / queries, 2) if queries else 0.0,
+        }
+    return stats
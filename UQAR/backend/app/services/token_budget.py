@@ -0,0 +1,219 @@
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from ..core.config import settings, get_ollama_task_profiles
+
+logger = logging.getLogger(__name__)
+
+# Bornes des ratios caractères/token acceptés pour la calibration: en dehors, la mesure
+# d'Ollama est faussée (préfixe déjà dans le cache KV, prompt tronqué à num_ctx)
+MIN_CHARS_PER_TOKEN = 1.5
+MAX_CHARS_PER_TOKEN = 6.0
+# Poids d'une nouvelle mesure dans la moyenne mobile du ratio
+CALIBRATION_ALPHA = 0.1
+# Prompts trop courts pour une mesure fiable (le gabarit du modèle pèse trop)
+MIN_CALIBRATION_TOKENS = 200
+# Un extrait n'est tronqué que s'il en reste au moins ce nombre de tokens; sinon il est écarté
+MIN_TRUNCATED_TOKENS = 64
+TRUNCATION_MARKER = " […]"
+
+
+class TokenEstimator:
+    """
+    Estimation rapide du nombre de tokens (longueur / caractères par token), sans tokenizer.
+    Le ratio de chaque modèle est recalibré sur le `prompt_eval_count` renvoyé par Ollama.
+    """
+
+    def __init__(self, chars_per_token: float):
+        self.default_ratio = chars_per_token
+        self.ratios: Dict[str, float] = {}
+        self.samples: Dict[str, int] = {}
+
+    def ratio(self, model: Optional[str] = None) -> float:
+        return self.ratios.get(model, self.default_ratio) if model else self.default_ratio
+
+    def estimate(self, text: str, model: Optional[str] = None) -> int:
+        if not text:
+            return 0
+        return math.ceil(len(text) / self.ratio(model))
+
+    def observe(self, model: str, chars: int, prompt_eval_count: int) -> None:
+        """Ajuster le ratio du modèle avec le nombre de tokens réellement évalués"""
+        if prompt_eval_count < MIN_CALIBRATION_TOKENS:
+            return
+        observed = chars / prompt_eval_count
+        if not MIN_CHARS_PER_TOKEN <= observed <= MAX_CHARS_PER_TOKEN:
+            return
+        current = self.ratios.get(model, self.default_ratio)
+        self.ratios[model] = current + CALIBRATION_ALPHA * (observed - current)
+        self.samples[model] = self.samples.get(model, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "default_chars_per_token": self.default_ratio,
+            "models": {
+                model: {"chars_per_token": round(ratio, 3), "samples": self.samples.get(model, 0)}
+                for model, ratio in self.ratios.items()
+            },
+        }
+
+
+@dataclass
+class PackedContext:
+    """Extraits retenus dans le budget (ordre d'origine), et ce qui a été écarté ou coupé"""
+    texts: List[str] = field(default_factory=list)
+    tokens: int = 0
+    budget: int = 0
+    dropped: int = 0
+    truncated: int = 0
+
+
+class TokenBudget:
+    """
+    Budget de tokens du prompt par tâche: num_ctx - num_predict du profil de la tâche,
+    moins une marge pour l'erreur d'estimation. Remplit le contexte par pertinence dans ce
+    budget, tronque de façon déterministe et comptabilise les tokens de chaque appel.
+    """
+
+    def __init__(self):
+        self.estimator = TokenEstimator(settings.TOKEN_ESTIMATOR_CHARS_PER_TOKEN)
+        self.margin = settings.TOKEN_BUDGET_MARGIN
+        self.budgets: Dict[str, int] = {}
+        self.models: Dict[str, str] = {}
+        for task, profile in get_ollama_task_profiles().items():
+            self.budgets[task] = int((profile["num_ctx"] - profile["num_predict"]) * (1 - self.margin))
+            self.models[task] = profile["model"]
+        self.budgets.update(settings.TOKEN_BUDGET_OVERRIDES)
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def estimate(self, text: str, model: Optional[str] = None) -> int:
+        return self.estimator.estimate(text, model)
+
+    def prompt_budget(self, task: str) -> int:
+        return self.budgets.get(task, self.budgets["answer"])
+
+    def model_for(self, task: str) -> Optional[str]:
+        return self.models.get(task)
+
+    def available(self, task: str, *fixed: str, model: Optional[str] = None) -> int:
+        """Tokens restants pour le contexte une fois comptées les parties fixes du prompt"""
+        model = model or self.model_for(task)
+        return self.prompt_budget(task) - sum(self.estimate(text, model) for text in fixed)
+
+    def truncate(self, text: str, max_tokens: int, model: Optional[str] = None) -> str:
+        """Couper `text` à `max_tokens` sur une fin de phrase ou un espace (même entrée, même sortie)"""
+        if self.estimate(text, model) <= max_tokens:
+            return text
+        max_chars = max(0, int(max_tokens * self.estimator.ratio(model)) - len(TRUNCATION_MARKER))
+        cut = text[:max_chars]
+        # Reculer jusqu'à une frontière naturelle, sans perdre plus d'un cinquième du texte gardé
+        floor = int(max_chars * 0.8)
+        boundary = max(cut.rfind(". "), cut.rfind("\n"))
+        if boundary < floor:
+            boundary = cut.rfind(" ")
+        if boundary >= floor:
+            cut = cut[:boundary + 1]
+        return cut.rstrip() + TRUNCATION_MARKER
+
+    def pack(
+        self,
+        texts: Sequence[str],
+        budget: int,
+        priority: Optional[Sequence[int]] = None,
+        item_overhead: int = 4,
+        model: Optional[str] = None
+    ) -> PackedContext:
+        """
+        Retenir les extraits par ordre de `priority` (indices, par défaut l'ordre de `texts`,
+        supposé trié par pertinence) tant qu'ils tiennent dans `budget`. Le premier extrait qui
+        dépasse est tronqué au reste du budget, les suivants sont écartés. Les extraits retenus
+        gardent leur ordre d'origine. `item_overhead` compte le séparateur ou la numérotation.
+        """
+        order = list(priority) if priority is not None else list(range(len(texts)))
+        kept: Dict[int, str] = {}
+        packed = PackedContext(budget=max(0, budget))
+        remaining = packed.budget
+        for position, index in enumerate(order):
+            cost = self.estimate(texts[index], model) + item_overhead
+            if cost <= remaining:
+                kept[index] = texts[index]
+                remaining -= cost
+                continue
+            if remaining - item_overhead >= MIN_TRUNCATED_TOKENS:
+                kept[index] = self.truncate(texts[index], remaining - item_overhead, model)
+                remaining -= self.estimate(kept[index], model) + item_overhead
+                packed.truncated += 1
+                position += 1
+            packed.dropped = len(order) - position
+            break
+        packed.texts = [kept[index] for index in sorted(kept)]
+        packed.tokens = packed.budget - remaining
+        return packed
+
+    def record_packing(self, task: str, packed: PackedContext) -> None:
+        stats = self._task_stats(task)
+        stats["packed_calls"] += 1
+        stats["dropped_items"] += packed.dropped
+        stats["truncated_items"] += packed.truncated
+        if packed.dropped or packed.truncated:
+            stats["trimmed_calls"] += 1
+            logger.info(
+                f"Context for '{task}' trimmed to {packed.tokens}/{packed.budget} tokens "
+                f"({len(packed.texts)} kept, {packed.truncated} truncated, {packed.dropped} dropped)"
+            )
+
+    def record_call(
+        self,
+        task: str,
+        model: str,
+        prompt_chars: int,
+        prompt_eval_count: Optional[int],
+        eval_count: Optional[int],
+        calibrate: bool = True
+    ) -> None:
+        """Comptes finaux d'un appel: estimation avant envoi et nombres rapportés par Ollama"""
+        estimated = math.ceil(prompt_chars / self.estimator.ratio(model)) if prompt_chars else 0
+        stats = self._task_stats(task)
+        stats["calls"] += 1
+        stats["estimated_prompt_tokens"] += estimated
+        stats["prompt_eval_count"] += prompt_eval_count or 0
+        stats["eval_count"] += eval_count or 0
+        stats["last"] = {
+            "model": model,
+            "budget": self.prompt_budget(task),
+            "estimated_prompt_tokens": estimated,
+            "prompt_eval_count": prompt_eval_count,
+            "eval_count": eval_count,
+        }
+        logger.info(
+            f"Tokens for '{task}' ({model}): prompt ~{estimated} estimated / {prompt_eval_count} evaluated "
+            f"(budget {self.prompt_budget(task)}), {eval_count} generated"
+        )
+        if calibrate and prompt_eval_count:
+            self.estimator.observe(model, prompt_chars, prompt_eval_count)
+
+    def _task_stats(self, task: str) -> Dict[str, Any]:
+        return self.stats.setdefault(task, {
+            "calls": 0,
+            "estimated_prompt_tokens": 0,
+            "prompt_eval_count": 0,
+            "eval_count": 0,
+            "packed_calls": 0,
+            "trimmed_calls": 0,
+            "truncated_items": 0,
+            "dropped_items": 0,
+            "last": None,
+        })
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "budgets": self.budgets,
+            "estimator": self.estimator.to_dict(),
+            "tasks": self.stats,
+        }
+
+
+# Instance globale du gestionnaire de budget
+token_budget = TokenBudget()
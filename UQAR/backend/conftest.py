@@ -0,0 +1,26 @@
+"""
+Configuration pytest des tests unitaires du backend: aucun serveur requis (Ollama, Chroma, PostgreSQL).
+Les paramètres sont lus à l'import de app.core.config: l'environnement de test est donc fixé ici,
+avant que les modules de test n'importent l'application.
+"""
+
+import os
+
+# Deux nœuds Ollama fictifs (routeur, disjoncteurs); jamais contactés par les tests
+os.environ["OLLAMA_BACKENDS"] = "http://ollama-a:11434,http://ollama-b:11434"
+# Embeddings déterministes sans modèle, sans cache disque partagé
+os.environ["EMBEDDING_BACKEND"] = "hash"
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+# Scripts de vérification manuelle contre une instance en marche (API, Chroma, Ollama)
+collect_ignore = [
+    "test_chat.py",
+    "test_chroma.py",
+    "test_chroma_collection.py",
+    "test_documents_api.py",
+    "test_markdown_rendering.py",
+    "test_ollama.py",
+    "test_ollama_with_host.py",
+    "test_streaming.py",
+    "app/scripts/test_exercise_generation.py",
+]
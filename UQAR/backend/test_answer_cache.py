@@ -0,0 +1,73 @@
+"""Cache des réponses du chat: niveaux exact et sémantique, invalidation par version de section"""
+
+from unittest import mock
+
+from app.services.answer_cache import AnswerCache
+
+
+def _store(cache: AnswerCache, question: str, answer: str, embedding=None, section_id: int = 1):
+    cache.store(section_id, question, answer, embedding, generation_ms=1200.0, version=cache.version(section_id))
+
+
+def test_exact_hit_on_normalized_question():
+    cache = AnswerCache()
+    _store(cache, "Qu'est-ce que la mitose ?", "Une division cellulaire.")
+    entry, tier = cache.lookup(1, "  qu'est-ce que   LA mitose ? ")
+    assert tier == "exact" and entry.answer == "Une division cellulaire."
+    assert cache.stats["exact_hits"] == 1 and cache.stats["llm_ms_saved"] == 1200.0
+    # Les sections ne partagent pas leurs réponses
+    assert cache.lookup(2, "Qu'est-ce que la mitose ?") is None
+
+
+def test_semantic_hit_above_threshold_only():
+    cache = AnswerCache()
+    _store(cache, "Qu'est-ce que la mitose ?", "Une division cellulaire.", embedding=[1.0, 0.0, 0.0])
+    # Similarité cosinus ≈ 0.995, au-dessus du seuil de 0.95 (l'embedding est normalisé au stockage)
+    entry, tier = cache.lookup(1, "Explique la mitose", [2.0, 0.2, 0.0])
+    assert tier == "semantic" and entry.answer == "Une division cellulaire."
+    # Similarité ≈ 0.89: question différente
+    assert cache.lookup(1, "Et la méiose ?", [1.0, 0.5, 0.0]) is None
+    assert cache.stats["semantic_hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_invalidation_clears_section_and_rejects_stale_answers():
+    cache = AnswerCache()
+    _store(cache, "Question", "Ancienne réponse")
+    version = cache.version(1)
+    cache.invalidate(1)
+    assert cache.lookup(1, "Question") is None
+    assert cache.version(1) == version + 1
+
+    # Réponse générée avant l'upload: jamais stockée
+    cache.store(1, "Question", "Réponse obsolète", None, generation_ms=900.0, version=version)
+    assert cache.lookup(1, "Question") is None
+    assert cache.stats["stale_stores"] == 1
+
+    _store(cache, "Question", "Nouvelle réponse")
+    assert cache.lookup(1, "Question")[0].answer == "Nouvelle réponse"
+
+
+def test_expired_entries_not_served():
+    cache = AnswerCache()
+    with mock.patch("app.services.answer_cache.time.time", return_value=1000.0):
+        _store(cache, "Question", "Réponse")
+    with mock.patch("app.services.answer_cache.time.time", return_value=1000.0 + cache.ttl + 1):
+        assert cache.lookup(1, "Question") is None
+    assert not cache.has_entries(1)
+
+
+def test_least_recently_used_entry_evicted():
+    cache = AnswerCache()
+    cache.max_entries = 2
+    _store(cache, "A", "réponse A")
+    _store(cache, "B", "réponse B")
+    assert cache.lookup(1, "A") is not None  # A devient la plus récente
+    _store(cache, "C", "réponse C")
+    assert cache.lookup(1, "B") is None
+    assert cache.lookup(1, "A") is not None and cache.lookup(1, "C") is not None
+
+
+def test_blank_answer_not_stored():
+    cache = AnswerCache()
+    _store(cache, "Question", "   ")
+    assert not cache.has_entries(1)
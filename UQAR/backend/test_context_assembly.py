@@ -0,0 +1,77 @@
+"""Assemblage du contexte: fusion des extraits consécutifs et retrait des passages quasi identiques"""
+
+from app.services.context_assembly import assemble_context
+
+
+def _chunk(text: str, document_id="1", chunk_index=None, distance=None):
+    metadata = {"document_id": document_id}
+    if chunk_index is not None:
+        metadata["chunk_index"] = chunk_index
+    return {"text": text, "metadata": metadata, "distance": distance}
+
+
+def test_consecutive_chunks_merged_without_overlap():
+    # Le découpage répète la fin de l'extrait 4 au début du 5, classé plus pertinent
+    chunks = [
+        _chunk("Elle possède son propre ADN. Sa membrane interne forme des crêtes.", chunk_index=5, distance=0.1),
+        _chunk("la mitochondrie produit l'ATP. Elle possède son propre ADN.", chunk_index=4, distance=0.3),
+    ]
+    assembled = assemble_context(chunks)
+    assert len(assembled) == 1
+    assert assembled[0]["text"] == (
+        "la mitochondrie produit l'ATP. Elle possède son propre ADN. Sa membrane interne forme des crêtes."
+    )
+    # Le passage fusionné prend la distance du meilleur extrait
+    assert assembled[0]["distance"] == 0.1
+    assert chunks[1]["text"].startswith("la mitochondrie") and chunks[1]["distance"] == 0.3  # entrée non modifiée
+
+
+def test_merged_passage_takes_best_rank():
+    chunks = [
+        _chunk("Extrait du second document sur un autre sujet.", document_id="2", chunk_index=0),
+        _chunk("Suite du premier document, partie B.", chunk_index=8),
+        _chunk("Début du premier document, partie A. ", chunk_index=7),
+    ]
+    assembled = assemble_context(chunks)
+    assert [chunk["text"] for chunk in assembled] == [
+        "Extrait du second document sur un autre sujet.",
+        "Début du premier document, partie A. Suite du premier document, partie B.",
+    ]
+
+
+def test_non_consecutive_and_other_documents_kept_apart():
+    chunks = [
+        _chunk("Premier passage sur les enzymes digestives.", chunk_index=1),
+        _chunk("Troisième passage sur le système nerveux central.", chunk_index=3),
+        _chunk("Deuxième document sur la photosynthèse des plantes.", document_id="2", chunk_index=2),
+    ]
+    assert [chunk["text"] for chunk in assemble_context(chunks)] == [chunk["text"] for chunk in chunks]
+
+
+def test_duplicate_passage_dropped():
+    text = "Le cycle de Krebs se déroule dans la matrice mitochondriale et produit du NADH."
+    chunks = [
+        _chunk(text, document_id="1", chunk_index=0),
+        _chunk("Un autre passage sans rapport avec le précédent, sur la génétique.", document_id="1", chunk_index=9),
+        _chunk(text, document_id="2", chunk_index=0),  # même document téléversé deux fois
+    ]
+    assembled = assemble_context(chunks)
+    assert [chunk["metadata"]["document_id"] for chunk in assembled] == ["1", "1"]
+    assert assembled[0]["text"] == text
+
+
+def test_containing_passage_replaces_contained_one_at_its_rank():
+    short = "La photosynthèse convertit l'énergie lumineuse en énergie chimique dans les chloroplastes."
+    longer = short + " Elle libère du dioxygène et consomme du dioxyde de carbone."
+    chunks = [
+        _chunk(short, document_id="1"),
+        _chunk("Passage intermédiaire sur la respiration cellulaire des animaux.", document_id="3"),
+        _chunk(longer, document_id="2"),
+    ]
+    assembled = assemble_context(chunks)
+    assert [chunk["text"] for chunk in assembled] == [longer, chunks[1]["text"]]
+
+
+def test_single_chunk_unchanged():
+    chunks = [_chunk("Seul extrait.", chunk_index=0)]
+    assert assemble_context(chunks) is chunks
@@ -0,0 +1,54 @@
+"""Sélection MMR des extraits d'exercice, avec quota d'extraits par document"""
+
+from app.services.diversity import mmr_select
+
+
+def _chunk(chunk_id: str, document_id=None):
+    metadata = {"document_id": document_id} if document_id is not None else {}
+    return {"id": chunk_id, "text": chunk_id, "metadata": metadata}
+
+
+def test_mmr_skips_near_duplicates():
+    chunks = [_chunk("a", "1"), _chunk("a_bis", "2"), _chunk("b", "3")]
+    embeddings = [[1.0, 0.0], [0.99, 0.01], [0.6, 0.8]]
+    selected = mmr_select(chunks, [1.0, 0.0], embeddings, k=2, lambda_mult=0.3)
+    assert [chunk["id"] for chunk in selected] == ["a", "b"]
+
+
+def test_mmr_pure_relevance_with_lambda_one():
+    chunks = [_chunk("far", "1"), _chunk("near", "2"), _chunk("middle", "3"), _chunk("near_bis", "4")]
+    embeddings = [[0.0, 1.0], [1.0, 0.0], [0.7, 0.7], [0.99, 0.01]]
+    selected = mmr_select(chunks, [1.0, 0.0], embeddings, k=3, lambda_mult=1.0)
+    assert [chunk["id"] for chunk in selected] == ["near", "near_bis", "middle"]
+
+
+def test_mmr_document_quota():
+    # Le document "1" est le plus pertinent, mais limité à ceil(0.5 × 4) = 2 extraits
+    chunks = [_chunk(f"1_{i}", "1") for i in range(4)] + [_chunk("2_0", "2"), _chunk("3_0", "3")]
+    embeddings = [[1.0, 0.01 * i] for i in range(4)] + [[0.5, 0.5], [0.3, 0.7]]
+    selected = mmr_select(chunks, [1.0, 0.0], embeddings, k=4, lambda_mult=1.0, document_share=0.5)
+    documents = [chunk["metadata"]["document_id"] for chunk in selected]
+    assert documents.count("1") == 2
+    assert set(documents) == {"1", "2", "3"}
+
+
+def test_mmr_quota_relaxed_when_no_other_document():
+    chunks = [_chunk(f"1_{i}", "1") for i in range(4)] + [_chunk("2_0", "2")]
+    embeddings = [[1.0, 0.01 * i] for i in range(4)] + [[0.5, 0.5]]
+    selected = mmr_select(chunks, [1.0, 0.0], embeddings, k=4, lambda_mult=1.0, document_share=0.25)
+    # Quota d'un extrait par document, mais seul le document "1" a encore des candidats
+    assert len(selected) == 4
+    assert [chunk["metadata"]["document_id"] for chunk in selected].count("2") == 1
+
+
+def test_mmr_unknown_document_never_limited():
+    chunks = [_chunk(f"x{i}") for i in range(3)] + [_chunk("1_0", "1")]
+    embeddings = [[1.0, 0.01 * i] for i in range(3)] + [[0.0, 1.0]]
+    selected = mmr_select(chunks, [1.0, 0.0], embeddings, k=3, lambda_mult=1.0, document_share=0.34)
+    assert [chunk["id"] for chunk in selected] == ["x0", "x1", "x2"]
+
+
+def test_mmr_returns_everything_when_k_covers_pool():
+    chunks = [_chunk("a", "1"), _chunk("b", "1")]
+    assert mmr_select(chunks, [1.0, 0.0], [[1.0, 0.0], [0.0, 1.0]], k=5) == chunks
+
@@ -0,0 +1,109 @@
+"""Moteur d'embeddings sans modèle ni réseau: embedder par hachage (EMBEDDING_BACKEND=hash, voir conftest.py)"""
+
+from unittest import mock
+
+import numpy as np
+
+from app.services.embeddings import EmbeddingEngine, HashEmbedder, QueryEmbeddingCache
+
+
+class CountingEmbedder(HashEmbedder):
+    """HashEmbedder qui garde la trace de chaque lot calculé"""
+
+    def __init__(self, dimension: int = 64):
+        super().__init__(dimension)
+        self.batches = []
+
+    def embed(self, texts):
+        self.batches.append(list(texts))
+        return super().embed(texts)
+
+
+def test_hash_backend_selected():
+    engine = EmbeddingEngine(cache_path="")
+    assert engine.model_name.startswith("hash-")
+    assert len(engine.embed(["bonjour"])[0]) == engine.embedder.dimension
+
+
+def test_hash_embedder_is_deterministic():
+    texts = ["La photosynthèse des plantes", "Les équations différentielles"]
+    first = HashEmbedder(64).embed(texts)
+    assert HashEmbedder(64).embed(texts) == first
+    assert first[0] != first[1]
+    # Vecteurs normalisés (similarité cosinus = produit scalaire)
+    assert abs(np.linalg.norm(first[0]) - 1.0) < 1e-5
+
+
+def test_embed_deduplicates_and_batches():
+    embedder = CountingEmbedder()
+    engine = EmbeddingEngine(embedder=embedder, cache_path="")
+    engine.batch_size = 2
+    texts = ["a b", "c d", "a b", "e f", "g h", "c d"]
+
+    vectors = engine.embed(texts)
+
+    assert len(vectors) == len(texts)
+    assert vectors[0] == vectors[2] and vectors[1] == vectors[5]
+    # 4 textes distincts, lots de 2
+    assert embedder.batches == [["a b", "c d"], ["e f", "g h"]]
+    assert engine.stats["computed"] == 4
+    assert engine.stats["batches"] == 2
+
+
+def test_disk_cache_skips_recomputation(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    texts = ["premier extrait", "deuxième extrait"]
+    first = EmbeddingEngine(embedder=CountingEmbedder(), cache_path=path).embed(texts)
+
+    # Nouveau moteur (redémarrage): tout est lu depuis le disque
+    embedder = CountingEmbedder()
+    engine = EmbeddingEngine(embedder=embedder, cache_path=path)
+    assert np.allclose(engine.embed(texts), first)
+    assert embedder.batches == []
+    assert engine.stats["cache_hits"] == 2
+
+    # Seul le texte nouveau est calculé
+    engine.embed(texts + ["troisième extrait"])
+    assert embedder.batches == [["troisième extrait"]]
+    assert engine.cache.count() == 3
+
+
+def test_query_cache_normalizes_questions():
+    embedder = CountingEmbedder()
+    engine = EmbeddingEngine(embedder=embedder, cache_path="")
+    vector = engine.embed_query("Qu'est-ce que la mitose ?")
+    assert engine.embed_query("  qu'est-ce que   la MITOSE ? ") == vector
+    assert len(embedder.batches) == 1
+    assert engine.query_cache.stats["hits"] == 1
+
+
+def test_queries_never_written_to_disk_cache(tmp_path):
+    engine = EmbeddingEngine(embedder=CountingEmbedder(), cache_path=str(tmp_path / "embeddings.sqlite3"))
+    engine.embed(["extrait de cours"])
+    engine.embed_query("Question personnelle d'un étudiant ?")
+    # Seul l'extrait est persisté; la question reste dans le LRU en mémoire
+    assert engine.cache.count() == 1
+    assert engine.query_cache.get_stats()["size"] == 1
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_entries=2, ttl=60.0)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    assert cache.get("m", "a") == [1.0]  # "a" devient le plus récent
+    cache.put("m", "c", [3.0])
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") == [1.0]
+    assert cache.get("m", "c") == [3.0]
+    assert cache.stats["evictions"] == 1
+
+
+def test_query_cache_expires_entries():
+    cache = QueryEmbeddingCache(max_entries=10, ttl=60.0)
+    with mock.patch("app.services.embeddings.time.time", return_value=1000.0):
+        cache.put("m", "a", [1.0])
+    with mock.patch("app.services.embeddings.time.time", return_value=1059.0):
+        assert cache.get("m", "a") == [1.0]
+    with mock.patch("app.services.embeddings.time.time", return_value=1061.0):
+        assert cache.get("m", "a") is None
+    assert cache.stats["expired"] == 1
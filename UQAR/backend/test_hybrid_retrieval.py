@@ -0,0 +1,86 @@
+"""Recherche hybride sans Chroma: index lexical FTS5 et fusion des classements"""
+
+import pytest
+
+from app.services.hybrid_retrieval import _fuse, reciprocal_rank_fusion
+from app.services.lexical_index import LexicalIndex
+
+CHUNKS = {
+    "1_0": ("L'élève résout une équation différentielle du premier ordre.", "1"),
+    "1_1": ("La fonction numpy.argpartition trouve les k plus petits éléments.", "1"),
+    "2_0": ("La photosynthèse transforme la lumière en énergie chimique.", "2"),
+}
+
+
+@pytest.fixture
+def index(tmp_path) -> LexicalIndex:
+    index = LexicalIndex(path=str(tmp_path / "chunks.sqlite3"))
+    ids = list(CHUNKS)
+    index.add(
+        "section_1", ids, [CHUNKS[chunk_id][0] for chunk_id in ids],
+        [{"document_id": CHUNKS[chunk_id][1]} for chunk_id in ids]
+    )
+    return index
+
+
+def test_lexical_search_ignores_accents_and_case(index):
+    assert [hit["id"] for hit in index.search("section_1", "ELEVE equation", 5)] == ["1_0"]
+    assert [hit["id"] for hit in index.search("section_1", "photosynthese", 5)] == ["2_0"]
+    # Identifiant exact, manqué par les embeddings
+    hits = index.search("section_1", "argpartition", 5)
+    assert hits[0]["id"] == "1_1" and hits[0]["score"] > 0
+    assert hits[0]["metadata"] == {"document_id": "1"}
+
+
+def test_lexical_search_filters_and_stopwords(index):
+    assert index.search("section_1", "la lumière", 5, document_ids=["1"]) == []
+    assert [hit["id"] for hit in index.search("section_1", "la lumière", 5, document_ids=[2])] == ["2_0"]
+    # Question sans terme significatif, ou collection inconnue
+    assert index.search("section_1", "qu'est-ce que la", 5) == []
+    assert index.search("section_2", "photosynthèse", 5) == []
+
+
+def test_lexical_index_upsert_and_delete(index):
+    index.add("section_1", ["2_0"], ["La respiration cellulaire."], [{"document_id": "2"}])
+    assert index.search("section_1", "photosynthèse", 5) == []
+    assert [hit["id"] for hit in index.search("section_1", "respiration", 5)] == ["2_0"]
+
+    index.delete_document("section_1", 1)
+    assert index.search("section_1", "argpartition", 5) == []
+
+    assert not index.is_indexed("section_1")
+    index.backfill("section_1", ["1_0"], [CHUNKS["1_0"][0]], [{"document_id": "1"}])
+    assert index.is_indexed("section_1")
+    index.delete_collection("section_1")
+    assert not index.is_indexed("section_1")
+    assert index.search("section_1", "respiration", 5) == []
+
+
+def test_reciprocal_rank_fusion():
+    scores = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+    assert scores["a"] == 1 / 61
+    assert scores["c"] == 1 / 63 + 1 / 61
+    assert max(scores, key=scores.get) == "c"
+    assert set(scores) == {"a", "b", "c", "d"}
+
+
+def test_fuse_prefers_chunks_found_by_both_searches():
+    vector = [
+        {"id": "a", "text": "A", "metadata": {}, "distance": 0.1},
+        {"id": "b", "text": "B", "metadata": {}, "distance": 0.2},
+    ]
+    lexical = [
+        {"id": "b", "text": "B", "metadata": {}, "score": 3.0, "distance": None},
+        {"id": "c", "text": "C", "metadata": {}, "score": 2.0, "distance": None},
+    ]
+    fused = _fuse(vector, lexical, limit=2)
+    assert [chunk["id"] for chunk in fused] == ["b", "a"]
+    # Distance fournie par le côté vectoriel pour un extrait trouvé par les deux recherches
+    assert fused[0]["distance"] == 0.2
+    assert all("rrf_score" in chunk for chunk in fused)
+
+
+def test_fuse_without_lexical_keeps_vector_order():
+    vector = [{"id": str(i), "text": "", "metadata": {}, "distance": i / 10} for i in range(5)]
+    assert _fuse(vector, [], limit=3) == vector[:3]
+
@@ -0,0 +1,49 @@
+"""Parseur incrémental du tableau JSON des questions générées en flux"""
+
+from app.services.json_stream import IncrementalJSONArrayParser
+
+
+def _feed_by_chunks(parser: IncrementalJSONArrayParser, text: str, size: int):
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return items
+
+
+def test_elements_emitted_as_soon_as_closed():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"question": "Q1", "options": ["a", "b"]}, {"quest') == [
+        {"question": "Q1", "options": ["a", "b"]}
+    ]
+    assert parser.feed('ion": "Q2"}') == [{"question": "Q2"}]
+    assert not parser.finished
+    assert parser.feed("]") == []
+    assert parser.finished and parser.emitted == 2
+
+
+def test_preamble_and_trailing_text_ignored():
+    text = 'Voici les questions:\n```json\n[{"question": "Q1"}]\n```\nBonne étude! [{"x": 1}]'
+    parser = IncrementalJSONArrayParser()
+    assert _feed_by_chunks(parser, text, 3) == [{"question": "Q1"}]
+    assert parser.finished
+
+
+def test_brackets_and_escapes_inside_strings():
+    text = r'[{"question": "Que vaut f(x) = {x | x > 0} [ouvert] ?", "explanation": "Le \"}\" et \\ restent"}]'
+    expected = [{"question": "Que vaut f(x) = {x | x > 0} [ouvert] ?", "explanation": 'Le "}" et \\ restent'}]
+    # Même résultat quel que soit le découpage en tokens, y compris au milieu d'un échappement
+    for size in (1, 2, 5, len(text)):
+        assert _feed_by_chunks(IncrementalJSONArrayParser(), text, size) == expected
+
+
+def test_malformed_element_skipped():
+    parser = IncrementalJSONArrayParser()
+    items = parser.feed('[{"question": "Q1",}, {"question": "Q2"}]')
+    assert items == [{"question": "Q2"}]
+    assert parser.errors == 1 and parser.emitted == 1
+
+
+def test_nothing_before_array_start():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('{"question": "hors tableau"}') == []
+    assert not parser.started
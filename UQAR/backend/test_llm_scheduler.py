@@ -0,0 +1,94 @@
+"""Ordonnanceur LLM: priorités, équité entre sections et utilisateurs, concurrence bornée"""
+
+import asyncio
+
+import pytest
+
+from app.services.llm_scheduler import LLMPriority, LLMScheduler
+
+
+async def _served_order(scheduler: LLMScheduler, requests):
+    """Ordre de service de `requests` (nom, paramètres de slot) mis en file derrière une place occupée"""
+    order = []
+
+    async def run(name, slot):
+        async with scheduler.slot(**slot):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async with scheduler.slot():
+        tasks = [asyncio.create_task(run(name, slot)) for name, slot in requests]
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.asyncio
+async def test_higher_priority_served_first():
+    order = await _served_order(LLMScheduler(1), [
+        ("analytics", {"priority": LLMPriority.ANALYTICS}),
+        ("exercise", {"priority": LLMPriority.GENERATION}),
+        ("chat", {"priority": LLMPriority.INTERACTIVE}),
+    ])
+    assert order == ["chat", "exercise", "analytics"]
+
+
+@pytest.mark.asyncio
+async def test_round_robin_between_sections():
+    order = await _served_order(LLMScheduler(1), [
+        ("s1-a", {"section_id": 1, "user_id": 1}),
+        ("s1-b", {"section_id": 1, "user_id": 1}),
+        ("s1-c", {"section_id": 1, "user_id": 1}),
+        ("s2-a", {"section_id": 2, "user_id": 2}),
+    ])
+    assert order == ["s1-a", "s2-a", "s1-b", "s1-c"]
+
+
+@pytest.mark.asyncio
+async def test_round_robin_between_users_of_a_section():
+    order = await _served_order(LLMScheduler(1), [
+        ("u1-a", {"section_id": 1, "user_id": 1}),
+        ("u1-b", {"section_id": 1, "user_id": 1}),
+        ("u2-a", {"section_id": 1, "user_id": 2}),
+    ])
+    assert order == ["u1-a", "u2-a", "u1-b"]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    scheduler = LLMScheduler(2)
+    running = peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with scheduler.slot():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_releases_its_turn():
+    scheduler = LLMScheduler(1)
+    served = []
+
+    async def call(name):
+        async with scheduler.slot():
+            served.append(name)
+
+    async with scheduler.slot():
+        cancelled = asyncio.create_task(call("cancelled"))
+        waiting = asyncio.create_task(call("waiting"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+    await waiting
+    assert cancelled.cancelled()
+    assert served == ["waiting"]
+    assert scheduler.in_flight == 0
+    assert scheduler.get_stats()["queue_depth"] == 0
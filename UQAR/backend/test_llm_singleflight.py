@@ -0,0 +1,129 @@
+"""Coalescence des appels LLM identiques en vol (réponses complètes et flux)"""
+
+import asyncio
+
+import pytest
+
+from app.services.llm_singleflight import LLMSingleFlight, request_key
+
+
+def test_request_key_covers_model_prompt_and_options():
+    key = request_key("llama3", "Bonjour", {"temperature": 0.1, "num_ctx": 2048})
+    assert key == request_key("llama3", "Bonjour", {"num_ctx": 2048, "temperature": 0.1})
+    assert key != request_key("llama3", "Bonjour ", {"temperature": 0.1, "num_ctx": 2048})
+    assert key != request_key("mistral", "Bonjour", {"temperature": 0.1, "num_ctx": 2048})
+    assert key != request_key("llama3", "Bonjour", {"temperature": 0.2, "num_ctx": 2048})
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_share_one_upstream_call():
+    flight = LLMSingleFlight()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "réponse"
+
+    results = await asyncio.gather(*(flight.do("k", call) for _ in range(3)))
+    assert results == ["réponse"] * 3
+    assert calls == 1
+    assert flight.stats["leaders"] == 1 and flight.stats["coalesced"] == 2
+    assert flight.get_stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_upstream_call_cancelled_only_when_every_waiter_left():
+    flight = LLMSingleFlight()
+    started, upstream_cancelled = asyncio.Event(), asyncio.Event()
+
+    async def call():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            upstream_cancelled.set()
+            raise
+
+    first = asyncio.create_task(flight.do("k", call))
+    second = asyncio.create_task(flight.do("k", call))
+    await started.wait()
+
+    first.cancel()
+    await asyncio.sleep(0.01)
+    assert not upstream_cancelled.is_set()
+
+    second.cancel()
+    await asyncio.wait_for(upstream_cancelled.wait(), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_stream_subscribers_replay_the_leader_tokens():
+    flight = LLMSingleFlight()
+    produced = 0
+    release = asyncio.Event()
+
+    async def produce():
+        nonlocal produced
+        produced += 1
+        yield "Bon"
+        await release.wait()
+        yield "jour"
+
+    async def consume():
+        return [chunk async for chunk in flight.stream("k", produce)]
+
+    leader = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    # Arrivé après le premier token: il le reçoit quand même
+    follower = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert await leader == ["Bon", "jour"]
+    assert await follower == ["Bon", "jour"]
+    assert produced == 1
+    assert flight.stats["stream_leaders"] == 1 and flight.stats["stream_coalesced"] == 1
+    assert flight.get_stats()["streams_in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_error_reaches_every_subscriber():
+    flight = LLMSingleFlight()
+
+    async def produce():
+        yield "partiel"
+        await asyncio.sleep(0.01)
+        raise RuntimeError("connexion perdue")
+
+    async def consume(received):
+        async for chunk in flight.stream("k", produce):
+            received.append(chunk)
+
+    received = [[], []]
+    results = await asyncio.gather(*(consume(chunks) for chunks in received), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert received == [["partiel"], ["partiel"]]
+
+
+@pytest.mark.asyncio
+async def test_stream_cancelled_when_every_subscriber_left():
+    flight = LLMSingleFlight()
+    upstream_cancelled = asyncio.Event()
+
+    async def produce():
+        try:
+            yield "début"
+            await asyncio.sleep(10)
+            yield "fin"
+        except asyncio.CancelledError:
+            upstream_cancelled.set()
+            raise
+
+    async def consume_first_token():
+        async for _ in flight.stream("k", produce):
+            break
+
+    await asyncio.gather(consume_first_token(), consume_first_token())
+    await asyncio.wait_for(upstream_cancelled.wait(), timeout=1)
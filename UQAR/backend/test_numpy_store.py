@@ -0,0 +1,108 @@
+"""Magasin de vecteurs NumPy (repli de Chroma), persisté dans un dossier temporaire"""
+
+import numpy as np
+import pytest
+
+from app.services.numpy_store import NumpyCollection, NumpyVectorStore
+
+IDS = ["1_0", "1_1", "2_0", "2_1"]
+EMBEDDINGS = [[1.0, 0.0, 0.0], [0.8, 0.6, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 2.0]]
+METADATAS = [{"document_id": "1", "chunk_index": 0}, {"document_id": "1", "chunk_index": 1},
+             {"document_id": "2", "chunk_index": 0}, {"document_id": "2", "chunk_index": 1}]
+
+
+def _collection(directory, quantize: bool = False) -> NumpyCollection:
+    collection = NumpyCollection("section_1", str(directory / "section_1"), quantize)
+    collection.add(ids=IDS, documents=[f"texte {chunk_id}" for chunk_id in IDS], metadatas=METADATAS, embeddings=EMBEDDINGS)
+    return collection
+
+
+def test_query_exact_top_k(tmp_path):
+    collection = _collection(tmp_path)
+    result = collection.query(query_embeddings=[[1.0, 0.1, 0.0]], n_results=2)
+    assert result["ids"] == [["1_0", "1_1"]]
+    assert result["documents"] == [["texte 1_0", "texte 1_1"]]
+    assert result["metadatas"][0][0] == {"document_id": "1", "chunk_index": 0}
+    # Distance cosinus (1 - similarité), vecteurs normalisés à l'ajout
+    expected = 1 - np.dot([1.0, 0.1, 0.0], [1.0, 0.0, 0.0]) / np.linalg.norm([1.0, 0.1, 0.0])
+    assert abs(result["distances"][0][0] - expected) < 1e-6
+    assert result["distances"][0] == sorted(result["distances"][0])
+
+    # Plusieurs requêtes, n_results plus grand que la collection
+    result = collection.query(query_embeddings=[[0.0, 0.0, 1.0], [0.0, 1.0, 0.0]], n_results=10)
+    assert [ids[0] for ids in result["ids"]] == ["2_1", "2_0"]
+    assert all(len(ids) == 4 for ids in result["ids"])
+    assert collection.query(query_embeddings=[[1.0, 0.0, 0.0]], n_results=0)["ids"] == [[]]
+
+
+def test_query_where_filters(tmp_path):
+    collection = _collection(tmp_path)
+    query = [[1.0, 0.0, 0.0]]
+    assert collection.query(query_embeddings=query, n_results=5, where={"document_id": "2"})["ids"] == [["2_0", "2_1"]]
+    result = collection.query(query_embeddings=query, n_results=1, where={"document_id": {"$in": ["2"]}})
+    assert result["ids"] == [["2_0"]]
+    result = collection.query(
+        query_embeddings=query, n_results=5,
+        where={"$and": [{"document_id": {"$ne": "2"}}, {"chunk_index": 1}]}
+    )
+    assert result["ids"] == [["1_1"]]
+    assert collection.query(query_embeddings=query, n_results=5, where={"document_id": "3"})["ids"] == [[]]
+
+
+def test_upsert_delete_and_reload(tmp_path):
+    collection = _collection(tmp_path)
+    collection.add(ids=["1_0"], documents=["remplacé"], metadatas=[METADATAS[0]], embeddings=[[0.0, 1.0, 0.0]])
+    assert collection.count() == 4
+    assert collection.get(ids=["1_0"])["documents"] == ["remplacé"]
+
+    collection.delete(where={"document_id": "2"})
+    assert sorted(collection.get()["ids"]) == ["1_0", "1_1"]
+
+    # Relecture depuis le disque (redémarrage): même contenu, vecteurs en mmap
+    reloaded = NumpyCollection("section_1", str(tmp_path / "section_1"), quantize=False)
+    assert reloaded.get(include=["documents"]) == collection.get(include=["documents"])
+    assert reloaded.query(query_embeddings=[[0.0, 1.0, 0.0]], n_results=1)["ids"] == [["1_0"]]
+
+    reloaded.delete(ids=["1_0", "1_1"])
+    assert reloaded.count() == 0
+    assert reloaded.query(query_embeddings=[[1.0, 0.0, 0.0]], n_results=3)["ids"] == [[]]
+
+
+def test_quantized_matches_float(tmp_path):
+    exact = _collection(tmp_path / "float")
+    quantized = _collection(tmp_path / "int8", quantize=True)
+    assert np.load(tmp_path / "int8" / "section_1" / "embeddings.npy").dtype == np.int8
+
+    query = [[0.9, 0.4, 0.1]]
+    expected = exact.query(query_embeddings=query, n_results=4)
+    result = quantized.query(query_embeddings=query, n_results=4)
+    assert result["ids"] == expected["ids"]
+    assert np.allclose(result["distances"], expected["distances"], atol=0.02)
+
+    # Lignes déquantifiées de norme 1: chaque vecteur est à distance ~0 de lui-même
+    for chunk_id, embedding in zip(IDS, EMBEDDINGS):
+        result = quantized.query(query_embeddings=[embedding], n_results=1)
+        assert result["ids"] == [[chunk_id]]
+        assert abs(result["distances"][0][0]) < 1e-5
+
+    # Format conservé à la relecture, même si le paramètre a changé
+    reloaded = NumpyCollection("section_1", str(tmp_path / "int8" / "section_1"), quantize=False)
+    assert reloaded.quantize
+    assert reloaded.query(query_embeddings=query, n_results=4)["ids"] == expected["ids"]
+
+
+def test_store_collections(tmp_path):
+    store = NumpyVectorStore(str(tmp_path), quantize=False)
+    assert not store.has_collection("section_1")
+    with pytest.raises(ValueError):
+        store.get_collection("section_1")
+
+    store.add("section_1", ids=["a"], documents=["texte"], metadatas=[{"document_id": "1"}], embeddings=[[1.0, 0.0]])
+    assert store.has_collection("section_1")
+    assert NumpyVectorStore(str(tmp_path)).get_collection("section_1").count() == 1
+
+    store.delete("section_1", where={"document_id": "1"})
+    assert store.get_collection("section_1").count() == 0
+    store.delete_collection("section_1")
+    assert not store.has_collection("section_1")
+
@@ -0,0 +1,136 @@
+"""Disjoncteurs par nœud et choix du nœud Ollama (deux nœuds fictifs, voir conftest.py)"""
+
+from unittest import mock
+
+import httpx
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.ollama_router import OllamaRouter, OllamaUnavailableError
+
+
+def _clock(now: float):
+    return mock.patch("app.services.circuit_breaker.time.time", return_value=now)
+
+
+def _trip(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure("HTTP 503")
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("node", failure_threshold=3, reset_timeout=30.0)
+    breaker.record_failure("timeout")
+    breaker.record_failure("timeout")
+    breaker.record_success()  # remet le compte à zéro
+    breaker.record_failure("timeout")
+    breaker.record_failure("timeout")
+    assert breaker.state == CircuitBreaker.CLOSED
+    with _clock(1000.0):
+        breaker.record_failure("timeout")
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.available()
+    assert breaker.stats["opened"] == 1
+
+
+def test_breaker_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker("node", failure_threshold=1, reset_timeout=30.0)
+    with _clock(1000.0):
+        breaker.record_failure("HTTP 500")
+    with _clock(1029.0):
+        assert not breaker.available()
+    with _clock(1031.0):
+        assert breaker.available()
+        breaker.begin()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.available()  # un seul essai à la fois
+        breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.available()
+
+
+def test_breaker_failed_trial_reopens():
+    breaker = CircuitBreaker("node", failure_threshold=5, reset_timeout=30.0)
+    with _clock(1000.0):
+        _trip(breaker)
+    with _clock(1031.0):
+        breaker.begin()
+        breaker.record_failure("HTTP 500")  # un seul échec suffit en semi-ouvert
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.available()
+
+
+def test_breaker_abandoned_trial_frees_the_slot():
+    breaker = CircuitBreaker("node", failure_threshold=1, reset_timeout=30.0)
+    with _clock(1000.0):
+        breaker.record_failure("HTTP 500")
+    with _clock(1031.0):
+        breaker.begin()
+        breaker.record_abandoned()
+        assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.available()
+
+
+def test_router_picks_least_outstanding_backend():
+    router = OllamaRouter()
+    first, second = router.backends
+    first.outstanding = 2
+    assert router.select() is second
+    second.outstanding = 3
+    assert router.select() is first
+
+
+def test_router_keeps_sessions_on_their_backend():
+    router = OllamaRouter()
+    pinned = router.select("session:1")
+    pinned.outstanding = 10  # plus chargé, mais détient le cache KV de la conversation
+    assert router.select("session:1") is pinned
+    assert router.stats["sticky"] == 1
+
+
+def test_router_reroutes_when_pinned_backend_opens():
+    router = OllamaRouter()
+    pinned = router.select("session:1")
+    _trip(pinned.breaker)
+    assert router.select("session:1") is not pinned
+
+
+def test_router_fails_fast_when_every_breaker_is_open():
+    router = OllamaRouter()
+    for backend in router.backends:
+        _trip(backend.breaker)
+    assert not router.accepting()
+    with pytest.raises(OllamaUnavailableError):
+        router.select()
+    assert all(backend.breaker.stats["rejected"] == 1 for backend in router.backends)
+
+
+def test_router_alternate_excludes_primary():
+    router = OllamaRouter()
+    primary, other = router.backends
+    assert router.select_alternate(primary) is other
+    _trip(other.breaker)
+    assert router.select_alternate(primary) is None
+
+
+@pytest.mark.asyncio
+async def test_track_feeds_the_breaker():
+    router = OllamaRouter()
+    backend = router.backends[0]
+
+    async with router.track(backend) as call:
+        call.responded(503)
+    assert backend.breaker.consecutive_failures == 1 and backend.errors == 1
+
+    with pytest.raises(httpx.ConnectError):
+        async with router.track(backend):
+            raise httpx.ConnectError("refused")
+    assert backend.breaker.consecutive_failures == 2
+
+    # Réponse hors SLO: compté à part, ferme le nœud comme un échec
+    async with router.track(backend, slo=0.0) as call:
+        call.responded(200)
+    assert backend.breaker.stats["slo_breaches"] == 1
+
+    async with router.track(backend) as call:
+        call.responded(200)
+    assert backend.breaker.consecutive_failures == 0
+    assert backend.outstanding == 0 and backend.requests == 4
@@ -0,0 +1,64 @@
+"""Budget de tokens du prompt: troncature déterministe et remplissage du contexte par pertinence"""
+
+from app.services.token_budget import MIN_TRUNCATED_TOKENS, TRUNCATION_MARKER, TokenBudget
+
+# 3,5 caractères par token (TOKEN_ESTIMATOR_CHARS_PER_TOKEN): 350 caractères = 100 tokens
+TEXT_100 = "x" * 350
+
+
+def test_truncate_keeps_short_text():
+    budget = TokenBudget()
+    assert budget.truncate("Une phrase courte.", 100) == "Une phrase courte."
+
+
+def test_truncate_cuts_on_sentence_boundary():
+    budget = TokenBudget()
+    text = " ".join(f"Phrase numéro {i} du cours." for i in range(100))
+    truncated = budget.truncate(text, 50)
+    assert truncated.endswith("du cours." + TRUNCATION_MARKER)
+    assert text.startswith(truncated[:-len(TRUNCATION_MARKER)])
+    assert budget.estimate(truncated) <= 50
+    assert budget.truncate(text, 50) == truncated
+
+
+def test_truncate_falls_back_to_space():
+    budget = TokenBudget()
+    text = " ".join(["mot"] * 200)
+    truncated = budget.truncate(text, 20)
+    assert truncated.endswith("mot" + TRUNCATION_MARKER)
+    assert budget.estimate(truncated) <= 20
+
+
+def test_pack_keeps_everything_within_budget():
+    budget = TokenBudget()
+    packed = budget.pack(["a" * 35, "b" * 70], budget=100, item_overhead=4)
+    assert packed.texts == ["a" * 35, "b" * 70]
+    assert packed.tokens == (10 + 4) + (20 + 4)
+    assert packed.dropped == 0 and packed.truncated == 0
+
+
+def test_pack_follows_priority_but_keeps_original_order():
+    budget = TokenBudget()
+    texts = ["premier " + TEXT_100, "deuxième " + TEXT_100, "troisième " + TEXT_100]
+    # Le troisième extrait est le plus pertinent, puis le premier; le deuxième ne tient plus
+    packed = budget.pack(texts, budget=2 * 110, priority=[2, 0, 1], item_overhead=4)
+    assert packed.texts == [texts[0], texts[2]]
+    assert packed.dropped == 1 and packed.truncated == 0
+    assert packed.tokens <= packed.budget
+
+
+def test_pack_truncates_first_overflowing_item():
+    budget = TokenBudget()
+    long_text = " ".join(["contenu"] * 400)
+    packed = budget.pack([TEXT_100, long_text, TEXT_100], budget=104 + 4 + 2 * MIN_TRUNCATED_TOKENS)
+    assert packed.truncated == 1 and packed.dropped == 1
+    assert packed.texts[0] == TEXT_100
+    assert packed.texts[1].endswith(TRUNCATION_MARKER)
+    assert packed.tokens <= packed.budget
+
+
+def test_pack_drops_when_remainder_too_small_to_truncate():
+    budget = TokenBudget()
+    packed = budget.pack([TEXT_100, TEXT_100], budget=104 + MIN_TRUNCATED_TOKENS)
+    assert packed.texts == [TEXT_100]
+    assert packed.truncated == 0 and packed.dropped == 1